@@ -0,0 +1,108 @@
+import time
+import threading
+from collections import deque
+
+from frame_pipeline import LatestWinsStage
+
+# setpoint commands to the actuator computers. only the newest command is applied: one queued while another is being
+# written and uploaded replaces the one that was waiting. only the devices whose parameter file differs from the last one
+# they acknowledged are written and uploaded, and every command keeps the times it was queued, applied and acknowledged
+class ActuatorCommandQueue:
+    def __init__(self, apply_function, devices=('mirror', 'dazzler'), history_maxlen=10000, timer=None):
+        # apply_function(command, devices) writes and uploads the parameter files of devices (the command holds the text
+        # of every device by name), it returns the time every device acknowledged them (None when it did not)
+        self.apply_function = apply_function
+        self.devices = tuple(devices)
+        self.timer = timer
+
+        # parameter file text every device acknowledged last, and the devices that did not acknowledge the last command
+        self.applied = {}
+        self.failed_devices = []
+        self.lock = threading.Lock()
+
+        # one dict per applied command: generation, setpoint, the devices written, queued/applied/acknowledged times
+        self.history = deque(maxlen=history_maxlen)
+        self.commands = 0
+        self.skipped_writes = 0
+        self.failed_writes = 0
+        self.coalesced = 0
+
+        self.stage = None
+
+    def start(self):
+        self.stage = LatestWinsStage('actuation', self.apply)
+
+    def close(self):
+        # the pending command is still applied
+        if self.stage is not None:
+            self.stage.close()
+            self.coalesced += self.stage.replaced
+            self.stage = None
+
+    def put(self, command):
+        command = dict(command, queued=time.time())
+        if self.stage is None:
+            # not started, applied right away on the calling thread
+            self.apply(command)
+        else:
+            self.stage.put(command)
+
+    def mark_applied(self, command):
+        # the actuators already hold these values (the parameter files the run started from)
+        with self.lock:
+            self.applied.update({device: command[device] for device in self.devices})
+
+    def apply(self, command):
+        with self.lock:
+            changed = [device for device in self.devices if command[device] != self.applied.get(device)]
+        queued = command.get('queued', time.time())
+        applied = time.time()
+        try:
+            acknowledged = self.apply_function(command, changed)
+        except Exception as e:
+            # a failed file write or upload reaches none of the devices, the command is sent again (needs_retry)
+            print(f"Error applying setpoint generation {command['generation']}: {e}")
+            acknowledged = {}
+
+        with self.lock:
+            for device in changed:
+                # a device that did not acknowledge is written again with the next command
+                if acknowledged.get(device) is not None:
+                    self.applied[device] = command[device]
+                else:
+                    self.failed_writes += 1
+            self.failed_devices = [device for device in changed if acknowledged.get(device) is None]
+            self.commands += 1
+            self.skipped_writes += len(self.devices) - len(changed)
+
+        # a command without changes is acknowledged when it is applied, the actuators already hold it
+        ack_times = [acknowledged.get(device) for device in changed]
+        acked = applied
+        if changed:
+            acked = max(ack_times) if None not in ack_times else None
+        self.history.append({
+            'generation': command['generation'],
+            'setpoint': command['setpoint'],
+            'devices': changed,
+            'queued': queued,
+            'applied': applied,
+            'acknowledged': acked,
+        })
+        if self.timer is not None and acked is not None:
+            self.timer.record('actuation_ack', acked - queued)
+
+    def needs_retry(self):
+        # the last command did not reach every device, it has to be sent again even when the setpoint did not change
+        with self.lock:
+            return bool(self.failed_devices)
+
+    def depth(self):
+        return self.stage.depth() if self.stage is not None else 0
+
+    def coalesced_commands(self):
+        # commands replaced by a newer one before they were applied
+        return self.coalesced + (self.stage.replaced if self.stage is not None else 0)
+
+    def wait(self):
+        if self.stage is not None:
+            self.stage.wait()
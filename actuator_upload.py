@@ -0,0 +1,125 @@
+import io
+import time
+import ftplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# one persistent FTP session to an actuator computer (deformable mirror or Dazzler)
+class FTPConnection:
+    def __init__(self, name, host, user, password, port=21, timeout=5):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+
+        self.ftp = None
+        self.lock = threading.Lock()
+        self.last_activity = 0.0
+
+    def connect(self):
+        ftp = ftplib.FTP()
+        ftp.connect(host=self.host, port=self.port, timeout=self.timeout)
+        ftp.login(user=self.user, passwd=self.password)
+        self.ftp = ftp
+        self.last_activity = time.monotonic()
+
+    def close(self):
+        if self.ftp is None:
+            return
+        try:
+            self.ftp.quit()
+        except (*ftplib.all_errors, EOFError):
+            self.ftp.close()
+        self.ftp = None
+
+    def store(self, file_name, payload, retries=1):
+        with self.lock:
+            for attempt in range(retries + 1):
+                try:
+                    if self.ftp is None:
+                        self.connect()
+
+                    # stream the payload straight from memory, no temp file
+                    self.ftp.storbinary(f'STOR {file_name}', io.BytesIO(payload))
+                    self.last_activity = time.monotonic()
+                    return
+                except (*ftplib.all_errors, EOFError):
+                    # the session was dropped, reconnect and try again
+                    self.close()
+                    if attempt == retries:
+                        raise
+
+    def keepalive(self, interval):
+        with self.lock:
+            if self.ftp is not None and time.monotonic() - self.last_activity < interval:
+                return
+
+            try:
+                if self.ftp is None:
+                    self.connect()
+                else:
+                    self.ftp.voidcmd('NOOP')
+                    self.last_activity = time.monotonic()
+            except (*ftplib.all_errors, EOFError) as e:
+                # reconnect right away so the next upload does not pay for the login
+                self.close()
+                try:
+                    self.connect()
+                except (*ftplib.all_errors, EOFError):
+                    print(f"Keepalive to {self.name} FTP failed: {e}")
+
+# uploads the parameter files to all actuator computers in parallel over persistent sessions
+class ActuatorUploader:
+    def __init__(self, connections, keepalive_interval=30):
+        self.connections = {connection.name: connection for connection in connections}
+        self.executor = ThreadPoolExecutor(max_workers=max(len(self.connections), 1), thread_name_prefix='ftp_upload')
+
+        # time every computer last acknowledged an upload (its STOR completed)
+        self.ack_times = {}
+
+        # keep the idle sessions alive (and reconnect dropped ones) in the background
+        self.keepalive_interval = keepalive_interval
+        self.stop_event = threading.Event()
+        self.keepalive_thread = None
+        if keepalive_interval:
+            self.keepalive_thread = threading.Thread(target=self.keepalive_loop, daemon=True)
+            self.keepalive_thread.start()
+
+    def keepalive_loop(self):
+        while not self.stop_event.wait(self.keepalive_interval / 2):
+            for connection in self.connections.values():
+                connection.keepalive(self.keepalive_interval)
+
+    def upload(self, payloads):
+        # payloads maps a connection name to (file_name, bytes), every device is pushed at the same time
+        futures = {
+            name: self.executor.submit(self.store, name, file_name, payload)
+            for name, (file_name, payload) in payloads.items()
+        }
+
+        results = {}
+        for name, future in futures.items():
+            file_name = payloads[name][0]
+            try:
+                self.ack_times[name] = future.result()
+                results[name] = True
+                print(f"Uploaded to {name} FTP: {file_name}")
+            except (*ftplib.all_errors, EOFError) as e:
+                results[name] = False
+                print(f"Error in FTP upload to {name}: {e}")
+        return results
+
+    def store(self, name, file_name, payload):
+        self.connections[name].store(file_name, payload)
+        return time.time()
+
+    def close(self):
+        self.stop_event.set()
+        if self.keepalive_thread is not None:
+            self.keepalive_thread.join()
+        self.executor.shutdown(wait=True)
+        for connection in self.connections.values():
+            with connection.lock:
+                connection.close()
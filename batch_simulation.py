@@ -0,0 +1,162 @@
+import sys
+import warnings
+import itertools
+import argparse
+
+import numpy as np
+
+from optimizer_core import BetatronOptimizer
+from benchmark_optimizer import INITIAL_SETPOINT, default_landscapes
+
+# the local bounds the optimizer derives from its initial setpoint
+def optimizer_bounds(initial_setpoint):
+    optimizer = BetatronOptimizer([int(initial_setpoint[0])], {0: int(initial_setpoint[1]), 1: int(initial_setpoint[2])})
+    lower_bounds = np.array([optimizer.FOCUS_LOWER_BOUND, optimizer.SECOND_DISPERSION_LOWER_BOUND, optimizer.THIRD_DISPERSION_LOWER_BOUND], dtype=float)
+    upper_bounds = np.array([optimizer.FOCUS_UPPER_BOUND, optimizer.SECOND_DISPERSION_UPPER_BOUND, optimizer.THIRD_DISPERSION_UPPER_BOUND], dtype=float)
+    return lower_bounds, upper_bounds
+
+# the gradient mode update rule of BetatronOptimizer (initial_optimize + optimize_count) for many independent runs at once,
+# every array has one row per run so the runs advance one image group at a time in lockstep
+def simulate_gradient_ascent(landscape, learning_rates, image_group, count_change_tolerance, initial_setpoint=INITIAL_SETPOINT, max_groups=200, average_group=True, target_fraction=0.9, random_direction=None, seed=None):
+    rng = np.random.default_rng(seed)
+    learning_rates = np.asarray(learning_rates, dtype=float)
+    runs = len(learning_rates)
+    image_group = np.broadcast_to(np.asarray(image_group), (runs,))
+    count_change_tolerance = np.broadcast_to(np.asarray(count_change_tolerance, dtype=float), (runs,))
+    lower_bounds, upper_bounds = optimizer_bounds(initial_setpoint)
+
+    # the application takes the group count from the mean of the group, without average_group from its last frame (as it did before)
+    noise_scale = 1.0 / np.sqrt(image_group) if average_group else np.ones(runs)
+
+    # history[-1] and history[-2] of every parameter, history[-2] only moves when the parameter is updated (as in the app)
+    current = np.tile(np.asarray(initial_setpoint, dtype=float), (runs, 1))
+
+    converged = np.zeros(runs, dtype=bool)
+    groups_to_convergence = np.full(runs, np.nan)
+    count_at_convergence = np.full(runs, np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # first image group: measure the initial setpoint and take a random +1/-1 step in every parameter
+        last_count = landscape.frame_count(current, image_group, noise_scale)
+        if random_direction is None:
+            random_direction = rng.choice([-1, 1], size=(runs, 3))
+        previous = current
+        current = np.rint(np.clip(current + random_direction, lower_bounds, upper_bounds))
+
+        for group in range(2, max_groups + 1):
+            count = landscape.frame_count(current, group * image_group, noise_scale)
+
+            # the same count difference divided by each parameter's own last step
+            derivatives = (count - last_count)[:, None] / (current - previous)
+            steps = learning_rates * derivatives
+
+            # only parameters whose step is at least one unit are moved (rounded and clipped)
+            move = np.abs(steps) > 1
+            new_values = np.rint(np.clip(current + steps, lower_bounds, upper_bounds))
+            previous = np.where(move, current, previous)
+            current = np.where(move, new_values, current)
+
+            # same two convergence checks as optimize_count
+            newly_converged = np.all(np.abs(steps) < 1, axis=1)
+            if group > 2:
+                newly_converged |= np.abs(count - last_count) <= count_change_tolerance
+            newly_converged &= ~converged
+
+            groups_to_convergence[newly_converged] = group
+            count_at_convergence[newly_converged] = landscape.true_count(current[newly_converged], group * image_group[newly_converged])
+            converged |= newly_converged
+            last_count = count
+
+    low, high = landscape.count_range()
+    target = low + target_fraction * (high - low)
+    final_count = landscape.true_count(current, max_groups * image_group)
+
+    return {
+        'converged': converged,
+        'shots_to_convergence': groups_to_convergence * image_group,
+        'converged_at_peak': converged & (count_at_convergence >= target),
+        'count_at_convergence': count_at_convergence,
+        'final_setpoint': current.astype(int),
+        'final_count': final_count,
+        'reached_target': final_count >= target,
+    }
+
+# every combination of the hyperparameters, repeated with different random directions and noise, in one batch
+def sweep(landscape, focus_learning_rates, second_dispersion_learning_rates, third_dispersion_learning_rates, image_groups, count_change_tolerances, repeats=100, **simulation_options):
+    axes = [focus_learning_rates, second_dispersion_learning_rates, third_dispersion_learning_rates, image_groups, count_change_tolerances]
+    grid = np.array(list(itertools.product(*axes)), dtype=float)
+    grid_shape = tuple(len(axis) for axis in axes)
+
+    # one run per grid point and repeat
+    runs = np.repeat(grid, repeats, axis=0)
+    result = simulate_gradient_ascent(
+        landscape,
+        learning_rates=runs[:, :3],
+        image_group=runs[:, 3].astype(int),
+        count_change_tolerance=runs[:, 4],
+        **simulation_options,
+    )
+
+    def per_grid_point(values):
+        return values.reshape(len(grid), repeats)
+
+    # shots are only counted for runs that converged at the peak, grid points without any are left as nan
+    shots = per_grid_point(np.where(result['converged_at_peak'], result['shots_to_convergence'], np.nan))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median_shots = np.nanmedian(shots, axis=1)
+
+    return {
+        'axes': axes,
+        'convergence_rate': per_grid_point(result['converged']).mean(axis=1).reshape(grid_shape),
+        'success_rate': per_grid_point(result['converged_at_peak']).mean(axis=1).reshape(grid_shape),
+        'median_shots': median_shots.reshape(grid_shape),
+        'final_count': per_grid_point(result['final_count']).mean(axis=1).reshape(grid_shape),
+    }
+
+def print_best(maps, count=10):
+    axes = maps['axes']
+    success_rate = maps['success_rate'].ravel()
+    median_shots = np.nan_to_num(maps['median_shots'].ravel(), nan=np.inf)
+
+    # most reliable first, fewest shots second
+    order = np.lexsort((median_shots, -success_rate))[:count]
+    print(f"{'focus lr':>9} {'order2 lr':>10} {'order3 lr':>10} {'group':>6} {'tolerance':>10} {'converged':>10} {'at peak':>8} {'shots':>7} {'final':>9}")
+    for flat_index in order:
+        index = np.unravel_index(flat_index, maps['success_rate'].shape)
+        values = [axis[i] for axis, i in zip(axes, index)]
+        print(
+            f"{values[0]:>9g} {values[1]:>10g} {values[2]:>10g} {int(values[3]):>6d} {values[4]:>10g} "
+            f"{maps['convergence_rate'][index]:>10.0%} {maps['success_rate'][index]:>8.0%} {maps['median_shots'][index]:>7.0f} {maps['final_count'][index]:>9.1f}"
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Vectorized simulation of the gradient mode over a grid of hyperparameters')
+    parser.add_argument('--landscape', default='noisy', choices=list(default_landscapes()))
+    parser.add_argument('--focus-learning-rates', nargs='+', type=float, default=[0.01, 0.03, 0.1, 0.3, 1.0])
+    parser.add_argument('--second-dispersion-learning-rates', nargs='+', type=float, default=[0.1, 1.0, 10.0, 100.0])
+    parser.add_argument('--third-dispersion-learning-rates', nargs='+', type=float, default=[0.1, 1.0, 10.0, 100.0, 1000.0])
+    parser.add_argument('--image-groups', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--tolerances', nargs='+', type=float, default=[1, 10, 50])
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--max-groups', type=int, default=200)
+    parser.add_argument('--last-frame', action='store_true', help='take the count of the image group from its last frame instead of its mean')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--npz', help='save the maps to this file')
+    args = parser.parse_args(argv)
+
+    maps = sweep(
+        default_landscapes(args.seed)[args.landscape],
+        args.focus_learning_rates, args.second_dispersion_learning_rates, args.third_dispersion_learning_rates,
+        args.image_groups, args.tolerances, repeats=args.repeats,
+        max_groups=args.max_groups, average_group=not args.last_frame, seed=args.seed,
+    )
+    print_best(maps)
+
+    if args.npz:
+        np.savez(args.npz, **{name: value for name, value in maps.items() if name != 'axes'},
+                 focus_learning_rates=args.focus_learning_rates, second_dispersion_learning_rates=args.second_dispersion_learning_rates,
+                 third_dispersion_learning_rates=args.third_dispersion_learning_rates, image_groups=args.image_groups, tolerances=args.tolerances)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import numpy as np
+
+# vectorized erf (Abramowitz and Stegun 7.1.26, error below 1.5e-7), enough for the expected improvement
+def erf(x):
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    polynomial = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - polynomial * np.exp(-x * x))
+
+# bayesian optimization over the bounded integer box, gaussian process surrogate with an incrementally updated cholesky factor
+class GaussianProcessOptimizer:
+    def __init__(self, lower_bounds, upper_bounds, length_scale=0.2, signal_std=1.0, noise_std=0.1, acquisition='ei', kappa=2.0, xi=0.01, candidate_count=1000, local_fraction=0.5, seed=None):
+        self.lower_bounds = np.asarray(lower_bounds, dtype=int)
+        self.upper_bounds = np.asarray(upper_bounds, dtype=int)
+        self.dimension = len(self.lower_bounds)
+        self.span = np.maximum(self.upper_bounds - self.lower_bounds, 1).astype(float)
+
+        # squared exponential kernel on the box scaled to [0, 1], the counts are standardized before fitting
+        self.length_scale = np.broadcast_to(np.asarray(length_scale, dtype=float), (self.dimension,))
+        self.signal_variance = signal_std ** 2
+        self.noise_variance = noise_std ** 2
+
+        # 'ei' (expected improvement) or 'ucb' (upper confidence bound)
+        self.acquisition = acquisition
+        self.kappa = kappa
+        self.xi = xi
+
+        # candidates are scored on random integer setpoints, part of them spread over the whole box and part near the best measurement
+        self.candidate_count = candidate_count
+        self.local_fraction = local_fraction
+        self.rng = np.random.default_rng(seed)
+
+        # observations and the inverse of the cholesky factor of the kernel matrix, grown by doubling
+        self.n = 0
+        self.capacity = 16
+        self.X = np.empty((self.capacity, self.dimension))
+        self.setpoints = np.empty((self.capacity, self.dimension), dtype=int)
+        self.y = np.empty(self.capacity)
+        self.L_inv = np.zeros((self.capacity, self.capacity))
+
+    def normalize(self, setpoints):
+        return (np.asarray(setpoints, dtype=float) - self.lower_bounds) / self.span
+
+    def kernel(self, a, b):
+        # squared distances through |a|^2 + |b|^2 - 2 a.b, one matrix product instead of an (n, m, dimension) difference array
+        a = a / self.length_scale
+        b = b / self.length_scale
+        squared_distance = np.sum(a * a, axis=1)[:, None] + np.sum(b * b, axis=1)[None, :] - 2 * a @ b.T
+        return self.signal_variance * np.exp(-0.5 * np.maximum(squared_distance, 0.0))
+
+    def grow(self):
+        self.capacity *= 2
+        for name in ('X', 'setpoints', 'y'):
+            old = getattr(self, name)
+            new = np.empty((self.capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+        L_inv = np.zeros((self.capacity, self.capacity))
+        L_inv[:self.n, :self.n] = self.L_inv[:self.n, :self.n]
+        self.L_inv = L_inv
+
+    def tell(self, setpoint, count):
+        if self.n == self.capacity:
+            self.grow()
+
+        x = self.normalize(setpoint)
+        n = self.n
+
+        # extend the factor by one row: L_new = [[L, 0], [l^T, d]] with l = L^-1 k and d^2 = k(x, x) + noise - l^T l, O(n^2) per observation
+        k = self.kernel(self.X[:n], x[None, :])[:, 0]
+        l = self.L_inv[:n, :n] @ k
+        d = np.sqrt(max(self.signal_variance + self.noise_variance - l @ l, 1e-12))
+
+        # and its inverse: [[L^-1, 0], [-l^T L^-1 / d, 1 / d]]
+        self.L_inv[n, :n] = -(l @ self.L_inv[:n, :n]) / d
+        self.L_inv[n, n] = 1.0 / d
+
+        self.X[n] = x
+        self.setpoints[n] = np.rint(setpoint).astype(int)
+        self.y[n] = count
+        self.n += 1
+
+    def fit(self, setpoints, counts):
+        # every measurement at once in place of a tell each (a resumed run): one cholesky factorization and triangular inverse
+        # in lapack instead of a factor update per measurement in python
+        setpoints = np.asarray(setpoints)
+        n = len(setpoints)
+        while self.capacity < n:
+            self.capacity *= 2
+
+        self.X = np.empty((self.capacity, self.dimension))
+        self.X[:n] = self.normalize(setpoints)
+        self.setpoints = np.empty((self.capacity, self.dimension), dtype=int)
+        self.setpoints[:n] = np.rint(setpoints).astype(int)
+        self.y = np.empty(self.capacity)
+        self.y[:n] = counts
+
+        K = self.kernel(self.X[:n], self.X[:n]) + self.noise_variance * np.eye(n)
+        self.L_inv = np.zeros((self.capacity, self.capacity))
+        self.L_inv[:n, :n] = np.linalg.solve(np.linalg.cholesky(K), np.eye(n))
+        self.n = n
+
+    def standardized_counts(self):
+        y = self.y[:self.n]
+        y_std = y.std()
+        return (y - y.mean()) / (y_std if y_std > 0 else 1.0)
+
+    def predict(self, setpoints):
+        # posterior mean and standard deviation (in standardized counts) at the setpoints
+        L_inv = self.L_inv[:self.n, :self.n]
+        y = self.standardized_counts()
+        alpha = L_inv.T @ (L_inv @ y)
+
+        K_star = self.kernel(self.X[:self.n], self.normalize(setpoints))
+        mean = K_star.T @ alpha
+        v = L_inv @ K_star
+        variance = np.maximum(self.signal_variance - np.sum(v * v, axis=0), 1e-12)
+        return mean, np.sqrt(variance)
+
+    def acquisition_value(self, mean, std):
+        if self.acquisition == 'ucb':
+            return mean + self.kappa * std
+
+        # expected improvement over the best standardized count measured so far
+        improvement = mean - self.standardized_counts().max() - self.xi
+        z = improvement / std
+        cdf = 0.5 * (1.0 + erf(z / np.sqrt(2.0)))
+        pdf = np.exp(-0.5 * z * z) / np.sqrt(2.0 * np.pi)
+        return improvement * cdf + std * pdf
+
+    def candidates(self):
+        global_count = int(self.candidate_count * (1 - self.local_fraction))
+        global_candidates = self.rng.integers(self.lower_bounds, self.upper_bounds + 1, size=(global_count, self.dimension))
+
+        # gaussian cloud around the best measurement, a tenth of the box wide
+        local_count = self.candidate_count - global_count
+        best = self.best_setpoint()
+        local_candidates = best + self.rng.normal(0, 0.1, size=(local_count, self.dimension)) * self.span
+        local_candidates = np.rint(np.clip(local_candidates, self.lower_bounds, self.upper_bounds)).astype(int)
+
+        return np.vstack((global_candidates, local_candidates))
+
+    def ask(self):
+        # without a measurement start in the middle of the box
+        if self.n == 0:
+            return (self.lower_bounds + self.upper_bounds) // 2
+
+        candidates = self.candidates()
+        mean, std = self.predict(candidates)
+        return candidates[np.argmax(self.acquisition_value(mean, std))]
+
+    def best_setpoint(self):
+        return self.setpoints[np.argmax(self.y[:self.n])]
+
+    def best_count(self):
+        return self.y[:self.n].max()
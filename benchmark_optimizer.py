@@ -0,0 +1,278 @@
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import contextlib
+
+import numpy as np
+
+from optimizer_core import BetatronOptimizer
+
+# starting setpoint of the benchmarks (focus, order2, order3), the same values the lab files start from
+INITIAL_SETPOINT = (-150, 36100, -27000)
+
+# scale of one "unit" of each parameter, used to compare setpoints across parameters
+PARAMETER_SCALES = np.array([20.0, 500.0, 2000.0])
+
+# per parameter values given for focus, order2 and order3 over dimension parameters (every mirror actuator takes the focus value)
+def over_parameters(values, dimension):
+    values = np.asarray(values)
+    return np.concatenate(([values[0]] * (dimension - 2), values[-2:]))
+
+# optimizer settings compared by default, every entry is set as an attribute on BetatronOptimizer
+OPTIMIZER_MODES = {
+    'gradient': {'optimizer_mode': 'gradient'},
+    # the count changes by orders of magnitude less per order2/order3 step than per focus step, the rates follow the peak widths
+    'gradient_least_squares': {'optimizer_mode': 'gradient', 'gradient_estimator': 'least_squares', 'learning_rates': np.array([0.03, 15.0, 270.0])},
+    'spsa': {'optimizer_mode': 'spsa'},
+    'bayesian': {'optimizer_mode': 'bayesian'},
+}
+
+# gaussian peak on a flat background, count = background + height * exp(-r^2 / 2) with r the (coupled) distance to the peak in widths
+class SyntheticLandscape:
+    def __init__(self, peak, widths, height=1000.0, background=1000.0, noise_std=0.0, relative_noise=0.0, coupling=0.0, plateau_step=0.0, drift=None, misfire_rate=0.0, seed=None):
+        self.peak = np.asarray(peak, dtype=float)
+        self.widths = np.asarray(widths, dtype=float)
+        self.height = height
+        self.background = background
+
+        # additive noise in counts plus noise proportional to the count (shot to shot laser fluctuations)
+        self.noise_std = noise_std
+        self.relative_noise = relative_noise
+
+        # off diagonal terms couple the parameters (the peak is a tilted ellipsoid instead of axis aligned)
+        dimension = len(self.peak)
+        self.coupling = np.eye(dimension) + coupling * (np.ones((dimension, dimension)) - np.eye(dimension))
+
+        # counts are floored to multiples of plateau_step, which leaves flat steps without any gradient
+        self.plateau_step = plateau_step
+
+        # the peak moves by drift (per parameter) every shot
+        self.drift = np.zeros(dimension) if drift is None else np.asarray(drift, dtype=float)
+
+        # fraction of the shots where the laser misfired, their frames only see the background
+        self.misfire_rate = misfire_rate
+
+        self.rng = np.random.default_rng(seed)
+
+    def true_count(self, setpoint, shot=0):
+        # works on one setpoint or on a (runs, parameters) array of setpoints with one shot number per run
+        shot = np.asarray(shot, dtype=float)[..., None]
+        distance = (np.asarray(setpoint, dtype=float) - self.peak - self.drift * shot) / self.widths
+        count = self.background + self.height * np.exp(-0.5 * np.einsum('...i,ij,...j->...', distance, self.coupling, distance))
+        if self.plateau_step:
+            count = np.floor(count / self.plateau_step) * self.plateau_step
+        return count if np.ndim(count) else float(count)
+
+    def frame_count(self, setpoint, shot, noise_scale=1.0):
+        # noise_scale < 1 stands for the mean of several frames
+        count = self.true_count(setpoint, shot)
+        count = count + self.rng.normal(0, 1, np.shape(count)) * (self.noise_std + self.relative_noise * count) * noise_scale
+        if self.misfire_rate:
+            count = np.where(self.rng.random(np.shape(count)) < self.misfire_rate, self.background, count)
+            count = count if np.ndim(count) else float(count)
+        return count
+
+    def count_range(self):
+        return self.background, self.background + self.height
+
+# landscape built from a recorded run: the parameter log written by the app and optionally its images. a row is the time,
+# the image group, one setpoint column per parameter (focus, order2, order3 or every actuator), the group count and the images
+class ReplayLandscape:
+    def __init__(self, log_path, reduce_images=False, seed=None):
+        self.rng = np.random.default_rng(seed)
+        setpoints = []
+        self.frame_counts = []
+
+        with open(log_path, newline='') as file:
+            for row in csv.reader(file):
+                if not row:
+                    continue
+                setpoint, mean_count, image_paths = row[2:-2], row[-2], row[-1]
+                setpoints.append([int(value) for value in setpoint])
+
+                # re-reduce the recorded frames (shot to shot spread) or fall back to the logged group mean
+                image_paths = [path for path in image_paths.split(';') if path]
+                if reduce_images and image_paths and all(os.path.exists(path) for path in image_paths):
+                    from frame_processing import calc_count_per_image
+                    self.frame_counts.append(np.array([calc_count_per_image(path) for path in image_paths]))
+                else:
+                    self.frame_counts.append(np.array([float(mean_count)]))
+
+        self.setpoints = np.array(setpoints, dtype=float)
+        self.scales = over_parameters(PARAMETER_SCALES, self.setpoints.shape[1])
+        self.mean_counts = np.array([counts.mean() for counts in self.frame_counts])
+        self.initial_setpoint = tuple(int(value) for value in self.setpoints[0])
+
+    def nearest(self, setpoint):
+        distance = np.sum(((self.setpoints - np.asarray(setpoint, dtype=float)) / self.scales) ** 2, axis=1)
+        return int(np.argmin(distance))
+
+    def true_count(self, setpoint, shot=0):
+        return float(self.mean_counts[self.nearest(setpoint)])
+
+    def frame_count(self, setpoint, shot):
+        # a recorded frame from the closest measured setpoint
+        return float(self.rng.choice(self.frame_counts[self.nearest(setpoint)]))
+
+    def count_range(self):
+        return self.mean_counts.min(), self.mean_counts.max()
+
+def default_landscapes(seed=None):
+    peak = (-140, 36300, -26200)
+    widths = (8, 200, 800)
+    return {
+        'quadratic': SyntheticLandscape(peak, widths, seed=seed),
+        'noisy': SyntheticLandscape(peak, widths, noise_std=20, relative_noise=0.05, seed=seed),
+        'plateau': SyntheticLandscape(peak, (4, 100, 400), plateau_step=50, noise_std=5, seed=seed),
+        'coupled': SyntheticLandscape(peak, widths, coupling=0.45, noise_std=10, seed=seed),
+        'drift': SyntheticLandscape(peak, widths, noise_std=10, drift=(0.01, 0.2, 0.5), seed=seed),
+        'misfire': SyntheticLandscape(peak, widths, noise_std=10, misfire_rate=0.05, seed=seed),
+    }
+
+# run the real optimizer (BetatronOptimizer) against a landscape, one frame count per shot
+def run_benchmark(landscape, settings, initial_setpoint=INITIAL_SETPOINT, max_shots=400, target_fraction=0.9, seed=None):
+    random.seed(seed)
+    # a setpoint of more than three parameters optimizes every mirror actuator
+    mirror_values = [int(value) for value in initial_setpoint[:-2]]
+    dispersion_values = {0: int(initial_setpoint[-2]), 1: int(initial_setpoint[-1])}
+
+    optimizer = BetatronOptimizer(mirror_values, dispersion_values, range(len(mirror_values)))
+    optimizer.random_seed = seed
+    for name, value in settings.items():
+        if name == 'learning_rates':
+            value = over_parameters(value, optimizer.dimension)
+        setattr(optimizer, name, value)
+
+    step_times = []
+    group_shots = []
+    group_true_counts = []
+
+    # the optimizer prints every step, keep it out of the benchmark output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), np.errstate(divide='ignore', invalid='ignore'):
+        for shot in range(max_shots):
+            setpoint = optimizer.current_setpoint()
+            frame_count = landscape.frame_count(setpoint, shot)
+
+            start = time.perf_counter()
+            group_completed = optimizer.add_image_count(frame_count)
+            elapsed = time.perf_counter() - start
+
+            if group_completed:
+                # setpoints visited before are taken from the measurement cache (with cache_reuse)
+                while optimizer.reuse_cached_measurement():
+                    pass
+                optimizer.reset_image_group()
+                step_times.append(elapsed)
+                group_shots.append(shot + 1)
+                group_true_counts.append(landscape.true_count(optimizer.current_setpoint(), shot))
+
+    # shots until the (noiseless) count reached the target and stayed there for the rest of the run
+    low, high = landscape.count_range()
+    target = low + target_fraction * (high - low)
+    below_target = [index for index, count in enumerate(group_true_counts) if count < target]
+    if not group_true_counts or (below_target and below_target[-1] == len(group_true_counts) - 1):
+        shots_to_target = None
+    elif below_target:
+        shots_to_target = group_shots[below_target[-1] + 1]
+    else:
+        shots_to_target = group_shots[0]
+
+    step_times = np.array(step_times) * 1e6
+    return {
+        'shots_to_target': shots_to_target,
+        'shots_to_reported_convergence': optimizer.shots_to_convergence,
+        'final_count': landscape.true_count(optimizer.current_setpoint(), max_shots),
+        'final_setpoint': [int(value) for value in optimizer.current_setpoint()],
+        'image_groups': len(group_shots),
+        'shots_per_setpoint': float(np.mean(optimizer.shots_per_setpoint)) if len(optimizer.shots_per_setpoint) else None,
+        'step_time_mean_us': float(step_times.mean()) if len(step_times) else None,
+        'step_time_p95_us': float(np.percentile(step_times, 95)) if len(step_times) else None,
+    }
+
+def median_or_none(values):
+    values = [value for value in values if value is not None]
+    return float(np.median(values)) if values else None
+
+# every mode on every landscape, repeated with different seeds, summarized by medians
+def run_suite(landscapes, modes, repeats=5, max_shots=400, target_fraction=0.9, initial_setpoint=INITIAL_SETPOINT, settings=None):
+    # settings are applied on top of every mode (the adaptive image group for example)
+    settings = settings or {}
+    summary = []
+    for landscape_name, make_landscape in landscapes.items():
+        for mode_name in modes:
+            runs = [
+                run_benchmark(make_landscape(seed), {**OPTIMIZER_MODES[mode_name], **settings}, initial_setpoint, max_shots, target_fraction, seed)
+                for seed in range(repeats)
+            ]
+            summary.append({
+                'landscape': landscape_name,
+                'mode': mode_name,
+                'reached_target': sum(run['shots_to_target'] is not None for run in runs) / repeats,
+                'shots_to_target': median_or_none([run['shots_to_target'] for run in runs]),
+                'shots_to_reported_convergence': median_or_none([run['shots_to_reported_convergence'] for run in runs]),
+                'final_count': median_or_none([run['final_count'] for run in runs]),
+                'shots_per_setpoint': median_or_none([run['shots_per_setpoint'] for run in runs]),
+                'step_time_mean_us': median_or_none([run['step_time_mean_us'] for run in runs]),
+                'step_time_p95_us': median_or_none([run['step_time_p95_us'] for run in runs]),
+                'runs': runs,
+            })
+    return summary
+
+def print_summary(summary):
+    def show(value, fmt):
+        return '-' if value is None else format(value, fmt)
+
+    print(f"{'landscape':<12} {'mode':<24} {'reached':>8} {'shots':>8} {'reported':>9} {'final':>10} {'shots/set':>9} {'step us':>9} {'p95 us':>9}")
+    for row in summary:
+        print(
+            f"{row['landscape']:<12} {row['mode']:<24} {row['reached_target']:>8.0%} {show(row['shots_to_target'], '.0f'):>8} "
+            f"{show(row['shots_to_reported_convergence'], '.0f'):>9} {show(row['final_count'], '.1f'):>10} {show(row['shots_per_setpoint'], '.1f'):>9} "
+            f"{show(row['step_time_mean_us'], '.1f'):>9} {show(row['step_time_p95_us'], '.1f'):>9}"
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless benchmark of the optimizer modes on synthetic landscapes or recorded runs')
+    parser.add_argument('--modes', nargs='+', default=list(OPTIMIZER_MODES), choices=list(OPTIMIZER_MODES))
+    parser.add_argument('--landscapes', nargs='+', default=list(default_landscapes()), choices=list(default_landscapes()))
+    parser.add_argument('--replay', help='parameter log of a recorded run to replay instead of the synthetic landscapes')
+    parser.add_argument('--reduce-images', action='store_true', help='re-reduce the recorded images of the replayed run')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-shots', type=int, default=400)
+    parser.add_argument('--target-fraction', type=float, default=0.9)
+    parser.add_argument('--adaptive-image-group', action='store_true', help='size the image groups by the standard error of their mean')
+    parser.add_argument('--cache', choices=['combine', 'reuse'], help='pool revisited setpoints with their cached shots, or reuse them without measuring')
+    parser.add_argument('--group-estimator', choices=['median_mad', 'trimmed_mean', 'mean'], help='how the count of an image group leaves out misfired frames')
+    parser.add_argument('--image-group', type=int, help='frames per image group')
+    parser.add_argument('--json', help='write the full results to this file')
+    args = parser.parse_args(argv)
+
+    initial_setpoint = INITIAL_SETPOINT
+    if args.replay:
+        initial_setpoint = ReplayLandscape(args.replay).initial_setpoint
+        landscapes = {'replay': lambda seed: ReplayLandscape(args.replay, reduce_images=args.reduce_images, seed=seed)}
+    else:
+        landscapes = {name: (lambda seed, name=name: default_landscapes(seed)[name]) for name in args.landscapes}
+
+    settings = {}
+    if args.adaptive_image_group:
+        settings['adaptive_image_group'] = True
+    if args.cache:
+        settings['cache_combine'] = True
+        settings['cache_reuse'] = args.cache == 'reuse'
+    if args.group_estimator:
+        settings['group_estimator'] = args.group_estimator
+    if args.image_group:
+        settings['image_group'] = args.image_group
+    summary = run_suite(landscapes, args.modes, args.repeats, args.max_shots, args.target_fraction, initial_setpoint, settings)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summary, file, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
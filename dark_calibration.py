@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from tiff_reader import apply_to_mapped_tiff, scratch_buffer
+from frame_processing import timed, read_and_reduce
+
+DARK_CALIBRATION_PATH = r'dark_calibration.npz'
+
+# dark frame and static pixel mask of the camera, built once from background frames (no x-rays) and cached on disk.
+# a live frame is then reduced by one masked mean instead of a median blur: hot and noisy pixels and everything outside
+# the roi are masked out, the dark level is subtracted and pixels more than clip_counts above the dark frame (cosmic rays,
+# single pixel spikes) are optionally clipped
+class DarkCalibration:
+    def __init__(self, dark, mask, clip_counts=None, roi=None, hot_pixel_sigma=None):
+        self.dark = np.asarray(dark, dtype=np.float32)
+        self.mask = np.asarray(mask, dtype=np.uint8)
+        self.clip_counts = clip_counts
+
+        # how the mask was built, to tell whether a cached calibration still applies
+        self.roi = roi
+        self.hot_pixel_sigma = hot_pixel_sigma
+
+        # the mean of a dark-subtracted frame over the mask is its mean over the mask minus this
+        self.dark_mean = float(self.dark[self.mask > 0].mean()) if self.mask.any() else 0.0
+
+        # highest value every pixel may take, the frames are clipped against it with a single cv2.min
+        self.clip_frame = None
+        if clip_counts is not None:
+            self.clip_frame = np.clip(np.rint(self.dark + clip_counts), 0, 65535).astype(np.uint16)
+
+    def reduce(self, image, timer=None):
+        if image.shape != self.dark.shape:
+            raise ValueError(f'frame of {image.shape[1]}x{image.shape[0]} pixels, dark frame of {self.dark.shape[1]}x{self.dark.shape[0]}')
+
+        if self.clip_frame is not None:
+            with timed(timer, 'clip'):
+                image = cv2.min(image, self.clip_frame.astype(image.dtype, copy=False), dst=scratch_buffer('clip', image.shape, image.dtype))
+
+        with timed(timer, 'masked_mean'):
+            return cv2.mean(image, mask=self.mask)[0] - self.dark_mean
+
+    # count of a frame on disk, used as the reduce function of the frame pool in place of calc_count_per_image
+    def count(self, image_path, timer=None):
+        return read_and_reduce(image_path, lambda image: self.reduce(image, timer), timer)
+
+    def save(self, path, sources=()):
+        # the background frames and their modification times are kept to tell whether the cache is still valid
+        sources = [os.path.abspath(source) for source in sources]
+        np.savez_compressed(
+            path, dark=self.dark, mask=self.mask,
+            clip_counts=np.nan if self.clip_counts is None else self.clip_counts,
+            roi=np.array(self.roi if self.roi is not None else [], dtype=int),
+            hot_pixel_sigma=np.nan if self.hot_pixel_sigma is None else self.hot_pixel_sigma,
+            sources=np.array(sources, dtype=str), source_mtimes=np.array([os.path.getmtime(source) for source in sources]),
+        )
+
+def read_frame(image_path):
+    image = apply_to_mapped_tiff(image_path, np.array)
+    if image is None:
+        image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED | cv2.IMREAD_ANYDEPTH)
+    if image is None:
+        raise ValueError(f'could not read {image_path}')
+    return image
+
+# dark frame (per pixel mean of the background frames) and the mask of the pixels to use. a pixel is masked out when its
+# dark level or its shot to shot noise is more than hot_pixel_sigma robust standard deviations above the other pixels,
+# or when it is outside roi (x, y, width, height)
+def build_calibration(background_paths, hot_pixel_sigma=6.0, roi=None, clip_counts=None):
+    if not background_paths:
+        raise ValueError('no background frames to calibrate from')
+    return calibration_from_frames((read_frame(image_path) for image_path in background_paths), hot_pixel_sigma, roi, clip_counts)
+
+def calibration_from_frames(frames, hot_pixel_sigma=6.0, roi=None, clip_counts=None):
+    # running sums, the background frames are never all held in memory
+    total = None
+    frame_count = 0
+    for image in frames:
+        image = image.astype(np.float64)
+        if total is None:
+            total = np.zeros_like(image)
+            total_squares = np.zeros_like(image)
+        elif image.shape != total.shape:
+            raise ValueError('the background frames do not all have the same size')
+        total += image
+        total_squares += image ** 2
+        frame_count += 1
+
+    dark = total / frame_count
+    noise = np.sqrt(np.maximum(total_squares / frame_count - dark ** 2, 0))
+
+    mask = ~(outliers(dark, hot_pixel_sigma) | outliers(noise, hot_pixel_sigma))
+    if roi is not None:
+        x, y, width, height = roi
+        in_roi = np.zeros_like(mask)
+        in_roi[y:y + height, x:x + width] = True
+        mask &= in_roi
+
+    return DarkCalibration(dark, mask, clip_counts, list(roi) if roi is not None else None, hot_pixel_sigma)
+
+def outliers(values, sigma):
+    # more than sigma robust standard deviations (median absolute deviation) above the median
+    median = np.median(values)
+    spread = 1.4826 * np.median(np.abs(values - median))
+    return values > median + sigma * max(spread, 1e-6)
+
+def load_calibration(path):
+    with np.load(path) as data:
+        clip_counts = float(data['clip_counts'])
+        hot_pixel_sigma = float(data['hot_pixel_sigma'])
+        roi = [int(value) for value in data['roi']] or None
+        return DarkCalibration(data['dark'], data['mask'], None if np.isnan(clip_counts) else clip_counts, roi, None if np.isnan(hot_pixel_sigma) else hot_pixel_sigma)
+
+# the cached calibration when it was built from the same background frames (same files, not modified since), otherwise
+# it is built again and cached at path
+def calibrate(background_paths, path=DARK_CALIBRATION_PATH, hot_pixel_sigma=6.0, roi=None, clip_counts=None):
+    if os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                sources = [str(source) for source in data['sources']]
+                source_mtimes = data['source_mtimes'].tolist()
+            current = [os.path.abspath(image_path) for image_path in background_paths]
+            if sources == current and source_mtimes == [os.path.getmtime(image_path) for image_path in current]:
+                calibration = load_calibration(path)
+                if (calibration.clip_counts, calibration.roi, calibration.hot_pixel_sigma) == (clip_counts, list(roi) if roi is not None else None, hot_pixel_sigma):
+                    return calibration
+        except Exception as e:
+            print(f"Error reading dark calibration {path}: {e}")
+
+    calibration = build_calibration(background_paths, hot_pixel_sigma, roi, clip_counts)
+    calibration.save(path, background_paths)
+    return calibration
+
+# synthetic frames like the camera's: fixed dark pattern, hot pixels, read noise, a broad x-ray glow of changing
+# brightness and a few cosmic ray spikes per frame
+def synthetic_frames(count, shape=(1024, 1280), seed=0):
+    rng = np.random.default_rng(seed)
+    dark = rng.normal(400, 8, shape)
+    hot_pixels = (rng.integers(0, shape[0], 200), rng.integers(0, shape[1], 200))
+    dark[hot_pixels] += rng.uniform(2000, 20000, 200)
+
+    rows, columns = np.indices(shape)
+    glow = np.exp(-(((rows - shape[0] / 2) / (shape[0] / 4)) ** 2 + ((columns - shape[1] / 2) / (shape[1] / 4)) ** 2))
+
+    def frame(amplitude, cosmic_rays=0):
+        image = dark + amplitude * glow + rng.normal(0, 10, shape)
+        spikes = (rng.integers(0, shape[0], cosmic_rays), rng.integers(0, shape[1], cosmic_rays))
+        image[spikes] += 30000
+        return np.clip(np.rint(image), 0, 65535).astype(np.uint16)
+
+    backgrounds = [frame(0) for _ in range(16)]
+    frames = [frame(amplitude, cosmic_rays=5) for amplitude in rng.uniform(100, 1000, count)]
+    return backgrounds, frames
+
+# time and counts of the median blur proxy against the calibrated masked mean on the same frames, the optimizer only
+# uses count differences so the calibrated counts should follow the blurred ones up to an offset
+def benchmark(backgrounds, frames, clip_counts=3000.0, repeats=5):
+    calibration = calibration_from_frames(backgrounds, clip_counts=clip_counts)
+
+    def blur_then_mean(image):
+        return cv2.medianBlur(image, 5).mean()
+
+    results = {}
+    for name, reduce in (('median blur', blur_then_mean), ('dark calibration', calibration.reduce)):
+        counts = np.array([reduce(image) for image in frames])
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for image in frames:
+                reduce(image)
+        results[name] = (counts, (time.perf_counter() - start) / (repeats * len(frames)))
+
+    blurred, calibrated = results['median blur'][0], results['dark calibration'][0]
+    slope, offset = np.polyfit(blurred, calibrated, 1)
+    return {
+        'blur_ms': results['median blur'][1] * 1e3,
+        'calibrated_ms': results['dark calibration'][1] * 1e3,
+        'slope': slope,
+        'offset': offset,
+        'correlation': np.corrcoef(blurred, calibrated)[0, 1],
+        'max_change_error': np.max(np.abs(np.diff(calibrated) - np.diff(blurred))),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the dark frame and hot pixel mask, or compare it with the median blur')
+    parser.add_argument('backgrounds', nargs='*', help='background tiff frames taken without x-rays')
+    parser.add_argument('--output', default=DARK_CALIBRATION_PATH)
+    parser.add_argument('--hot-pixel-sigma', type=float, default=6.0)
+    parser.add_argument('--roi', type=int, nargs=4, metavar=('X', 'Y', 'WIDTH', 'HEIGHT'))
+    parser.add_argument('--clip-counts', type=float, help='clip pixels this far above the dark frame (cosmic rays)')
+    parser.add_argument('--benchmark', action='store_true', help='compare with blur-then-mean on synthetic frames')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        result = benchmark(*synthetic_frames(20))
+        print(f"median blur      {result['blur_ms']:8.3f} ms per frame")
+        print(f"dark calibration {result['calibrated_ms']:8.3f} ms per frame")
+        print(f"calibrated = {result['slope']:.4f} * blurred + {result['offset']:.2f}, correlation {result['correlation']:.6f}, largest count change error {result['max_change_error']:.3f}")
+        return
+
+    calibration = calibrate(args.backgrounds, args.output, args.hot_pixel_sigma, args.roi, args.clip_counts)
+    masked = calibration.mask.size - np.count_nonzero(calibration.mask)
+    print(f"Dark calibration {args.output}: dark level {calibration.dark_mean:.2f}, {masked} pixels masked out")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import time
+import threading
+from collections import deque
+
+from frame_processing import FramePool, calc_count_per_image
+
+# bounded fifo between two pipeline stages, when full put either blocks (backpressure on the stage before) or drops the oldest item
+class StageQueue:
+    def __init__(self, name, maxsize, drop_oldest=False):
+        self.name = name
+        self.maxsize = maxsize
+        self.drop_oldest = drop_oldest
+
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.max_depth = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self.condition:
+            if self.drop_oldest:
+                if len(self.items) >= self.maxsize:
+                    self.items.popleft()
+                    self.dropped += 1
+            else:
+                while len(self.items) >= self.maxsize and not self.closed:
+                    self.condition.wait()
+
+            self.items.append(item)
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify_all()
+
+    def get(self):
+        # None once the queue is closed and empty
+        with self.condition:
+            while not self.items and not self.closed:
+                self.condition.wait()
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def depth(self):
+        with self.condition:
+            return len(self.items)
+
+# single slot stage where only the newest item matters (actuator setpoints): a new item replaces one that was not picked up yet
+class LatestWinsStage:
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+        self.item = None
+        self.busy = False
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.replaced = 0
+        self.max_depth = 0
+
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+        with self.condition:
+            if self.item is not None:
+                self.replaced += 1
+            self.item = item
+            self.max_depth = 1
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.item is None and not self.closed:
+                    self.condition.wait()
+                if self.item is None:
+                    return
+                item, self.item = self.item, None
+                self.busy = True
+
+            try:
+                self.function(item)
+            except Exception as e:
+                print(f"Error in {self.name} stage: {e}")
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def depth(self):
+        with self.condition:
+            return int(self.item is not None)
+
+    def wait(self):
+        # block until the pending item has been handled
+        with self.condition:
+            while self.item is not None or self.busy:
+                self.condition.wait()
+
+    def close(self):
+        # the pending item is still handled before the thread exits
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+# detection -> decode/reduce -> aggregation, every frame is handed to frame_callback(frame, count) on one thread in acquisition order.
+# the detection queue drops the oldest frames when it is full, at most max_in_flight frames are being reduced at once and the
+# reducers wait when the aggregation queue is full, so a slow consumer holds up the pipeline instead of growing its queues
+class FramePipeline:
+    def __init__(self, frame_callback, reduce_function=calc_count_per_image, max_workers=4, use_processes=False, detection_queue_size=256, aggregation_queue_size=64, max_in_flight=None, tag_function=None, timestamp_function=None, timer=None):
+        self.frame_callback = frame_callback
+
+        # called when a frame is detected, its return value is kept with the frame (the engine tags the setpoint it belongs to)
+        self.tag_function = tag_function
+
+        # called with the image path before the frame is reduced, the result is kept as frame['acquired'] (when the frame was taken)
+        self.timestamp_function = timestamp_function
+
+        # StageTimer for the time frames spend in the queues and from detection to the consumer
+        self.timer = timer
+
+        self.detection_queue = StageQueue('detection', detection_queue_size, drop_oldest=True)
+        self.aggregation_queue = StageQueue('aggregation', aggregation_queue_size)
+
+        self.max_in_flight = max_in_flight if max_in_flight is not None else 2 * max_workers
+        self.in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self.in_flight_count = 0
+        self.max_in_flight_count = 0
+        self.in_flight_lock = threading.Lock()
+
+        # frames being reduced, by path (each path is one frame)
+        self.frames = {}
+        self.frame_pool = FramePool(self.reduced, reduce_function, max_workers=max_workers, use_processes=use_processes, error_callback=self.reduce_failed)
+
+        self.dispatch_thread = threading.Thread(target=self.dispatch, name='frame_dispatch', daemon=True)
+        self.aggregation_thread = threading.Thread(target=self.aggregate, name='frame_aggregation', daemon=True)
+        self.dispatch_thread.start()
+        self.aggregation_thread.start()
+
+    def submit(self, image_paths):
+        # called from the file watcher, never blocks
+        for image_path in image_paths:
+            frame = {
+                'path': image_path,
+                'detected': time.monotonic(),
+                'detected_time': time.time(),
+                'tag': self.tag_function() if self.tag_function is not None else None,
+            }
+            self.detection_queue.put(frame)
+
+    def dispatch(self):
+        while True:
+            frame = self.detection_queue.get()
+            if frame is None:
+                return
+
+            if self.timestamp_function is not None:
+                try:
+                    frame['acquired'] = self.timestamp_function(frame['path'])
+                except OSError:
+                    frame['acquired'] = None
+
+            if self.timer is not None:
+                # from the file being written to the watcher seeing it, and the wait in the detection queue
+                if frame.get('acquired') is not None:
+                    self.timer.record('detection', max(frame['detected_time'] - frame['acquired'], 0.0))
+                self.timer.record('detection_queue', time.monotonic() - frame['detected'])
+
+            # wait for a free reducer slot
+            self.in_flight.acquire()
+            with self.in_flight_lock:
+                self.in_flight_count += 1
+                self.max_in_flight_count = max(self.max_in_flight_count, self.in_flight_count)
+                self.frames[frame['path']] = frame
+            self.frame_pool.submit([frame['path']])
+
+    def release(self, image_path):
+        with self.in_flight_lock:
+            self.in_flight_count -= 1
+            frame = self.frames.pop(image_path, None)
+        self.in_flight.release()
+        return frame
+
+    def reduced(self, image_path, count):
+        frame = self.release(image_path)
+        if frame is not None:
+            frame['reduced'] = time.monotonic()
+            self.aggregation_queue.put((frame, count))
+
+    def reduce_failed(self, image_path, error):
+        self.release(image_path)
+
+    def aggregate(self):
+        while True:
+            item = self.aggregation_queue.get()
+            if item is None:
+                return
+            frame, count = item
+            if self.timer is not None:
+                self.timer.record('aggregation_queue', time.monotonic() - frame['reduced'])
+            try:
+                self.frame_callback(frame, count)
+            except Exception as e:
+                print(f"Error processing image {frame['path']}: {e}")
+            if self.timer is not None:
+                self.timer.record('frame_total', time.monotonic() - frame['detected'])
+
+    def queue_depths(self):
+        with self.in_flight_lock:
+            in_flight_count = self.in_flight_count
+        return {
+            'detection': self.detection_queue.depth(),
+            'reduce': in_flight_count,
+            'aggregation': self.aggregation_queue.depth(),
+        }
+
+    def max_queue_depths(self):
+        return {
+            'detection': self.detection_queue.max_depth,
+            'reduce': self.max_in_flight_count,
+            'aggregation': self.aggregation_queue.max_depth,
+        }
+
+    def dropped_frames(self):
+        return self.detection_queue.dropped
+
+    def shutdown(self):
+        # let the frames already detected run through every stage, then stop the threads
+        self.detection_queue.close()
+        self.dispatch_thread.join()
+        self.frame_pool.shutdown()
+        self.aggregation_queue.close()
+        self.aggregation_thread.join()
@@ -0,0 +1,130 @@
+import time
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from tiff_reader import apply_to_mapped_tiff, scratch_buffer
+
+# method to calculate count (by its brightness proxy), kept at module level so process workers can pickle it
+def calc_count_per_image(image_path, timer=None):
+    return read_and_reduce(image_path, lambda image: blur_and_mean(image, timer), timer)
+
+# read a frame and hand it to reduce, returns what reduce returns
+def read_and_reduce(image_path, reduce, timer=None):
+
+    # uncompressed tiffs (what SpinView writes) are read straight from the memory mapped file, anything else is decoded by cv2.
+    # mapping only parses the header, the pixels are paged in by the reduction
+    start = time.perf_counter()
+
+    def reduce_mapped(image):
+        if timer is not None:
+            timer.record('imread', time.perf_counter() - start, start)
+        return reduce(image)
+
+    result = apply_to_mapped_tiff(image_path, reduce_mapped)
+    if result is not None:
+        return result
+
+    # read the image in 16 bit, cv2 is imported with the first frame (importing it again is a dictionary lookup)
+    import cv2
+    with timed(timer, 'imread'):
+        original_image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED | cv2.IMREAD_ANYDEPTH)
+    return reduce(original_image)
+
+def blur_and_mean(image, timer=None):
+    # apply median blur on image, into a buffer reused from frame to frame
+    import cv2
+    with timed(timer, 'median_blur'):
+        median_blured_image = cv2.medianBlur(image, 5, dst=scratch_buffer('blur', image.shape, image.dtype))
+
+    # return the count (mean brightness of blured image)
+    with timed(timer, 'mean'):
+        return median_blured_image.mean()
+
+# a StageTimer stage, or nothing when the frame is not timed (process workers cannot record on the engine's timer)
+def timed(timer, stage):
+    return timer.time(stage) if timer is not None else contextlib.nullcontext()
+
+class FramePool:
+    def __init__(self, result_callback, reduce_function=calc_count_per_image, max_workers=4, use_processes=False, error_callback=None):
+
+        # called with (image_path, count) for every frame, always in the order the frames were submitted
+        self.result_callback = result_callback
+
+        # called with (image_path, error) for frames that could not be reduced
+        self.error_callback = error_callback
+        self.reduce_function = reduce_function
+        self.max_workers = max_workers
+
+        # threads are enough since cv2 releases the GIL while decoding and blurring, processes are optional
+        if use_processes:
+            self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='frame_pool')
+
+        # frames that were submitted but not yet handed back, in acquisition order
+        self.pending = deque()
+        self.pending_lock = threading.Lock()
+
+        # only one thread at a time hands results back so the order is kept
+        self.delivery_lock = threading.Lock()
+
+        # keep track of the deepest the queue got to see if the pool is saturated
+        self.max_queue_depth = 0
+
+    def submit(self, image_paths):
+        futures = []
+
+        with self.pending_lock:
+            for image_path in image_paths:
+                future = self.executor.submit(self.reduce_function, image_path)
+                self.pending.append((image_path, future))
+                futures.append(future)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.pending))
+
+        # attach the callbacks after the frames are queued, a future that is already done calls back right away
+        for future in futures:
+            future.add_done_callback(self.deliver_results)
+
+    def deliver_results(self, _future=None):
+        with self.delivery_lock:
+            while True:
+                with self.pending_lock:
+                    # stop at the first frame that is not reduced yet, later frames have to wait for it
+                    if not self.pending or not self.pending[0][1].done():
+                        return
+                    image_path, future = self.pending.popleft()
+
+                try:
+                    count = future.result()
+                except Exception as e:
+                    print(f"Error processing image {image_path}: {e}")
+                    if self.error_callback is not None:
+                        self.error_callback(image_path, e)
+                    continue
+
+                self.result_callback(image_path, count)
+
+    def queue_depth(self):
+        with self.pending_lock:
+            return len(self.pending)
+
+    def is_saturated(self):
+        # more frames waiting than workers means frames are arriving faster than they are reduced
+        return self.queue_depth() > self.max_workers
+
+    def wait(self):
+        # block until every submitted frame has been handed back
+        with self.pending_lock:
+            futures = [future for _, future in self.pending]
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+        self.deliver_results()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.deliver_results()
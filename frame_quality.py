@@ -0,0 +1,72 @@
+from collections import namedtuple
+
+import numpy as np
+
+from tiff_reader import scratch_buffer
+from frame_processing import timed, read_and_reduce
+
+# count of a frame (mean of the median blurred frame, as calc_count_per_image) with a few statistics of the same frame to
+# tell misfired shots apart: the fraction of saturated pixels (raw frame), the background level (mean of the blurred
+# frame's border, away from the x-rays) and the spatial spread (standard deviation of the blurred frame)
+FrameStatistics = namedtuple('FrameStatistics', ['count', 'saturated_fraction', 'background', 'spread'])
+
+def frame_statistics(image, timer=None, saturation_level=None):
+    import cv2
+
+    # the saturation level is the top of the frame's dtype unless the camera saturates below it
+    if saturation_level is None:
+        saturation_level = np.iinfo(image.dtype).max if image.dtype.kind in 'ui' else np.inf
+
+    with timed(timer, 'median_blur'):
+        blurred = cv2.medianBlur(image, 5, dst=scratch_buffer('blur', image.shape, image.dtype))
+
+    with timed(timer, 'mean'):
+        # mean and standard deviation in one pass
+        mean, spread = cv2.meanStdDev(blurred)
+
+    with timed(timer, 'frame_statistics'):
+        saturated = cv2.compare(image, float(saturation_level), cv2.CMP_GE, dst=scratch_buffer('saturated', image.shape, np.uint8))
+        saturated_fraction = cv2.countNonZero(saturated) / image.size
+
+        # border of 1/16 of the frame on every side
+        band = max(1, min(image.shape[:2]) // 16)
+        border = (blurred[:band], blurred[-band:], blurred[band:-band, :band], blurred[band:-band, -band:])
+        sizes = [part.size for part in border]
+        background = sum(cv2.mean(part)[0] * size for part, size in zip(border, sizes)) / sum(sizes)
+
+    return FrameStatistics(float(mean[0, 0]), saturated_fraction, background, float(spread[0, 0]))
+
+# frame statistics of a frame on disk, the reduce function of the frame pool in place of calc_count_per_image
+def calc_frame_statistics(image_path, timer=None, saturation_level=None):
+    return read_and_reduce(image_path, lambda image: frame_statistics(image, timer, saturation_level), timer)
+
+# rows of values (frames x statistics) that are within sigma robust standard deviations (median absolute deviation) of
+# the median in every column. a column with no spread (more than half of the frames equal) cannot tell outliers apart
+def robust_inliers(values, sigma=3.5):
+    return reference_inliers(values, values, sigma)
+
+# the same against the median and spread of other frames (reference), for groups too small to judge their own frames
+def reference_inliers(values, reference, sigma=3.5):
+    values = np.asarray(values, dtype=float).reshape(len(values), -1)
+    reference = np.asarray(reference, dtype=float).reshape(len(reference), -1)
+    median = column_medians(reference)
+    spread = 1.4826 * column_medians(np.abs(reference - median))
+    spread[spread == 0] = np.inf
+    return np.all(np.abs(values - median) <= sigma * spread, axis=1)
+
+# np.median(values, axis=0) without its overhead, the groups are judged on every image group
+def column_medians(values):
+    middle = [(len(values) - 1) // 2, len(values) // 2]
+    partitioned = np.partition(values, middle, axis=0)
+    return (partitioned[middle[0]] + partitioned[middle[1]]) / 2
+
+# frames left after dropping the trim_fraction lowest and highest counts
+def trimmed_inliers(counts, trim_fraction=0.25):
+    counts = np.asarray(counts, dtype=float)
+    trim = int(len(counts) * trim_fraction)
+    keep = np.ones(len(counts), dtype=bool)
+    if trim:
+        order = np.argsort(counts, kind='stable')
+        keep[order[:trim]] = False
+        keep[order[-trim:]] = False
+    return keep
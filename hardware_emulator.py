@@ -0,0 +1,269 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+from local_ftp_server import LocalFTPServer
+from benchmark_optimizer import default_landscapes
+from optimization_engine import OptimizationEngine, parse_mirror_parameters, parse_dispersion_parameters, format_mirror_parameters, format_dispersion_parameters
+
+# the mirror and dazzler as the engine sees them: the uploaded parameter files are applied settle_delay seconds after they
+# arrive, the camera always takes its frames at the setpoint that is applied at that moment
+class EmulatedActuators:
+    def __init__(self, mirror_values, dispersion_values, settle_delay=0.05):
+        self.settle_delay = settle_delay
+        self.mirror_values = list(mirror_values)
+        self.dispersion_values = dict(dispersion_values)
+        self.lock = threading.Lock()
+
+        # (receive time, apply time) of every upload
+        self.uploads = []
+
+    def setpoint(self):
+        with self.lock:
+            return [self.mirror_values[0], self.dispersion_values[0], self.dispersion_values[1]]
+
+    def mirror_uploaded(self, file_name, payload):
+        self.apply_later(self.mirror_values, parse_mirror_parameters(payload.decode()))
+
+    def dispersion_uploaded(self, file_name, payload):
+        self.apply_later(self.dispersion_values, parse_dispersion_parameters(payload.decode()))
+
+    def apply_later(self, values, new_values):
+        received = time.monotonic()
+
+        def settle():
+            with self.lock:
+                for key, value in (new_values.items() if isinstance(new_values, dict) else enumerate(new_values)):
+                    values[key] = value
+                self.uploads.append((received, time.monotonic()))
+
+        timer = threading.Timer(self.settle_delay, settle)
+        timer.daemon = True
+        timer.start()
+
+# writes 16 bit tiffs into the image directory at rep_rate, their mean brightness is the landscape's count at the applied
+# setpoint (with its shot to shot noise) on top of fixed pixel noise, written in place like SpinView does
+class EmulatedCamera:
+    def __init__(self, img_path, landscape, actuators, rep_rate=10.0, shape=(256, 320), seed=None):
+        self.img_path = img_path
+        self.landscape = landscape
+        self.actuators = actuators
+        self.rep_rate = rep_rate
+
+        # a few noise patterns are drawn once and cycled, drawing one per frame would limit the rep rate
+        rng = np.random.default_rng(seed)
+        self.noise = rng.normal(0, 20, (4,) + tuple(shape)).astype(np.float32)
+
+        # monotonic time every frame was completely written, by path
+        self.write_times = {}
+        self.shots = 0
+        self.late_frames = 0
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def write_frame(self):
+        count = self.landscape.frame_count(self.actuators.setpoint(), self.shots)
+        image = np.clip(self.noise[self.shots % len(self.noise)] + count, 0, 65535).astype(np.uint16)
+        ok, encoded = cv2.imencode('.tiff', image, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+        path = os.path.join(self.img_path, f'frame{self.shots:07d}.tiff')
+        with open(path, 'wb') as file:
+            file.write(encoded.tobytes())
+        self.write_times[path] = time.monotonic()
+        self.shots += 1
+
+    def run(self):
+        period = 1.0 / self.rep_rate
+        next_shot = time.monotonic()
+        while not self.stop_event.is_set():
+            self.write_frame()
+            next_shot += period
+            delay = next_shot - time.monotonic()
+            if delay < 0:
+                # the camera could not keep the rep rate (disk or cpu bound), do not try to catch up
+                self.late_frames += 1
+                next_shot = time.monotonic()
+            elif self.stop_event.wait(delay):
+                return
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='emulated_camera', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+# the whole loop without lab hardware: the emulated camera writes into the engine's image directory, the engine uploads
+# every setpoint to two local ftp servers standing in for the mirror and dazzler computers
+class HardwareEmulator:
+    def __init__(self, landscape, rep_rate=10.0, settle_delay=0.05, shape=(256, 320), initial_setpoint=(-150, 36100, -27000), workdir=None, seed=None):
+        self.owns_workdir = workdir is None
+        self.workdir = workdir if workdir is not None else tempfile.mkdtemp(prefix='betatron_emulator_')
+        self.img_path = os.path.join(self.workdir, 'images')
+        os.makedirs(self.img_path, exist_ok=True)
+
+        mirror_values = [int(initial_setpoint[0]), 0, 0]
+        dispersion_values = {0: int(initial_setpoint[1]), 1: int(initial_setpoint[2])}
+        self.actuators = EmulatedActuators(mirror_values, dispersion_values, settle_delay)
+        self.camera = EmulatedCamera(self.img_path, landscape, self.actuators, rep_rate, shape, seed)
+        self.mirror_server = LocalFTPServer(user='mirror', password='mirror', on_upload=self.actuators.mirror_uploaded)
+        self.dazzler_server = LocalFTPServer(user='dazzler', password='dazzler', on_upload=self.actuators.dispersion_uploaded)
+
+        # the real engine, with its files in the work directory and its uploads going to the local servers
+        mirror_file_path = os.path.join(self.workdir, 'dm_parameters.txt')
+        dispersion_file_path = os.path.join(self.workdir, 'dazzler_parameters.txt')
+        with open(mirror_file_path, 'w') as file:
+            file.write(format_mirror_parameters(mirror_values))
+        with open(dispersion_file_path, 'w') as file:
+            file.write(format_dispersion_parameters(dispersion_values))
+
+        self.engine = OptimizationEngine(list(mirror_values), dict(dispersion_values))
+        self.engine.IMG_PATH = self.img_path
+        self.engine.MIRROR_FILE_PATH = mirror_file_path
+        self.engine.DISPERSION_FILE_PATH = dispersion_file_path
+        self.engine.PARAMETER_LOG_PATH = os.path.join(self.workdir, 'parameter_log.csv')
+        self.engine.ACTUATION_LOG_PATH = os.path.join(self.workdir, 'actuation_log.csv')
+        self.engine.JOURNAL_PATH = os.path.join(self.workdir, 'run_journal.bin')
+        self.engine.MIRROR_HOST, self.engine.MIRROR_PORT = self.mirror_server.host, self.mirror_server.port
+        self.engine.MIRROR_USER = self.engine.MIRROR_PASSWORD = 'mirror'
+        self.engine.DAZZLER_HOST, self.engine.DAZZLER_PORT = self.dazzler_server.host, self.dazzler_server.port
+        self.engine.DAZZLER_USER = self.engine.DAZZLER_PASSWORD = 'dazzler'
+        self.engine.upload_enabled = True
+        self.engine.settle_delay = settle_delay
+        self.engine.optimizer.random_seed = seed
+        self.engine.timing_summary_interval = 0
+
+        # seconds from the camera writing the last frame of an image group to its new setpoint being handed to the actuators
+        self.loop_latencies = []
+        self.engine.subscribe(self.state_published)
+
+        self.started = None
+        self.stopped = None
+
+    def state_published(self, state):
+        written = self.camera.write_times.get(state.get('last_image'))
+        if written is not None:
+            self.loop_latencies.append(time.monotonic() - written)
+
+    def start(self):
+        self.mirror_server.start()
+        self.dazzler_server.start()
+        self.started = time.monotonic()
+        self.camera.start()
+
+    def stop(self):
+        self.camera.stop()
+        self.stopped = time.monotonic()
+
+        # let the frames already written run through the engine before it is stopped (the live plot stops it on quit)
+        if self.engine.file_observer is not None:
+            time.sleep(0.2)
+            self.engine.stop()
+
+        # the last upload is applied after the settle delay
+        time.sleep(self.actuators.settle_delay)
+        self.mirror_server.stop()
+        self.dazzler_server.stop()
+
+    def cleanup(self):
+        if self.owns_workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def report(self):
+        elapsed = self.stopped - self.started
+        optimizer = self.engine.optimizer
+        latencies = np.array(self.loop_latencies) * 1e3
+        settle_times = np.array([applied - received for received, applied in self.actuators.uploads]) * 1e3
+        return {
+            'duration_s': elapsed,
+            'frames_written': self.camera.shots,
+            'frames_processed': optimizer.images_processed,
+            'frames_per_second': optimizer.images_processed / elapsed,
+            'late_frames': self.camera.late_frames,
+            'stale_frames': self.engine.stale_frames,
+            'unsettled_frames': self.engine.unsettled_frames,
+            'saturated_frames': self.engine.saturated_frames,
+            'rejected_shots': optimizer.rejected_shots,
+            'image_groups': optimizer.image_groups_processed,
+            'uploads': len(self.actuators.uploads),
+            'setpoint_commands': self.engine.actuator_commands.commands,
+            'skipped_writes': self.engine.actuator_commands.skipped_writes,
+            'unchanged_setpoints': self.engine.unchanged_setpoints,
+            'loop_latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'loop_latency_p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else None,
+            'settle_ms': float(settle_times.mean()) if len(settle_times) else None,
+            'shots_to_convergence': optimizer.shots_to_convergence,
+            'final_setpoint': self.actuators.setpoint(),
+        }
+
+def print_report(report):
+    show = lambda value, spec: 'n/a' if value is None else format(value, spec)
+    print(f"{report['frames_processed']} of {report['frames_written']} frames processed in {report['duration_s']:.1f} s: {report['frames_per_second']:.1f} frames/s sustained")
+    print(f"dropped frames: {report['stale_frames']} stale, {report['unsettled_frames']} unsettled, {report['saturated_frames']} saturated, {report['rejected_shots']} left out of their image group, camera late {report['late_frames']} times")
+    print(f"{report['image_groups']} image groups, {report['unchanged_setpoints']} left the setpoint unchanged and were not sent")
+    print(f"{report['setpoint_commands']} setpoints sent, {report['uploads']} parameter files uploaded ({report['skipped_writes']} unchanged ones skipped) and applied after {show(report['settle_ms'], '.1f')} ms")
+    print(f"loop latency (frame written to new setpoint): p50 {show(report['loop_latency_p50_ms'], '.1f')} ms, p95 {show(report['loop_latency_p95_ms'], '.1f')} ms")
+    print(f"shots to convergence: {show(report['shots_to_convergence'], 'd')}, final setpoint {report['final_setpoint']}")
+
+# runs the emulation for duration seconds (or until the optimizer converged and stop_on_convergence is set), driving the
+# real BetatronApplication (live plot) when gui is set, the headless engine otherwise
+def run_emulation(emulator, duration, gui=True, stop_on_convergence=False):
+    def finished():
+        return time.monotonic() - emulator.started >= duration or (stop_on_convergence and emulator.engine.optimizer.converged)
+
+    if not gui:
+        emulator.engine.start()
+        emulator.start()
+        while not finished():
+            time.sleep(0.05)
+        emulator.stop()
+        return emulator.report()
+
+    from pyqtgraph.Qt import QtCore
+    from live_plot import BetatronApplication
+
+    app = BetatronApplication([], engine=emulator.engine)
+    emulator.start()
+
+    def check():
+        if finished():
+            app.quit()
+
+    check_timer = QtCore.QTimer()
+    check_timer.timeout.connect(check)
+    check_timer.start(50)
+    app.exec_()
+    emulator.stop()
+    return emulator.report()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the whole optimization loop against an emulated camera, mirror and dazzler')
+    parser.add_argument('--landscape', default='noisy', choices=sorted(default_landscapes()))
+    parser.add_argument('--rep-rate', type=float, default=10.0, help='camera frames per second')
+    parser.add_argument('--settle-delay', type=float, default=0.05, help='seconds the actuators take to apply an uploaded setpoint')
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--frame-size', type=int, nargs=2, default=[320, 256], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--stop-on-convergence', action='store_true')
+    parser.add_argument('--no-gui', action='store_true', help='run the headless engine instead of the live plot')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    landscape = default_landscapes(seed=args.seed)[args.landscape]
+    emulator = HardwareEmulator(landscape, args.rep_rate, args.settle_delay, shape=(args.frame_size[1], args.frame_size[0]), seed=args.seed)
+    try:
+        print_report(run_emulation(emulator, args.duration, gui=not args.no_gui, stop_on_convergence=args.stop_on_convergence))
+    finally:
+        emulator.cleanup()
+
+if __name__ == "__main__":
+    sys.exit(main())
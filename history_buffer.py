@@ -0,0 +1,89 @@
+import numpy as np
+
+class HistoryBuffer:
+    def __init__(self, dtype=float, capacity=64, maxlen=None, shape=()):
+        self.dtype = np.dtype(dtype)
+
+        # every value can be an array of this shape (one row per value, a setpoint over all parameters for example)
+        self.shape = tuple(shape)
+
+        # keep at most maxlen values (ring buffer), otherwise grow by doubling when full
+        self.maxlen = maxlen
+        self.count = 0
+
+        if maxlen is None:
+            self.data = np.empty((max(capacity, 1),) + self.shape, dtype=self.dtype)
+        else:
+            # every value is written twice so the latest maxlen values are always one contiguous slice
+            self.data = np.empty((2 * maxlen,) + self.shape, dtype=self.dtype)
+
+    def append(self, value):
+        if self.maxlen is None:
+            # double the storage when it is full, this keeps appending O(1) on average
+            if self.count == len(self.data):
+                grown_data = np.empty((2 * len(self.data),) + self.shape, dtype=self.dtype)
+                grown_data[:self.count] = self.data
+                self.data = grown_data
+            self.data[self.count] = value
+        else:
+            position = self.count % self.maxlen
+            self.data[position] = value
+            self.data[position + self.maxlen] = value
+        self.count += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.dtype).reshape((-1,) + self.shape)
+        if self.maxlen is None:
+            # one copy for the whole block instead of one append per value
+            capacity = len(self.data)
+            while capacity < self.count + len(values):
+                capacity *= 2
+            if capacity != len(self.data):
+                grown_data = np.empty((capacity,) + self.shape, dtype=self.dtype)
+                grown_data[:self.count] = self.data[:self.count]
+                self.data = grown_data
+            self.data[self.count:self.count + len(values)] = values
+            self.count += len(values)
+        else:
+            for value in values:
+                self.append(value)
+
+    def values(self):
+        # read only view of the stored values, oldest first (no copy)
+        if self.maxlen is None:
+            view = self.data[:self.count]
+        elif self.count < self.maxlen:
+            view = self.data[:self.count]
+        else:
+            start = self.count % self.maxlen
+            view = self.data[start:start + self.maxlen]
+        view.flags.writeable = False
+        return view
+
+    def resized(self, maxlen):
+        # a buffer of the same values with another maximum length, the latest maxlen values when it is shorter
+        buffer = HistoryBuffer(self.dtype, capacity=len(self), maxlen=maxlen, shape=self.shape)
+        values = self.values()
+        buffer.extend(values[-maxlen:] if maxlen is not None else values)
+        return buffer
+
+    def clear(self):
+        self.count = 0
+
+    def __len__(self):
+        return self.count if self.maxlen is None else min(self.count, self.maxlen)
+
+    def __getitem__(self, index):
+        return self.values()[index]
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.values()
+        if dtype is not None and np.dtype(dtype) != self.dtype:
+            return values.astype(dtype)
+        return values.copy() if copy else values
+
+    def __repr__(self):
+        return f"HistoryBuffer({self.values()!r})"
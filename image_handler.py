@@ -0,0 +1,41 @@
+from watchdog.events import FileSystemEventHandler
+
+# file events of the image directory, only imported once the engine starts watching it (watchdog is slow to import)
+class ImageHandler(FileSystemEventHandler):
+    def __init__(self, write_tracker, image_index=None):
+        super().__init__()
+
+        # created, modified and closed files go to the write tracker, it hands every image on once it is completely written
+        self.write_tracker = write_tracker
+
+        # the events keep the image index up to date so the directory is never listed again
+        self.image_index = image_index
+
+    def on_created(self, event):
+        if not event.is_directory:
+            if self.image_index is not None:
+                self.image_index.add(event.src_path)
+            self.write_tracker.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.write_tracker.touch(event.src_path)
+
+    def on_closed(self, event):
+        # the writer closed the file (inotify close-write, linux only), it is complete
+        if not event.is_directory:
+            self.write_tracker.touch(event.src_path, closed=True)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            if self.image_index is not None:
+                self.image_index.remove(event.src_path)
+            self.write_tracker.forget(event.src_path)
+
+    def on_moved(self, event):
+        # frames written elsewhere and moved in are complete
+        if not event.is_directory:
+            if self.image_index is not None:
+                self.image_index.move(event.src_path, event.dest_path)
+            self.write_tracker.forget(event.src_path)
+            self.write_tracker.touch(event.dest_path, closed=True)
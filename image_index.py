@@ -0,0 +1,65 @@
+import os
+import itertools
+
+class ImageIndex:
+    def __init__(self, img_path, extension='.tiff'):
+        self.img_path = img_path
+        self.extension = extension
+
+        # ordering key of every known image, set once when the image is first seen. the engine only sorts the new images of
+        # an event batch by their keys, so no sorted list of all images is kept
+        self.order_keys = {}
+
+        # tie breaker for images with the same creation time
+        self.sequence = itertools.count()
+
+    def scan(self):
+        # full listing of the directory, only needed once at startup, the observer events keep the index current after that
+        entries = [entry for entry in os.scandir(self.img_path) if entry.is_file() and entry.name.endswith(self.extension)]
+        entries.sort(key=lambda entry: entry.stat().st_ctime)
+
+        for entry in entries:
+            self.add(entry.path, entry.stat().st_ctime)
+
+        return [entry.path for entry in entries]
+
+    def add(self, image_path, ctime=None):
+        # images that are already known keep their original key
+        if image_path in self.order_keys:
+            return self.order_keys[image_path]
+
+        if not image_path.endswith(self.extension):
+            return None
+
+        # one stat per image, only the first time it is seen
+        if ctime is None:
+            try:
+                ctime = os.stat(image_path).st_ctime
+            except OSError:
+                return None
+
+        order_key = (ctime, next(self.sequence))
+        self.order_keys[image_path] = order_key
+        return order_key
+
+    def remove(self, image_path):
+        self.order_keys.pop(image_path, None)
+
+    def move(self, src_path, dest_path):
+        # a renamed image keeps its place in the acquisition order
+        order_key = self.order_keys.get(src_path)
+        self.remove(src_path)
+        if order_key is None:
+            return self.add(dest_path)
+        return self.add(dest_path, order_key[0])
+
+    def order_key(self, image_path):
+        order_key = self.add(image_path)
+        # unknown images (vanished or wrong extension) go last
+        return order_key if order_key is not None else (float('inf'), 0)
+
+    def __contains__(self, image_path):
+        return image_path in self.order_keys
+
+    def __len__(self):
+        return len(self.order_keys)
@@ -0,0 +1,87 @@
+import sys
+import json
+import argparse
+import subprocess
+
+import numpy as np
+
+# dependencies that take most of the startup time, by the modules that may import them when they are imported themselves
+HEAVY_MODULES = ('cv2', 'watchdog', 'PyQt5', 'PySide', 'pyqtgraph')
+ALLOWED_HEAVY_MODULES = {
+    'optimizer_core': (),
+    'benchmark_optimizer': (),
+    'batch_simulation': (),
+    'run_journal': (),
+    'frame_processing': (),
+    'frame_quality': (),
+    'optimization_engine': (),
+    'multivariable_gradient_descent_optimization': (),
+    'live_plot': ('PyQt5', 'PySide', 'pyqtgraph'),
+}
+
+# imports module in a fresh interpreter, returns the seconds the import took and the heavy modules it loaded
+def time_import(module):
+    code = (
+        'import sys, time\n'
+        'start = time.perf_counter()\n'
+        f'import {module}\n'
+        'elapsed = time.perf_counter() - start\n'
+        f'print(elapsed, *sorted({{name.split(".")[0] for name in sys.modules if name.startswith({HEAVY_MODULES!r})}}))\n'
+    )
+    elapsed, *loaded = subprocess.check_output([sys.executable, '-c', code], text=True).split()
+    return float(elapsed), loaded
+
+def run_benchmark(modules=ALLOWED_HEAVY_MODULES, repeats=5):
+    results = {}
+    for module in modules:
+        timings = []
+        for _ in range(repeats):
+            elapsed, loaded = time_import(module)
+            timings.append(elapsed)
+        unexpected = [name for name in loaded if not name.startswith(ALLOWED_HEAVY_MODULES.get(module, ()))]
+        results[module] = {
+            'import_ms': float(np.median(timings)) * 1e3,
+            'heavy_modules': loaded,
+            'unexpected_heavy_modules': unexpected,
+        }
+    return results
+
+# modules importing a heavy dependency they should not, or importing more than tolerance times slower than in the baseline
+def regressions(results, baseline=None, tolerance=1.5):
+    found = []
+    for module, result in results.items():
+        if result['unexpected_heavy_modules']:
+            found.append(f"{module} imports {', '.join(result['unexpected_heavy_modules'])}")
+        if baseline and module in baseline and result['import_ms'] > tolerance * baseline[module]['import_ms']:
+            found.append(f"{module} imports in {result['import_ms']:.1f} ms, {baseline[module]['import_ms']:.1f} ms in the baseline")
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the import of every entry point in a fresh interpreter and check which heavy dependencies it loads')
+    parser.add_argument('--modules', nargs='+', default=list(ALLOWED_HEAVY_MODULES))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--baseline', help='results of an earlier run (--json) to compare the import times with')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='slowdown against the baseline counted as a regression')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.modules, args.repeats)
+    print(f"{'module':<46} {'import ms':>10}  heavy modules")
+    for module, result in results.items():
+        print(f"{module:<46} {result['import_ms']:>10.1f}  {' '.join(result['heavy_modules']) or '-'}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    found = regressions(results, baseline, args.tolerance)
+    for regression in found:
+        print(f"Import regression: {regression}")
+    return 1 if found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
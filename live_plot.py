@@ -0,0 +1,130 @@
+from collections import deque
+from pyqtgraph.Qt import QtCore, QtWidgets
+import pyqtgraph as pg
+from minmax_decimation import MinMaxDecimator
+from stage_timing import StageTimer
+from optimization_engine import engine_from_parameter_files
+
+# live plot of the optimization, the engine runs in this process (on its own threads) or in another process that publishes its state on a local socket
+class BetatronApplication(QtWidgets.QApplication):
+    # parameters with their own trace and derivative plot, keys of the published state
+    PARAMETER_TITLES = {'focus': 'Focus', 'second_dispersion': 'Order2', 'third_dispersion': 'Order3'}
+
+    def __init__(self, *args, engine=None, state_address=None, **kwargs):
+        super(BetatronApplication, self).__init__(*args, **kwargs)
+
+        # states published by the engine, appended from the engine threads and only read on the GUI thread
+        self.state_updates = deque()
+
+        # at most this many points are drawn per curve, longer histories are min/max decimated
+        self.PLOT_MAX_POINTS = 2000
+
+        self.engine = None
+        self.state_subscriber = None
+        if state_address is not None:
+            # the engine runs in another process (optimization_engine.py --publish-port)
+            from state_stream import StateSubscriber
+            host, port = state_address
+            self.state_subscriber = StateSubscriber(host, port, self.state_updates.append)
+            self.state_subscriber.start()
+        else:
+            # the initial setpoint is read from the parameter files only now, not when the module is imported
+            self.engine = engine if engine is not None else engine_from_parameter_files()
+            self.engine.subscribe(self.state_updates.append)
+
+    # ------------ Plotting ------------ #
+
+        self.count_plot_widget = pg.PlotWidget()
+        self.count_plot_widget.setWindowTitle('count optimization')
+        self.count_plot_widget.setLabel('left', 'Count')
+        self.count_plot_widget.setLabel('bottom', 'Image group iteration')
+        self.count_plot_widget.show()
+
+        self.main_plot_window = pg.GraphicsLayoutWidget()
+        self.main_plot_window.show()
+
+        layout = self.main_plot_window.addLayout(row=0, col=0)
+
+        self.count_plot_widget = layout.addPlot(title='Count vs image group iteration')
+        self.total_gradient_plot = layout.addPlot(title='Total gradient vs image group iteration')
+
+        # focus, order2 and order3 and their derivatives, one plot each
+        layout.nextRow()
+        self.parameter_plots = {name: layout.addPlot(title=f'{title} vs image group iteration') for name, title in self.PARAMETER_TITLES.items()}
+        layout.nextRow()
+        self.derivative_plots = {name: layout.addPlot(title=f'{title} derivative vs image group iteration') for name, title in self.PARAMETER_TITLES.items()}
+
+        # every curve keeps its own decimated history, new states are appended to it and only changed curves are redrawn
+        self.curves = {
+            'count': (MinMaxDecimator(self.PLOT_MAX_POINTS), self.count_plot_widget.plot(pen='r')),
+            'total_gradient': (MinMaxDecimator(self.PLOT_MAX_POINTS), self.total_gradient_plot.plot(pen='y', name='total gradient')),
+        }
+        for name, plot in self.parameter_plots.items():
+            self.curves[name] = (MinMaxDecimator(self.PLOT_MAX_POINTS), plot.plot(pen='c'))
+        for name, plot in self.derivative_plots.items():
+            self.curves[f'{name}_der'] = (MinMaxDecimator(self.PLOT_MAX_POINTS), plot.plot(pen='g'))
+        self.plot_curve = self.curves['count'][1]
+        self.total_gradient_curve = self.curves['total_gradient'][1]
+        self.changed_curves = set()
+
+        # y labels of plots
+        self.total_gradient_plot.setLabel('left', 'Total Gradient')
+        self.count_plot_widget.setLabel('left', 'Image Group Iteration')
+        for name, plot in self.parameter_plots.items():
+            plot.setLabel('left', self.PARAMETER_TITLES[name])
+        for name, plot in self.derivative_plots.items():
+            plot.setLabel('left', f'{self.PARAMETER_TITLES[name]} derivative')
+
+        # x label of all plots
+        for plot in [self.count_plot_widget, self.total_gradient_plot, *self.parameter_plots.values(), *self.derivative_plots.values()]:
+            plot.setLabel('bottom', 'Image Group Iteration')
+
+        # the plots are redrawn by a timer on the GUI thread, never from the threads processing the frames,
+        # at most every PLOT_INTERVAL_MS however fast the image groups come in
+        self.PLOT_INTERVAL_MS = 200
+        self.plot_timer = QtCore.QTimer()
+        self.plot_timer.timeout.connect(self.update_plots)
+        self.plot_timer.start(self.PLOT_INTERVAL_MS)
+
+        if self.engine is not None and self.engine.file_observer is None:
+            self.engine.start()
+
+        # the redraw time goes into the engine's stage timings, or into the plot's own when the engine runs in another process
+        self.timer = self.engine.timer if self.engine is not None else StageTimer()
+        self.aboutToQuit.connect(self.stop)
+
+    def update_plots(self):
+        if not self.state_updates:
+            return
+
+        while self.state_updates:
+            state = self.state_updates.popleft()
+            self.append_point('count', state['iteration'], state['count'])
+            for name in self.PARAMETER_TITLES:
+                self.append_point(name, state['iteration'], state[name])
+
+            if 'derivative' in state:
+                derivative = state['derivative']
+                self.append_point('total_gradient', derivative['iteration'], derivative['total_gradient'])
+                # a focus derivative only when the focus actuator is optimized
+                for name in self.PARAMETER_TITLES:
+                    if name in derivative:
+                        self.append_point(f'{name}_der', derivative['iteration'], derivative[name])
+
+        # update the plots, each with at most PLOT_MAX_POINTS points
+        with self.timer.time('plot_redraw'):
+            for name in self.changed_curves:
+                decimator, curve = self.curves[name]
+                curve.setData(*decimator.data())
+        self.changed_curves.clear()
+
+    def append_point(self, name, x, y):
+        self.curves[name][0].append(x, y)
+        self.changed_curves.add(name)
+
+    def stop(self):
+        self.plot_timer.stop()
+        if self.engine is not None:
+            self.engine.stop()
+        if self.state_subscriber is not None:
+            self.state_subscriber.stop()
@@ -0,0 +1,111 @@
+from collections import deque
+
+import numpy as np
+
+# weighted least squares fit of a local linear (optionally quadratic) count model over the last measurements, updated incrementally
+class LocalLinearFit:
+    def __init__(self, reference, scale, window=10, quadratic=False):
+        # parameters are centred and scaled so order2/order3 (tens of thousands) and focus (hundreds) are fit on the same footing
+        self.reference = np.asarray(reference, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.dimension = len(self.reference)
+        self.quadratic = quadratic
+
+        # feature layout: constant, linear terms, then x_i * x_j for i <= j
+        self.quadratic_pairs = [(i, j) for i in range(self.dimension) for j in range(i, self.dimension)] if quadratic else []
+        self.feature_count = 1 + self.dimension + len(self.quadratic_pairs)
+
+        # the fit needs more rows than coefficients, the window grows with the model (more parameters, quadratic terms)
+        self.window = max(window, self.feature_count + 2)
+
+        self.rows = deque()
+        self.reset_sums()
+
+        # the running sums are rebuilt from the stored rows every so often to stop rounding errors from adding up
+        self.updates_since_rebuild = 0
+        self.rebuild_interval = 50 * self.window
+
+        self.coefficients = None
+
+    def reset_sums(self):
+        self.xtwx = np.zeros((self.feature_count, self.feature_count))
+        self.xtwy = np.zeros(self.feature_count)
+        self.ytwy = 0.0
+        self.weight_sum = 0.0
+
+    def features(self, setpoint):
+        x = (np.asarray(setpoint, dtype=float) - self.reference) / self.scale
+        quadratic_terms = [x[i] * x[j] for i, j in self.quadratic_pairs]
+        return np.concatenate(([1.0], x, quadratic_terms))
+
+    def accumulate(self, features, count, weight, sign=1.0):
+        self.xtwx += sign * weight * np.outer(features, features)
+        self.xtwy += sign * weight * count * features
+        self.ytwy += sign * weight * count * count
+        self.weight_sum += sign * weight
+
+    def add(self, setpoint, count, weight=1.0):
+        features = self.features(setpoint)
+        self.rows.append((features, float(count), float(weight)))
+        self.accumulate(features, count, weight)
+
+        # drop the oldest measurement once the window is full (downdate instead of refitting)
+        if len(self.rows) > self.window:
+            old_features, old_count, old_weight = self.rows.popleft()
+            self.accumulate(old_features, old_count, old_weight, sign=-1.0)
+
+        self.updates_since_rebuild += 1
+        if self.updates_since_rebuild >= self.rebuild_interval:
+            self.reset_sums()
+            for features, count, weight in self.rows:
+                self.accumulate(features, count, weight)
+            self.updates_since_rebuild = 0
+
+        self.coefficients = None
+
+    def is_ready(self):
+        # need more measurements than model coefficients to also get a residual
+        return len(self.rows) > self.feature_count
+
+    def unexplored(self):
+        # parameters that kept one value over the window, the fit can not tell their slope from the constant
+        if not self.rows:
+            return np.ones(self.dimension, dtype=bool)
+        linear_terms = np.array([features[1:1 + self.dimension] for features, _, _ in self.rows])
+        return np.ptp(linear_terms, axis=0) == 0
+
+    def solve(self):
+        if self.coefficients is None:
+            self.coefficients = np.linalg.lstsq(self.xtwx, self.xtwy, rcond=1e-10)[0]
+        return self.coefficients
+
+    def gradient_jacobian(self, setpoint):
+        # maps the model coefficients to the count gradient (counts per actuator step) at the setpoint
+        x = (np.asarray(setpoint, dtype=float) - self.reference) / self.scale
+        jacobian = np.zeros((self.dimension, self.feature_count))
+        jacobian[:, 1:1 + self.dimension] = np.eye(self.dimension)
+        for column, (i, j) in enumerate(self.quadratic_pairs, start=1 + self.dimension):
+            jacobian[i, column] += x[j]
+            jacobian[j, column] += x[i]
+        return jacobian / self.scale[:, None]
+
+    def gradient(self, setpoint):
+        return self.gradient_jacobian(setpoint) @ self.solve()
+
+    def residual_std(self):
+        # weighted residual sum of squares straight from the running sums
+        coefficients = self.solve()
+        residual_sum = self.ytwy - 2 * coefficients @ self.xtwy + coefficients @ self.xtwx @ coefficients
+        degrees_of_freedom = len(self.rows) - self.feature_count
+        mean_weight = self.weight_sum / len(self.rows)
+        return np.sqrt(max(residual_sum, 0.0) / (degrees_of_freedom * mean_weight))
+
+    def gradient_std(self, setpoint):
+        # standard error of the gradient at the setpoint
+        covariance = self.residual_std() ** 2 * np.linalg.pinv(self.xtwx, rcond=1e-10)
+        jacobian = self.gradient_jacobian(setpoint)
+        return np.sqrt(np.maximum(np.einsum('ij,jk,ik->i', jacobian, covariance, jacobian), 0.0))
+
+    def gradient_is_within_noise(self, setpoint, significance=2.0):
+        # no parameter has a slope that stands out of the fit noise, so we are as close to the peak as the noise allows
+        return bool(np.all(np.abs(self.gradient(setpoint)) <= significance * self.gradient_std(setpoint)))
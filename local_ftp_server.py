@@ -0,0 +1,153 @@
+import os
+import socket
+import threading
+import socketserver
+
+# minimal stand-in for the FTP servers on the mirror and Dazzler computers, enough for ftplib logins, NOOP and STOR
+class FTPSessionHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+
+        # replies go out right away, otherwise nagle holds the 226 after the 150 until the client's delayed ack (about 40 ms)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.passive_socket = None
+        self.logged_in = False
+        self.server.ftp_server.sessions.add(self)
+
+    def finish(self):
+        self.server.ftp_server.sessions.discard(self)
+        if self.passive_socket is not None:
+            self.passive_socket.close()
+        super().finish()
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+        self.wfile.flush()
+
+    def handle(self):
+        ftp_server = self.server.ftp_server
+        self.reply('220 local stand-in FTP server ready')
+
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+            if not line:
+                return
+
+            command, _, argument = line.decode().strip().partition(' ')
+            command = command.upper()
+            ftp_server.commands.append(command)
+
+            if command == 'USER':
+                self.reply('331 password required')
+            elif command == 'PASS':
+                if argument == ftp_server.password:
+                    self.logged_in = True
+                    self.reply('230 logged in')
+                else:
+                    self.reply('530 login incorrect')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            elif not self.logged_in:
+                self.reply('530 not logged in')
+            elif command in ('NOOP', 'TYPE'):
+                self.reply('200 ok')
+            elif command == 'PWD':
+                self.reply('257 "/"')
+            elif command == 'PASV':
+                self.open_passive_socket()
+            elif command == 'STOR':
+                self.store(argument)
+            else:
+                self.reply('502 command not implemented')
+
+    def open_passive_socket(self):
+        if self.passive_socket is not None:
+            self.passive_socket.close()
+        self.passive_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.passive_socket.bind((self.server.server_address[0], 0))
+        self.passive_socket.listen(1)
+
+        host, port = self.passive_socket.getsockname()
+        self.reply(f"227 entering passive mode ({host.replace('.', ',')},{port >> 8},{port & 0xff})")
+
+    def store(self, file_name):
+        if self.passive_socket is None:
+            self.reply('425 use PASV first')
+            return
+
+        self.reply('150 opening data connection')
+        data_connection, _ = self.passive_socket.accept()
+        chunks = []
+        with data_connection:
+            while True:
+                chunk = data_connection.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        self.passive_socket.close()
+        self.passive_socket = None
+
+        self.server.ftp_server.received(os.path.basename(file_name), b''.join(chunks))
+        self.reply('226 transfer complete')
+
+class LocalFTPServer:
+    def __init__(self, host='127.0.0.1', port=0, user='user', password='password', directory=None, on_upload=None):
+        self.user = user
+        self.password = password
+
+        # uploaded files are kept in memory and optionally written to a directory
+        self.directory = directory
+        self.files = {}
+        self.uploads = []
+        self.commands = []
+        self.on_upload = on_upload
+        self.sessions = set()
+
+        self.server = socketserver.ThreadingTCPServer((host, port), FTPSessionHandler, bind_and_activate=False)
+        self.server.daemon_threads = True
+        self.server.allow_reuse_address = True
+        self.server.server_bind()
+        self.server.server_activate()
+        self.server.ftp_server = self
+
+        self.host, self.port = self.server.server_address
+        self.thread = None
+
+    def received(self, file_name, payload):
+        self.files[file_name] = payload
+        self.uploads.append(file_name)
+
+        if self.directory is not None:
+            with open(os.path.join(self.directory, file_name), 'wb') as file:
+                file.write(payload)
+
+        if self.on_upload is not None:
+            self.on_upload(file_name, payload)
+
+    def drop_sessions(self):
+        # cut every open control connection, like a server restart or a network drop
+        for session in list(self.sessions):
+            try:
+                session.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.drop_sessions()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
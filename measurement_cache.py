@@ -0,0 +1,93 @@
+import csv
+import time
+
+import numpy as np
+
+# count statistics (shots, mean, sum of squared deviations) of every integer setpoint measured recently. the actuator values
+# are rounded and clipped to small windows so the optimizer often comes back to a setpoint it measured before, and the laser
+# drifts, so an entry is dropped max_age seconds after its first shot and the setpoint is measured from scratch
+class MeasurementCache:
+    def __init__(self, max_age=300.0, clock=time.time):
+        self.max_age = max_age
+        self.clock = clock
+
+        # setpoint (focus, order2, order3 or every optimized parameter) -> [shots, mean, m2, first shot time, last shot time]
+        self.entries = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, setpoint):
+        return tuple(int(value) for value in setpoint)
+
+    def add(self, setpoint, shots, mean, m2=0.0, now=None):
+        # merge the statistics of new shots into the entry (parallel welford update)
+        if shots <= 0:
+            return
+        now = self.clock() if now is None else now
+        self.evict(now)
+
+        key = self.key(setpoint)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.entries[key] = [shots, float(mean), float(m2), now, now]
+            return
+
+        total = entry[0] + shots
+        delta = mean - entry[1]
+        entry[1] += delta * shots / total
+        entry[2] += m2 + delta ** 2 * entry[0] * shots / total
+        entry[0] = total
+        entry[4] = now
+
+    def get(self, setpoint, now=None):
+        # (shots, mean, m2) of the setpoint, None when it was not measured within max_age
+        now = self.clock() if now is None else now
+        key = self.key(setpoint)
+        entry = self.entries.get(key)
+        if entry is not None and now - entry[3] > self.max_age:
+            del self.entries[key]
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0], entry[1], entry[2]
+
+    def evict(self, now=None):
+        now = self.clock() if now is None else now
+        expired = [key for key, entry in self.entries.items() if now - entry[3] > self.max_age]
+        for key in expired:
+            del self.entries[key]
+        return len(expired)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def response_map(self, now=None):
+        # sparse map of the measured response: setpoints (n x parameters) and the mean, standard error, shots and age of each
+        now = self.clock() if now is None else now
+        self.evict(now)
+        entries = list(self.entries.items())
+        setpoints = np.array([key for key, _ in entries], dtype=int).reshape(len(entries), len(entries[0][0]) if entries else 0)
+        shots = np.array([entry[0] for _, entry in entries], dtype=int)
+        mean = np.array([entry[1] for _, entry in entries], dtype=float)
+        m2 = np.array([entry[2] for _, entry in entries], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            standard_error = np.where(shots > 1, np.sqrt(m2 / np.maximum(shots - 1, 1) / shots), np.nan)
+        age = np.array([now - entry[3] for _, entry in entries], dtype=float)
+        return {'setpoints': setpoints, 'mean': mean, 'standard_error': standard_error, 'shots': shots, 'age': age}
+
+    def export(self, path, parameter_names=('focus', 'order2', 'order3')):
+        # .npz keeps the arrays, anything else is written as csv (one column per parameter, mean, standard error, shots, age)
+        response_map = self.response_map()
+        if path.endswith('.npz'):
+            np.savez(path, **response_map)
+            return
+
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([*parameter_names, 'mean', 'standard_error', 'shots', 'age_s'])
+            for setpoint, mean, standard_error, shots, age in zip(response_map['setpoints'], response_map['mean'], response_map['standard_error'], response_map['shots'], response_map['age']):
+                writer.writerow([*setpoint, f'{mean:.3f}', f'{standard_error:.3f}', shots, f'{age:.1f}'])
@@ -0,0 +1,80 @@
+import numpy as np
+
+# keeps a growing (x, y) series as at most max_points points for plotting: the series is cut into buckets and every bucket is drawn
+# by its lowest and highest point, so spikes stay visible however long the run gets. points are added one at a time, when the
+# buckets run out neighbouring buckets are merged in pairs and the bucket size doubles, so an append costs O(1) amortized
+class MinMaxDecimator:
+    def __init__(self, max_points=2000):
+        # two points per bucket, an even number of buckets so they can always be merged in pairs
+        self.max_buckets = max(max_points // 4, 1) * 2
+        self.bucket_size = 1
+
+        # x and y of the lowest point, then x and y of the highest point of every complete bucket
+        self.buckets = np.empty((self.max_buckets, 4))
+        self.bucket_count = 0
+
+        # lowest and highest point of the bucket that is still filling up
+        self.partial_count = 0
+        self.partial = None
+
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, x, y):
+        if self.partial is None:
+            self.partial = [x, y, x, y]
+        elif y < self.partial[1]:
+            self.partial[0], self.partial[1] = x, y
+        elif y > self.partial[3]:
+            self.partial[2], self.partial[3] = x, y
+        self.partial_count += 1
+        self.length += 1
+
+        if self.partial_count == self.bucket_size:
+            self.close_bucket()
+
+    def extend(self, xs, ys):
+        for x, y in zip(xs, ys):
+            self.append(x, y)
+
+    def close_bucket(self):
+        self.buckets[self.bucket_count] = self.partial
+        self.bucket_count += 1
+        self.partial_count = 0
+        self.partial = None
+
+        if self.bucket_count == self.max_buckets:
+            self.merge_buckets()
+
+    def merge_buckets(self):
+        pairs = self.buckets.reshape(self.max_buckets // 2, 2, 4)
+        lower = np.argmin(pairs[:, :, 1], axis=1)
+        higher = np.argmax(pairs[:, :, 3], axis=1)
+        rows = np.arange(len(pairs))
+
+        merged = np.empty((len(pairs), 4))
+        merged[:, :2] = pairs[rows, lower, :2]
+        merged[:, 2:] = pairs[rows, higher, 2:]
+
+        self.buckets[:len(pairs)] = merged
+        self.bucket_count = len(pairs)
+        self.bucket_size *= 2
+
+    def data(self):
+        buckets = self.buckets[:self.bucket_count]
+        if self.partial is not None:
+            buckets = np.vstack((buckets, self.partial))
+
+        if self.bucket_size == 1 and self.partial is None:
+            # nothing has been decimated yet, every bucket is a single point
+            x, y = buckets[:, 0], buckets[:, 1]
+        else:
+            # the two extremes of a bucket in the order they were measured
+            low_first = buckets[:, 0] <= buckets[:, 2]
+            first = np.where(low_first[:, None], buckets[:, :2], buckets[:, 2:])
+            second = np.where(low_first[:, None], buckets[:, 2:], buckets[:, :2])
+            points = np.stack((first, second), axis=1).reshape(-1, 2)
+            x, y = points[:, 0], points[:, 1]
+        return x, y
@@ -0,0 +1,712 @@
+import os
+import sys
+import time
+import argparse
+import functools
+
+# watchdog and cv2 (frame_processing, dark_calibration) are only imported when the engine starts, tools that only need the
+# optimizer or the parameter files import this module without them (see import_benchmark.py)
+from frame_pipeline import FramePipeline
+from frame_quality import FrameStatistics, calc_frame_statistics
+from image_index import ImageIndex
+from write_completion import WriteCompletionTracker
+from actuator_upload import FTPConnection, ActuatorUploader
+from actuator_commands import ActuatorCommandQueue
+from optimizer_core import BetatronOptimizer, DEFAULT_MIRROR_RANGE
+from setpoint_association import ActuationLog, acquisition_time
+from stage_timing import StageTimer, SamplingProfiler
+from run_journal import RunJournal, read_journal, journal_header, restore_optimizer, changed_settings
+
+# the txt files the code adjusts and uploads
+MIRROR_FILE_PATH = r'dm_parameters.txt'
+DISPERSION_FILE_PATH = r'dazzler_parameters.txt'
+
+# local range and global limits of the deformable mirror actuators, one 'range lower upper' line per actuator in the order of
+# dm_parameters.txt (optional, every actuator is moved by at most +-20 within +-200 without it)
+MIRROR_RANGES_PATH = r'dm_ranges.txt'
+
+# one line per image group (setpoint, mean count and the images it was taken from), used to replay runs offline
+PARAMETER_LOG_PATH = r'parameter_log.csv'
+
+# one line per applied setpoint (time the files were written and uploaded, setpoint generation, focus, order2, order3)
+ACTUATION_LOG_PATH = r'actuation_log.csv'
+
+# fixed-width binary records of every frame count and image group, a run can be resumed from it
+JOURNAL_PATH = r'run_journal.bin'
+
+# open and read the txt files and read the initial values, a missing, empty or malformed file raises a ValueError naming it
+def read_parameter_files(mirror_file_path=MIRROR_FILE_PATH, dispersion_file_path=DISPERSION_FILE_PATH):
+    values = []
+    for path, parse in ((mirror_file_path, parse_mirror_parameters), (dispersion_file_path, parse_dispersion_parameters)):
+        try:
+            with open(path, 'r') as file:
+                values.append(parse(file.read()))
+        except (OSError, ValueError) as e:
+            raise ValueError(f'{path}: {e}') from e
+    return tuple(values)
+
+def parse_mirror_parameters(content):
+    # one integer per actuator, the first one is the focus
+    values = content.split()
+    if not values:
+        raise ValueError('no actuator values (the first one is the focus)')
+    try:
+        return list(map(int, values))
+    except ValueError:
+        raise ValueError(f'the actuator values have to be integers, got {content.strip()!r}') from None
+
+def parse_dispersion_parameters(content):
+    # 'order2 = value' and 'order3 = value' lines in any order, 0 is the key for 'order2' and 1 the key for 'order3'
+    values = {}
+    for line in content.splitlines():
+        if line.strip():
+            name, separator, value = line.partition('=')
+            try:
+                values[name.strip()] = int(value.strip())
+            except ValueError:
+                raise ValueError(f'expected "order2 = value" lines, got {line.strip()!r}') from None
+    missing = [name for name in ('order2', 'order3') if name not in values]
+    if missing:
+        raise ValueError(f'no {" or ".join(missing)} value')
+    return {0: values['order2'], 1: values['order3']}
+
+def parse_mirror_ranges(content):
+    # 'range lower upper' per actuator, integers with a positive range and lower < upper
+    ranges = []
+    for line in content.splitlines():
+        if line.strip():
+            try:
+                actuator_range, lower, upper = map(int, line.split())
+            except ValueError:
+                raise ValueError(f'expected "range lower upper" lines of integers, got {line.strip()!r}') from None
+            if actuator_range <= 0 or lower >= upper:
+                raise ValueError(f'the range has to be positive and lower below upper, got {line.strip()!r}')
+            ranges.append((actuator_range, lower, upper))
+    return ranges
+
+# the ranges of the actuators, or the defaults when there is no ranges file. every optimized actuator has to start
+# within its limits, the optimizer would otherwise move it there in its first step
+def read_mirror_ranges(mirror_values, mirror_actuators, mirror_ranges_path=MIRROR_RANGES_PATH):
+    mirror_ranges = None
+    if mirror_ranges_path is not None and os.path.exists(mirror_ranges_path):
+        try:
+            with open(mirror_ranges_path, 'r') as file:
+                mirror_ranges = parse_mirror_ranges(file.read())
+        except (OSError, ValueError) as e:
+            raise ValueError(f'{mirror_ranges_path}: {e}') from e
+        if len(mirror_ranges) != len(mirror_values):
+            raise ValueError(f'{mirror_ranges_path}: {len(mirror_ranges)} actuator ranges for {len(mirror_values)} actuators')
+
+    for index in mirror_actuators:
+        _, lower, upper = mirror_ranges[index] if mirror_ranges is not None else DEFAULT_MIRROR_RANGE
+        if not lower <= mirror_values[index] <= upper:
+            name = 'the focus' if index == 0 else f'actuator {index}'
+            raise ValueError(f'{name} is {mirror_values[index]}, outside its limits {lower}..{upper} (set them in {mirror_ranges_path})')
+    return mirror_ranges
+
+# the engine with its initial setpoint from the parameter files, validated in one step when the app is built
+def engine_from_parameter_files(mirror_file_path=MIRROR_FILE_PATH, dispersion_file_path=DISPERSION_FILE_PATH, all_actuators=False, mirror_ranges_path=MIRROR_RANGES_PATH):
+    mirror_values, dispersion_values = read_parameter_files(mirror_file_path, dispersion_file_path)
+    mirror_actuators = range(len(mirror_values)) if all_actuators else [0]
+    mirror_ranges = read_mirror_ranges(mirror_values, mirror_actuators, mirror_ranges_path)
+    engine = OptimizationEngine(mirror_values, dispersion_values, mirror_actuators, mirror_ranges)
+    engine.MIRROR_FILE_PATH = mirror_file_path
+    engine.DISPERSION_FILE_PATH = dispersion_file_path
+    return engine
+
+# text content of the txt files, shared by the file writes and the FTP upload
+def format_mirror_parameters(mirror_values):
+    return ' '.join(map(str, mirror_values))
+
+def format_dispersion_parameters(dispersion_values):
+    return f'order2 = {dispersion_values[0]}\norder3 = {dispersion_values[1]}\n'
+
+# the optimization loop without any GUI: watches the image directory, reduces the frames, moves the setpoint,
+# writes and uploads the parameter files and publishes its state to subscribers (the live plot, a socket, ...)
+class OptimizationEngine:
+    def __init__(self, mirror_values, dispersion_values, mirror_actuators=None, mirror_ranges=None):
+        # the optimization itself (image groups, histories, optimizer modes), it moves mirror_values and dispersion_values in place,
+        # mirror_actuators are the deformable mirror actuators it optimizes (only the focus by default) within mirror_ranges
+        self.mirror_values = mirror_values
+        self.dispersion_values = dispersion_values
+        self.optimizer = BetatronOptimizer(mirror_values, dispersion_values, mirror_actuators, mirror_ranges)
+
+        # images of the current image group, for the parameter log
+        self.group_image_paths = []
+
+        # image path (should match to path specified in SpinView)
+        self.IMG_PATH = r'images'
+
+        # files written after every image group
+        self.MIRROR_FILE_PATH = MIRROR_FILE_PATH
+        self.DISPERSION_FILE_PATH = DISPERSION_FILE_PATH
+        self.PARAMETER_LOG_PATH = PARAMETER_LOG_PATH
+        self.ACTUATION_LOG_PATH = ACTUATION_LOG_PATH
+
+        # every frame count and image group is appended to the journal (None turns it off), resume_run continues the run
+        # recorded in it instead of starting a new one (an old journal is then renamed with its modification time)
+        self.JOURNAL_PATH = JOURNAL_PATH
+        self.resume_run = False
+        self.journal_fsync = False
+        self.journal = None
+        self.resumed = False
+
+        # the measured counts by setpoint (the optimizer's measurement cache) are written here on stop, .npz or csv
+        self.RESPONSE_MAP_PATH = None
+
+        # dark frame and hot pixel mask (dark_calibration.py) the frames are reduced with, None keeps the median blur
+        self.DARK_CALIBRATION_PATH = None
+
+        # every frame is reduced to its count and its quality statistics (frame_quality.py), frames with more than
+        # max_saturated_fraction of their pixels at saturation_level (None is the top of the frame's dtype) are dropped and
+        # the optimizer leaves the outliers of every image group out of its count (not with the dark calibration)
+        self.frame_statistics = True
+        self.saturation_level = None
+        self.max_saturated_fraction = 0.001
+        self.saturated_frames = 0
+
+        # number of workers decoding and reducing frames concurrently (threads by default, processes optional)
+        self.frame_pool_workers = 4
+        self.frame_pool_use_processes = False
+
+        # bounds of the pipeline queues: frames waiting to be reduced (the oldest are dropped when full), frames being reduced
+        # and reduced frames waiting for the optimizer (the reducers wait when full)
+        self.detection_queue_size = 256
+        self.max_frames_in_flight = 8
+        self.aggregation_queue_size = 64
+
+        # file events are collected and dispatched together every event_coalesce_interval seconds, a frame is handed on once
+        # it is completely written (closed by the camera, a complete tiff, or its size did not change for write_settle_time)
+        self.event_coalesce_interval = 0.01
+        self.write_settle_time = 0.05
+
+        # frames detected before the last setpoint change were taken at the old setpoint and are dropped
+        self.drop_stale_frames = True
+        self.setpoint_generation = 0
+        self.stale_frames = 0
+
+        # frames only count toward the image group when they were taken at least settle_delay seconds after the current
+        # setpoint was applied, the acquisition time is the file time ('mtime') or the DateTime the camera wrote into the tiff ('tiff')
+        self.settle_delay = 0.0
+        self.acquisition_time_source = 'mtime'
+        self.actuation_log = None
+        self.unsettled_frames = 0
+
+        # the setpoint may never be applied (its write or upload failed), it is sent again right away when a device did not
+        # acknowledge it and after max_unsettled_frames frames in a row that were not taken at it, whatever the reason
+        self.max_unsettled_frames = 50
+        self.unsettled_in_a_row = 0
+        self.setpoint_resends = 0
+
+        # seconds from detecting the last frame of a group to handing it to the optimizer
+        self.last_frame_latency = None
+
+        # ftp login of the mirror computer
+        self.MIRROR_HOST = "192.168.200.3"
+        self.MIRROR_USER = "Utilisateur"
+        self.MIRROR_PASSWORD = "alls"
+
+        # ftp login of the dazzler computer
+        self.DAZZLER_HOST = "192.168.58.7"
+        self.DAZZLER_USER = "fastlite"
+        self.DAZZLER_PASSWORD = "fastlite"
+
+        # the ftp sessions are opened on the first upload and then kept alive (NOOP every FTP_KEEPALIVE_INTERVAL seconds)
+        self.MIRROR_PORT = 21
+        self.DAZZLER_PORT = 21
+        self.FTP_KEEPALIVE_INTERVAL = 30
+        self.actuator_uploader = None
+
+        # after the algorithm adjusted the values and wrote them to the txt files, send them to the mirror and dazzler computers
+        self.upload_enabled = False
+
+        # setpoints are handed to the actuators as commands, only the newest one is applied and only the parameter files
+        # that changed are written and uploaded. a setpoint equal to the last one sent is not sent again, its frames stay
+        # valid, unless the last command failed on a device
+        self.actuator_commands = ActuatorCommandQueue(self.apply_parameters)
+        self.commanded_setpoint = self.optimizer.current_setpoint()
+        self.unchanged_setpoints = 0
+
+        # called with a state dict after every image group, from the optimizer thread, so they have to return quickly
+        self.subscribers = []
+
+        # latency of every stage of the hot path (rolling p50/p95/p99, summary printed every timing_summary_interval seconds),
+        # every measurement is also kept and exported on stop when TIMING_TRACE_PATH is set (.json chrome trace, else csv)
+        self.timing_summary_interval = 30.0
+        self.TIMING_TRACE_PATH = None
+        self.timing_trace_maxlen = 1000000
+        self.timer = StageTimer(summary_interval=self.timing_summary_interval)
+
+        # sample the stacks of all threads for this many image groups after start, written to PROFILE_PATH as collapsed stacks
+        self.profile_image_groups = 0
+        self.PROFILE_PATH = r'profile_stacks.txt'
+        self.profiler = None
+        self.profile_last_group = None
+
+        self.image_index = None
+        self.frame_pipeline = None
+        self.write_tracker = None
+        self.file_observer = None
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def start(self):
+        self.timer = StageTimer(trace_maxlen=self.timing_trace_maxlen if self.TIMING_TRACE_PATH else 0, summary_interval=self.timing_summary_interval)
+
+        # setup tracking for new images, the index is built once here and then kept up to date by the observer events
+        print("Waiting for images ...")
+        self.image_index = ImageIndex(self.IMG_PATH)
+        self.image_index.scan()
+
+        if self.JOURNAL_PATH:
+            self.open_journal()
+
+        self.actuation_log = ActuationLog(self.settle_delay, self.ACTUATION_LOG_PATH)
+        self.actuator_commands.timer = self.timer
+        self.commanded_setpoint = self.optimizer.current_setpoint()
+        if self.resumed:
+            # the parameter files may be older than the journal, the restored setpoint is applied again
+            self.actuator_commands.put(self.parameter_texts())
+        else:
+            # the initial values were in place before the engine started
+            self.actuator_commands.mark_applied(self.parameter_texts())
+            self.actuation_log.record(self.setpoint_generation, self.optimizer.current_setpoint(), applied_time=0.0)
+
+        # detection -> decode/reduce -> optimizer, the counts come back in acquisition order on the pipeline's aggregation thread
+        # the reduction steps are timed with thread workers, process workers cannot record on this process' timer
+        from frame_processing import calc_count_per_image
+        reduce_function = calc_count_per_image
+        if self.frame_statistics:
+            reduce_function = functools.partial(calc_frame_statistics, saturation_level=self.saturation_level)
+        if self.DARK_CALIBRATION_PATH:
+            # masked, dark-subtracted mean in place of the median blur
+            from dark_calibration import load_calibration
+            reduce_function = load_calibration(self.DARK_CALIBRATION_PATH).count
+        if not self.frame_pool_use_processes:
+            reduce_function = functools.partial(reduce_function, timer=self.timer)
+        self.frame_pipeline = FramePipeline(
+            self.process_frame,
+            reduce_function=reduce_function,
+            max_workers=self.frame_pool_workers,
+            use_processes=self.frame_pool_use_processes,
+            detection_queue_size=self.detection_queue_size,
+            aggregation_queue_size=self.aggregation_queue_size,
+            max_in_flight=self.max_frames_in_flight,
+            tag_function=lambda: self.setpoint_generation,
+            timestamp_function=lambda image_path: acquisition_time(image_path, self.acquisition_time_source),
+            timer=self.timer,
+        )
+
+        # the parameter files are written and uploaded on their own thread, only the newest setpoint is applied
+        self.actuator_commands.start()
+
+        self.write_tracker = WriteCompletionTracker(self.process_images, interval=self.event_coalesce_interval, settle_time=self.write_settle_time)
+        self.write_tracker.start()
+        from watchdog.observers import Observer
+        from image_handler import ImageHandler
+        self.image_handler = ImageHandler(self.write_tracker, self.image_index)
+        self.file_observer = Observer()
+        self.file_observer.schedule(self.image_handler, path=self.IMG_PATH, recursive=False)
+        self.file_observer.start()
+
+        if self.profile_image_groups:
+            self.profiler = SamplingProfiler()
+            self.profile_last_group = self.optimizer.image_groups_processed + self.profile_image_groups
+            self.profiler.start()
+
+    def open_journal(self):
+        if self.resume_run and os.path.exists(self.JOURNAL_PATH):
+            self.resume()
+            return
+
+        if os.path.exists(self.JOURNAL_PATH):
+            root, extension = os.path.splitext(self.JOURNAL_PATH)
+            os.replace(self.JOURNAL_PATH, f'{root}.{int(os.path.getmtime(self.JOURNAL_PATH))}{extension}')
+        self.journal = RunJournal(self.JOURNAL_PATH, journal_header(self.optimizer), fsync=self.journal_fsync)
+
+    def resume(self):
+        # rebuild the optimizer from the journal, then keep appending to it
+        start = time.perf_counter()
+        header, records = read_journal(self.JOURNAL_PATH)
+
+        # the run continues with the settings it was started with, not the ones given now
+        for name, journal_value, value in changed_settings(header, self.optimizer):
+            print(f"Warning: the journal was written with {name} {journal_value}, the resumed run keeps it in place of {value}")
+        restore_optimizer(self.optimizer, header, records)
+        del records
+        self.journal = RunJournal(self.JOURNAL_PATH, fsync=self.journal_fsync)
+        self.resumed = True
+        self.timer.record('resume', time.perf_counter() - start)
+
+        print(f"Resumed run from {self.JOURNAL_PATH} in {(time.perf_counter() - start) * 1e3:.1f} ms: {self.optimizer.image_groups_processed} image groups, {self.optimizer.images_processed} frames")
+        print(f"Current values are: {self.optimizer.describe(self.optimizer.setpoint)}")
+
+    def stop_profiler(self):
+        self.profiler.stop()
+        self.profiler.write(self.PROFILE_PATH)
+        print(f"Wrote {self.profiler.samples} profiler samples to {self.PROFILE_PATH}")
+        self.profiler = None
+
+    def stop(self):
+        if self.file_observer is not None:
+            self.file_observer.stop()
+            self.file_observer.join()
+            self.file_observer = None
+
+        if self.write_tracker is not None:
+            self.write_tracker.stop()
+            self.write_tracker = None
+
+        if self.frame_pipeline is not None:
+            self.frame_pipeline.shutdown()
+            self.frame_pipeline = None
+
+        self.actuator_commands.close()
+
+        if self.actuator_uploader is not None:
+            self.actuator_uploader.close()
+            self.actuator_uploader = None
+
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+        if self.RESPONSE_MAP_PATH and self.optimizer.measurement_cache is not None:
+            self.optimizer.measurement_cache.export(self.RESPONSE_MAP_PATH, self.optimizer.parameter_names)
+
+        if self.profiler is not None:
+            self.stop_profiler()
+
+        if self.TIMING_TRACE_PATH:
+            self.timer.export(self.TIMING_TRACE_PATH)
+        print(self.timer.summary_text())
+
+    # method used to send the new values to the mirror and dazzler computers via FTP
+    def upload_files(self, parameters=None, devices=('mirror', 'dazzler')):
+
+        # open persistent sessions to both computers the first time we upload
+        if self.actuator_uploader is None:
+            self.actuator_uploader = ActuatorUploader([
+                FTPConnection('mirror', self.MIRROR_HOST, self.MIRROR_USER, self.MIRROR_PASSWORD, port=self.MIRROR_PORT),
+                FTPConnection('dazzler', self.DAZZLER_HOST, self.DAZZLER_USER, self.DAZZLER_PASSWORD, port=self.DAZZLER_PORT),
+            ], keepalive_interval=self.FTP_KEEPALIVE_INTERVAL)
+
+        # send the values from memory to both computers at the same time
+        if parameters is None:
+            parameters = self.parameter_texts()
+        file_paths = {'mirror': self.MIRROR_FILE_PATH, 'dazzler': self.DISPERSION_FILE_PATH}
+        return self.actuator_uploader.upload({device: (os.path.basename(file_paths[device]), parameters[device].encode()) for device in devices})
+
+    # text of both parameter files, taken on the optimizer thread so the actuation thread never reads values that are being updated
+    def parameter_texts(self):
+        return {
+            'generation': self.setpoint_generation,
+            'setpoint': [int(value) for value in self.optimizer.current_setpoint()],
+            'mirror': format_mirror_parameters(self.mirror_values),
+            'dazzler': format_dispersion_parameters(self.dispersion_values),
+        }
+
+    # writes (and uploads) the parameter files of devices, the ones that changed since the last applied setpoint, and
+    # returns the time every device acknowledged its file (None when its upload failed)
+    def apply_parameters(self, parameters, devices=('mirror', 'dazzler')):
+        # write values to text files
+        file_paths = {'mirror': self.MIRROR_FILE_PATH, 'dazzler': self.DISPERSION_FILE_PATH}
+        with self.timer.time('file_write'):
+            for device in devices:
+                with open(file_paths[device], 'w') as file:
+                    file.write(parameters[device])
+        acknowledged = dict.fromkeys(devices, time.time())
+
+        # after the algorithm adjusted the value and wrote it to the txt, send new txt to deformable mirror computer
+        if self.upload_enabled and devices:
+            with self.timer.time('upload'):
+                results = self.upload_files(parameters, devices)
+            acknowledged = {device: self.actuator_uploader.ack_times[device] if results[device] else None for device in devices}
+
+        # from now on frames are taken at the new setpoint (once the actuators settled)
+        if self.actuation_log is not None:
+            self.actuation_log.record(parameters['generation'], parameters['setpoint'])
+        return acknowledged
+
+    def process_images(self, new_images):
+        new_images = [image_path for image_path in new_images if os.path.exists(image_path)]
+
+        # sort by the key the index gave each image when it was first seen (no stat per sort)
+        new_images.sort(key=self.image_index.order_key)
+
+        # hand the new images to the pipeline, this never blocks the file watcher
+        self.frame_pipeline.submit(new_images)
+
+    def process_frame(self, frame, img_mean_count):
+        if self.drop_stale_frames and frame['tag'] is not None and frame['tag'] < self.setpoint_generation:
+            self.stale_frames += 1
+            return
+
+        # frames taken before the current setpoint was applied and settled belong to an older setpoint
+        if self.actuation_log is not None and frame.get('acquired') is not None:
+            if self.actuation_log.generation_at(frame['acquired']) != self.setpoint_generation:
+                self.unsettled_frames += 1
+                self.unsettled_in_a_row += 1
+                if self.actuator_commands.needs_retry() and not self.actuator_commands.depth():
+                    self.resend_setpoint('a device did not acknowledge it')
+                elif self.unsettled_in_a_row >= self.max_unsettled_frames:
+                    self.resend_setpoint(f'{self.unsettled_in_a_row} frames in a row were taken before it was applied and settled')
+                return
+            self.unsettled_in_a_row = 0
+
+        # misfired shots that saturated the phosphor never reach the image group, the optimizer judges the others
+        quality = None
+        if isinstance(img_mean_count, FrameStatistics):
+            if img_mean_count.saturated_fraction > self.max_saturated_fraction:
+                self.saturated_frames += 1
+                return
+            img_mean_count, quality = img_mean_count.count, (img_mean_count.background, img_mean_count.spread)
+        self.last_frame_latency = time.monotonic() - frame['detected']
+        self.process_image_count(frame['path'], img_mean_count, quality)
+
+    def resend_setpoint(self, reason):
+        # the same generation, frames count as soon as it is applied and settled
+        print(f"Error: setpoint generation {self.setpoint_generation} is sent again, {reason}")
+        self.setpoint_resends += 1
+        self.unsettled_in_a_row = 0
+        self.actuator_commands.put(self.parameter_texts())
+
+    def process_image_count(self, image_path, img_mean_count, quality=None):
+        measured_setpoint = self.optimizer.current_setpoint()
+        self.group_image_paths.append(image_path)
+
+        # the optimizer moves the setpoint once an image group is complete
+        group_completed, moved, new_derivative = self.optimizer_step(self.optimizer.add_image_count, img_mean_count, quality)
+
+        if self.journal is not None:
+            with self.timer.time('journal'):
+                self.journal.append_frame(self.optimizer.images_processed, self.optimizer.image_groups_processed, img_mean_count, measured_setpoint, quality)
+
+        if not group_completed:
+            return
+        reports = [self.image_group_completed(measured_setpoint, moved, new_derivative)]
+
+        # setpoints measured within the cache age are not measured again, the optimizer moves on with their cached count
+        while True:
+            measured_setpoint = self.optimizer.current_setpoint()
+            reused, moved, new_derivative = self.optimizer_step(self.optimizer.reuse_cached_measurement)
+            if not reused:
+                break
+            reports.append(self.image_group_completed(measured_setpoint, moved, new_derivative))
+
+        # frames detected from now on belong to the new setpoint, a setpoint that did not change (every step was under one
+        # unit) is not sent again and the frames already taken at it stay valid, unless a device did not acknowledge it
+        if self.optimizer.current_setpoint() != self.commanded_setpoint or self.actuator_commands.needs_retry():
+            self.commanded_setpoint = self.optimizer.current_setpoint()
+            self.setpoint_generation += 1
+
+            # write the new values to the text files (and upload them) on the actuation thread
+            self.actuator_commands.put(self.parameter_texts())
+        else:
+            self.unchanged_setpoints += 1
+
+        for log_line, state in reports:
+            self.report_image_group(log_line, state)
+
+        # reset variables for next optimization round
+        self.optimizer.reset_image_group()
+
+    # runs one optimizer call, with which parameters got a new value and whether it computed new derivatives
+    def optimizer_step(self, function, *args):
+        # derivatives are only recorded on some image groups, the state only carries new ones
+        derivative_count = self.optimizer.der_iteration_data.count
+
+        with self.timer.time('optimizer'):
+            result = function(*args)
+        # the parameters that got a new value, the journal records which ones did
+        moved = self.optimizer.moved.copy()
+        return result, moved, self.optimizer.der_iteration_data.count > derivative_count
+
+    # journals the image group the optimizer just completed, its parameter log line and state are reported after the new
+    # setpoint was handed to the actuators
+    def image_group_completed(self, measured_setpoint, moved, new_derivative):
+        if self.journal is not None:
+            with self.timer.time('journal'):
+                self.journal_group(measured_setpoint, moved, new_derivative)
+
+        log_line = f"{time.time():.3f},{self.optimizer.image_groups_processed},{','.join(map(str, measured_setpoint))},{self.optimizer.count_history[-1]},{';'.join(self.group_image_paths)}\n"
+        state = self.state(new_derivative)
+
+        # the frame that completed the group (None when it came from the measurement cache), to time the loop end to end
+        state['last_image'] = self.group_image_paths[-1] if self.group_image_paths else None
+        self.group_image_paths = []
+        return log_line, state
+
+    def report_image_group(self, log_line, state):
+        # log the image group so the run can be replayed offline
+        with self.timer.time('parameter_log'), open(self.PARAMETER_LOG_PATH, 'a') as file:
+            file.write(log_line)
+
+        # print the latest mean count (helps track system)
+        if state['shots']:
+            print(f"Mean count for last {state['shots']} images: {state['count']:.2f}")
+        else:
+            print(f"Setpoint measured in the last {self.optimizer.measurement_cache.max_age:.0f} s, cached mean count: {state['count']:.2f}")
+        if state['standard_error'] is not None:
+            print(f"Standard error of the mean: {state['standard_error']:.2f}")
+
+        # report how many frames are waiting in every stage, dropped frames mean frames arrive faster than they are processed
+        queue_depths = state['queue_depths']
+        if queue_depths:
+            print(f"Pipeline queue depths: {', '.join(f'{stage} {depth}' for stage, depth in queue_depths.items())}")
+        if state['dropped_frames']:
+            print(f"Pipeline dropped {state['dropped_frames']} frames, frames arrive faster than they are processed")
+        if self.stale_frames:
+            print(f"Dropped {self.stale_frames} frames detected before the last setpoint change")
+        if self.unsettled_frames:
+            print(f"Dropped {self.unsettled_frames} frames taken before the setpoint was applied and settled")
+        if self.setpoint_resends:
+            print(f"Sent {self.setpoint_resends} setpoints again that were not applied")
+
+        # print the current parameter values which resulted in the brightness above
+        print(f"Current values are: {self.optimizer.describe(state['setpoint'])}")
+
+        with self.timer.time('publish'):
+            self.publish(state)
+        self.timer.maybe_print_summary()
+
+        if self.profiler is not None and state['image_group'] >= self.profile_last_group:
+            self.stop_profiler()
+        print('-------------')
+
+    # the image group goes into the journal before its new setpoint is applied
+    def journal_group(self, measured_setpoint, moved, new_derivative):
+        optimizer = self.optimizer
+        derivatives = None
+        total_gradient = float('nan')
+        der_iteration = -1
+        if new_derivative:
+            derivatives = optimizer.derivative_history[-1]
+            total_gradient = optimizer.total_gradient_history[-1]
+            der_iteration = optimizer.der_iteration_data[-1]
+
+        self.journal.append_group(
+            optimizer.images_processed, optimizer.image_groups_processed, optimizer.count_history[-1],
+            measured_setpoint, optimizer.current_setpoint(), moved,
+            derivatives=derivatives, total_gradient=total_gradient, der_iteration=der_iteration,
+            theta=optimizer.spsa.theta if optimizer.spsa is not None else None,
+            converged=optimizer.converged,
+            # an image group taken from the measurement cache has no frames
+            kept_frames=optimizer.group_kept if optimizer.shots_per_setpoint[-1] else None,
+        )
+
+    # plain python values only, so the state can be queued to the GUI thread or sent over a socket as json
+    def state(self, new_derivative=False):
+        state = {
+            'time': time.time(),
+            'image_group': self.optimizer.image_groups_processed,
+            'iteration': int(self.optimizer.iteration_data[-1]),
+            'count': float(self.optimizer.count_history[-1]),
+            'shots': int(self.optimizer.shots_per_setpoint[-1]),
+            'standard_error': float(self.optimizer.group_standard_error) if self.optimizer.adaptive_image_group and self.optimizer.group_standard_error is not None else None,
+            'focus': int(self.mirror_values[0]),
+            'second_dispersion': int(self.dispersion_values[0]),
+            'third_dispersion': int(self.dispersion_values[1]),
+            'setpoint': self.optimizer.current_setpoint(),
+            'converged': self.optimizer.converged,
+            'queue_depths': self.queue_depths(),
+            'dropped_frames': self.frame_pipeline.dropped_frames() if self.frame_pipeline is not None else 0,
+            'stale_frames': self.stale_frames,
+            'unsettled_frames': self.unsettled_frames,
+            'setpoint_resends': self.setpoint_resends,
+            'latency': self.last_frame_latency,
+        }
+        if new_derivative:
+            state['derivative'] = {
+                'iteration': int(self.optimizer.der_iteration_data[-1]),
+                **dict(zip(self.optimizer.parameter_names, self.optimizer.derivative_history[-1].tolist())),
+                'total_gradient': float(self.optimizer.total_gradient_history[-1]),
+            }
+        return state
+
+    def queue_depths(self):
+        queue_depths = {}
+        if self.frame_pipeline is not None:
+            queue_depths.update(self.frame_pipeline.queue_depths())
+        queue_depths['actuation'] = self.actuator_commands.depth()
+        return queue_depths
+
+    def publish(self, state):
+        # a failing subscriber must not stop the optimization
+        for callback in list(self.subscribers):
+            try:
+                callback(state)
+            except Exception as e:
+                print(f"Error publishing state: {e}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the optimization without a GUI')
+    parser.add_argument('--images', default=None, help='directory the camera writes the images to')
+    parser.add_argument('--publish-port', type=int, help='publish the state on this local port for a live plot client')
+    parser.add_argument('--upload', action='store_true', help='upload the parameter files to the mirror and dazzler computers after every image group')
+    parser.add_argument('--timing-trace', help='write every stage timing to this file on exit (.json chrome trace, else csv)')
+    parser.add_argument('--timing-summary-interval', type=float, default=30.0, help='seconds between the printed latency summaries (0 turns them off)')
+    parser.add_argument('--profile-groups', type=int, default=0, help='sample the stacks of all threads for this many image groups')
+    parser.add_argument('--profile-path', default='profile_stacks.txt')
+    parser.add_argument('--adaptive-image-group', action='store_true', help='take frames at every setpoint until the standard error of their mean resolves the next step')
+    parser.add_argument('--cache', choices=['combine', 'reuse'], help='pool revisited setpoints with their cached shots, or reuse them without measuring')
+    parser.add_argument('--response-map', help='write the measured counts by setpoint to this file on exit (.npz, else csv)')
+    parser.add_argument('--dark-calibration', help='reduce the frames with this dark frame and hot pixel mask instead of the median blur')
+    parser.add_argument('--group-estimator', default='median_mad', choices=['median_mad', 'trimmed_mean', 'mean'], help='how the count of an image group leaves out misfired frames')
+    parser.add_argument('--journal', default=JOURNAL_PATH, help='binary journal of every frame and image group')
+    parser.add_argument('--resume', action='store_true', help='continue the run recorded in the journal')
+    parser.add_argument('--optimizer-mode', default='gradient', choices=['gradient', 'spsa', 'bayesian'], help='optimizer used after the first image group')
+    parser.add_argument('--gradient-estimator', default='finite_difference', choices=['finite_difference', 'least_squares'], help='gradient from the last two setpoints, or a least squares fit over the last ones (gradient mode)')
+    parser.add_argument('--all-actuators', action='store_true', help='optimize every deformable mirror actuator, not only the focus')
+    parser.add_argument('--actuator-ranges', default=MIRROR_RANGES_PATH, help='"range lower upper" of every deformable mirror actuator, one line each')
+    args = parser.parse_args(argv)
+
+    try:
+        engine = engine_from_parameter_files(all_actuators=args.all_actuators, mirror_ranges_path=args.actuator_ranges)
+    except ValueError as e:
+        print(f"Error reading parameter files: {e}")
+        return 1
+    if args.images:
+        engine.IMG_PATH = args.images
+    engine.upload_enabled = args.upload
+    engine.TIMING_TRACE_PATH = args.timing_trace
+    engine.timing_summary_interval = args.timing_summary_interval
+    engine.profile_image_groups = args.profile_groups
+    engine.PROFILE_PATH = args.profile_path
+    engine.JOURNAL_PATH = args.journal
+    engine.optimizer.adaptive_image_group = args.adaptive_image_group
+    engine.optimizer.cache_combine = args.cache is not None
+    engine.optimizer.cache_reuse = args.cache == 'reuse'
+    engine.RESPONSE_MAP_PATH = args.response_map
+    engine.DARK_CALIBRATION_PATH = args.dark_calibration
+    engine.optimizer.group_estimator = args.group_estimator
+    engine.optimizer.optimizer_mode = args.optimizer_mode
+    engine.optimizer.gradient_estimator = args.gradient_estimator
+    engine.resume_run = args.resume
+
+    publisher = None
+    if args.publish_port is not None:
+        from state_stream import StatePublisher
+        publisher = StatePublisher(port=args.publish_port)
+        publisher.start()
+        engine.subscribe(publisher.publish)
+        print(f"Publishing state on {publisher.host}:{publisher.port}")
+
+    engine.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.stop()
+        if publisher is not None:
+            publisher.stop()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,604 @@
+import random
+
+import numpy as np
+
+from history_buffer import HistoryBuffer
+from spsa_optimizer import SPSAOptimizer
+from local_fit import LocalLinearFit
+from bayesian_optimizer import GaussianProcessOptimizer
+from measurement_cache import MeasurementCache
+from frame_quality import robust_inliers, reference_inliers, trimmed_inliers
+
+# local range and global limits (range, lower, upper) of a deformable mirror actuator that has none given
+DEFAULT_MIRROR_RANGE = (20, -200, 200)
+
+# attributes of the focus, order2 and order3 (learning rates, bounds, initial values, histories) backed by the parameter arrays
+def parameter_property(array_name, parameter_name):
+    def get(self):
+        return getattr(self, array_name)[self.parameter_names.index(parameter_name)]
+
+    def set(self, value):
+        getattr(self, array_name)[self.parameter_names.index(parameter_name)] = value
+
+    return property(get, set)
+
+def parameter_history_property(parameter_name):
+    return property(lambda self: self.parameter_history(self.parameter_names.index(parameter_name)))
+
+def derivative_history_property(parameter_name):
+    return property(lambda self: self.derivative_history.values()[:, self.parameter_names.index(parameter_name)])
+
+# a setting of the local fit, setting it rebuilds the fit (the measurements it already holds were fit with the old model)
+def local_fit_setting(name):
+    def get(self):
+        return self.__dict__[name]
+
+    def set(self, value):
+        self.__dict__[name] = value
+        if 'fit_window' in self.__dict__ and 'fit_quadratic' in self.__dict__:
+            self.local_fit = self.new_local_fit()
+
+    return property(get, set)
+
+# the histories of the optimization process, they keep at most history_maxlen values
+HISTORY_NAMES = (
+    'count_history', 'setpoint_history', 'moved_history', 'derivative_history', 'total_gradient_history',
+    'iteration_data', 'shots_per_setpoint', 'der_iteration_data',
+)
+
+# the optimization loop without any gui, file watching or file i/o, fed one image count at a time
+class BetatronOptimizer:
+    def __init__(self, mirror_values, dispersion_values, mirror_actuators=None, mirror_ranges=None, history_maxlen=None):
+
+        # current actuator values, updated in place (mirror_values[0] is the focus, dispersion_values 0/1 are order2/order3)
+        self.mirror_values = mirror_values
+        self.dispersion_values = dispersion_values
+
+        # the optimized parameters: the deformable mirror actuators in mirror_actuators (only the focus, mirror_values[0], by
+        # default, every actuator with range(len(mirror_values))) followed by order2 and order3 of the dazzler.
+        # setpoints, bounds, learning rates and histories are arrays over these parameters
+        self.mirror_actuators = list(mirror_actuators) if mirror_actuators is not None else [0]
+        self.parameter_names = ['focus' if index == 0 else f'actuator_{index}' for index in self.mirror_actuators] + ['second_dispersion', 'third_dispersion']
+        self.dimension = len(self.parameter_names)
+        mirror_count = len(self.mirror_actuators)
+
+        # for how many images should the mean be taken for
+        self.image_group = 2
+
+        # adaptive image groups: frames are added to the group (at least min_image_group, at most max_image_group) until the
+        # standard error of its mean resolves the count change expected at the next setpoint (resolution_sigma standard errors)
+        self.adaptive_image_group = False
+        self.min_image_group = 2
+        self.max_image_group = 16
+        self.resolution_sigma = 2.0
+
+        # running mean and variance (welford) of the frames of the current image group
+        self.group_shots = 0
+        self.group_mean = 0.0
+        self.group_m2 = 0.0
+        self.group_standard_error = None
+
+        # the count of an image group is the mean of its frames without the misfired ones: 'median_mad' leaves out frames more
+        # than outlier_sigma robust standard deviations from the group median (in the count or any frame statistic, once the
+        # group has min_outlier_group frames), 'trimmed_mean' the trim_fraction lowest and highest counts, 'mean' none
+        self.group_estimator = 'median_mad'
+        self.outlier_sigma = 3.5
+        self.min_outlier_group = 4
+        self.trim_fraction = 0.25
+        self.rejected_shots = 0
+
+        # which frames of the last measured image group went into its count
+        self.group_kept = None
+
+        # a smaller group (two frames by default) can not tell which of its frames misfired, its frames are judged against the
+        # last reference_frames frames that were kept instead (once there are min_reference_frames). a group whose frames are
+        # all off is kept, the count moved with the setpoint
+        self.reference_frames = 32
+        self.min_reference_frames = 8
+        self.recent_frames = []
+
+        # counts and frame statistics (background, spread) of the frames of the current image group
+        self.group_counts = []
+        self.group_quality = []
+
+        # count statistics of the setpoints measured in the last 5 minutes (None turns the cache off). with cache_combine
+        # the shots of a revisited setpoint are pooled with the cached ones, with cache_reuse a revisited setpoint is not
+        # measured again (at most cache_reuse_limit image groups in a row are taken from the cache)
+        self.measurement_cache = MeasurementCache(max_age=300.0)
+        self.cache_combine = False
+        self.cache_reuse = False
+        self.cache_reuse_limit = 4
+        self.cached_groups_in_a_row = 0
+        self.last_measured_setpoint = None
+
+        self.mean_count_per_image_group  = 0
+        self.image_groups_dir_run_count = 0
+
+        # keep track of number of processed images and image groups
+        self.image_groups_processed = 0
+        self.images_processed = 0
+
+        self.image_group_count_sum = 0
+
+        # histories are preallocated and grow by doubling, set a maximum length to keep only the latest values (ring buffer).
+        # setting history_maxlen later rebuilds the histories with their latest values
+        self.history_maxlen = history_maxlen
+        self.count_history = HistoryBuffer(float, maxlen=self.history_maxlen)
+
+        # set learning rates for the different optimization variables
+        self.learning_rates = np.full(self.dimension, 0.1)
+
+        # optimizer used after the first image group, 'gradient' (finite differences along the last step), 'spsa' or 'bayesian'
+        self.optimizer_mode = 'gradient'
+
+        # spsa gain schedules in units of the parameter ranges: the first step moves every parameter spsa_gain times the count
+        # change per parameter range (a_0 = spsa_gain * range^2 in actuator steps), so order2 and order3 move as much as the
+        # focus relative to their ranges. spsa_a sets a instead (per parameter, in actuator steps)
+        self.spsa_A = 10
+        self.spsa_alpha = 0.602
+        self.spsa_gamma = 0.101
+        self.spsa_gain = 5e-5
+        self.spsa_a = None
+
+        # spsa perturbation sizes (rounded, at least one step)
+        self.spsa_c = np.array([2] * mirror_count + [20, 50])
+
+        # spsa has converged once, over the last spsa_convergence_updates gradient updates, the mean gradient estimate is
+        # within spsa_convergence_significance standard errors of zero for every parameter and the count stopped improving
+        self.spsa_convergence_updates = 16
+        self.spsa_convergence_significance = 2.0
+        self.spsa = None
+
+        # gaussian process settings for the bayesian mode, the length scale is a fraction of the bounded box, acquisition 'ei' or 'ucb'
+        self.gp_length_scale = 0.2
+        self.gp_noise_std = 0.1
+        self.gp_acquisition = 'ei'
+        self.gaussian_process = None
+
+        # seed for the spsa directions and the bayesian candidates (None draws a fresh one every run)
+        self.random_seed = None
+
+        # set once a convergence criterion is met (the loop keeps running, this is for tracking and benchmarks)
+        self.converged = False
+        self.shots_to_convergence = None
+
+        # initialize lists to keep track of optimization process, one row over all parameters per image group:
+        # the setpoint after the group, which parameters it moved and the derivatives (only groups that computed them)
+        self.setpoint_history = HistoryBuffer(int, maxlen=self.history_maxlen, shape=(self.dimension,))
+        self.moved_history = HistoryBuffer(bool, maxlen=self.history_maxlen, shape=(self.dimension,))
+        self.derivative_history = HistoryBuffer(float, maxlen=self.history_maxlen, shape=(self.dimension,))
+        self.total_gradient_history = HistoryBuffer(float, maxlen=self.history_maxlen)
+
+        self.iteration_data = HistoryBuffer(int, maxlen=self.history_maxlen)
+
+        # number of frames every image group took
+        self.shots_per_setpoint = HistoryBuffer(int, maxlen=self.history_maxlen)
+        self.der_iteration_data = HistoryBuffer(int, maxlen=self.history_maxlen)
+
+    # ------------ Deformable mirror and Dazzler ------------ #
+
+        # set initial values from the txt files
+        self.initial_setpoint = np.array([self.mirror_values[index] for index in self.mirror_actuators] + [self.dispersion_values[0], self.dispersion_values[1]], dtype=int)
+
+        # define global and local bounds: mirror_ranges holds (range, lower, upper) for every deformable mirror actuator (by its
+        # index in mirror_values), +-20 within +-200 for the ones it does not cover. +-500 within 30000..40000 for order2
+        # (36100 initial) and +-2000 within -30000..-25000 for order3 (-27000 initial)
+        mirror_ranges = [mirror_ranges[index] if mirror_ranges is not None and index < len(mirror_ranges) else DEFAULT_MIRROR_RANGE for index in self.mirror_actuators]
+        ranges, lower_limits, upper_limits = np.array(mirror_ranges, dtype=int).reshape(mirror_count, 3).T
+        self.parameter_ranges = np.concatenate((ranges, [500, 2000]))
+        self.lower_bounds = np.maximum(self.initial_setpoint - self.parameter_ranges, np.concatenate((lower_limits, [30000, -30000])))
+        self.upper_bounds = np.minimum(self.initial_setpoint + self.parameter_ranges, np.concatenate((upper_limits, [40000, -25000])))
+
+        # set count change tolerance under which the program will consider the case optimized
+        self.count_change_tolerance = 10
+
+        # current setpoint, and the value every parameter had before its last move (the finite differences are taken along it)
+        self.setpoint = self.initial_setpoint.copy()
+        self.previous_setpoint = self.initial_setpoint.copy()
+        self.moved = np.zeros(self.dimension, dtype=bool)
+        self.derivatives = None
+        self.total_gradient = None
+
+    # ------------ Gradient estimate ------------ #
+
+        # how the gradient mode takes its derivatives, 'finite_difference' (last two image groups) or 'least_squares'
+        self.gradient_estimator = 'finite_difference'
+
+        # least squares fit of the count over the last fit_window setpoints (weighted by the shots per image group), at least
+        # two more setpoints than the model has coefficients. the fit is rebuilt when fit_window or fit_quadratic is set
+        self.local_fit = None
+        self.fit_window = 10
+        self.fit_quadratic = False
+
+        # until the fit is ready, and for the parameters that did not move within its window (their slope can not be fit),
+        # the setpoint is probed by these steps in random directions. a fitted step goes at most fit_max_step_fraction of
+        # the parameter range, the fit only describes the count close to the setpoints it holds
+        self.fit_probe_steps = np.array([2] * mirror_count + [20, 50])
+        self.fit_max_step_fraction = 0.25
+
+        self.random_direction = [random.choice([-1, 1]) for _ in range(self.dimension)]
+
+    def set_history_maxlen(self, maxlen):
+        self.__dict__['history_maxlen'] = maxlen
+        for name in HISTORY_NAMES:
+            if name in self.__dict__:
+                self.__dict__[name] = self.__dict__[name].resized(maxlen)
+
+    history_maxlen = property(lambda self: self.__dict__['history_maxlen'], set_history_maxlen)
+
+    fit_window = local_fit_setting('fit_window')
+    fit_quadratic = local_fit_setting('fit_quadratic')
+
+    focus_learning_rate = parameter_property('learning_rates', 'focus')
+    second_dispersion_learning_rate = parameter_property('learning_rates', 'second_dispersion')
+    third_dispersion_learning_rate = parameter_property('learning_rates', 'third_dispersion')
+
+    initial_focus = parameter_property('initial_setpoint', 'focus')
+    initial_second_dispersion = parameter_property('initial_setpoint', 'second_dispersion')
+    initial_third_dispersion = parameter_property('initial_setpoint', 'third_dispersion')
+
+    FOCUS_LOWER_BOUND = parameter_property('lower_bounds', 'focus')
+    FOCUS_UPPER_BOUND = parameter_property('upper_bounds', 'focus')
+    SECOND_DISPERSION_LOWER_BOUND = parameter_property('lower_bounds', 'second_dispersion')
+    SECOND_DISPERSION_UPPER_BOUND = parameter_property('upper_bounds', 'second_dispersion')
+    THIRD_DISPERSION_LOWER_BOUND = parameter_property('lower_bounds', 'third_dispersion')
+    THIRD_DISPERSION_UPPER_BOUND = parameter_property('upper_bounds', 'third_dispersion')
+
+    focus_history = parameter_history_property('focus')
+    second_dispersion_history = parameter_history_property('second_dispersion')
+    third_dispersion_history = parameter_history_property('third_dispersion')
+
+    focus_der_history = derivative_history_property('focus')
+    second_dispersion_der_history = derivative_history_property('second_dispersion')
+    third_dispersion_der_history = derivative_history_property('third_dispersion')
+
+    # the values one parameter took: the initial value, then one value per image group that moved it
+    def parameter_history(self, index):
+        if not len(self.setpoint_history):
+            return self.initial_setpoint[index:index + 1].copy()
+        moved = self.moved_history.values()[:, index]
+        return np.concatenate(([self.initial_setpoint[index]], self.setpoint_history.values()[moved, index]))
+
+    def new_local_fit(self):
+        return LocalLinearFit(self.initial_setpoint, self.parameter_ranges, window=self.fit_window, quadratic=self.fit_quadratic)
+
+    def new_spsa(self):
+        return SPSAOptimizer(
+            self.initial_setpoint, self.lower_bounds, self.upper_bounds,
+            a=self.spsa_a if self.spsa_a is not None else self.spsa_gain * self.parameter_ranges.astype(float) ** 2 * (self.spsa_A + 1) ** self.spsa_alpha,
+            c=self.spsa_c, A=self.spsa_A, alpha=self.spsa_alpha, gamma=self.spsa_gamma,
+            seed=self.random_seed,
+        )
+
+    def new_gaussian_process(self):
+        return GaussianProcessOptimizer(
+            self.lower_bounds,
+            self.upper_bounds,
+            length_scale=self.gp_length_scale,
+            noise_std=self.gp_noise_std,
+            acquisition=self.gp_acquisition,
+            seed=self.random_seed,
+        )
+
+    # add the count of one image (and its frame statistics), returns True when it completed an image group and the setpoint was moved
+    def add_image_count(self, img_mean_count, quality=None):
+        self.img_mean_count = img_mean_count
+        self.image_group_count_sum += np.sum(self.img_mean_count)
+
+        # keep track of the times the program ran (number of images we processed)
+        self.images_processed += 1
+
+        # update the running mean and variance of the group, the frames are kept for the group count
+        count = float(np.mean(self.img_mean_count))
+        self.group_counts.append(count)
+        if quality is not None:
+            self.group_quality.append(quality)
+        self.group_shots += 1
+        delta = count - self.group_mean
+        self.group_mean += delta / self.group_shots
+        self.group_m2 += delta * (count - self.group_mean)
+
+        # conditional to check if the desired numbers of images to mean was processed
+        if not self.image_group_is_complete():
+            return False
+
+        # take the mean count of the frames of the group that are not outliers
+        shots = self.group_shots
+        kept_shots, mean_count, m2 = self.group_statistics()
+        self.rejected_shots += shots - kept_shots
+
+        if self.measurement_cache is not None:
+            cached = self.measurement_cache.get(self.setpoint)
+            self.measurement_cache.add(self.setpoint, kept_shots, mean_count, m2)
+
+            # pool the new shots with the ones taken at this setpoint before
+            if self.cache_combine and cached is not None:
+                cached_shots, cached_mean, _ = cached
+                mean_count = (cached_shots * cached_mean + kept_shots * mean_count) / (cached_shots + kept_shots)
+        self.reset_group_statistics()
+
+        self.cached_groups_in_a_row = 0
+        self.complete_image_group(mean_count, shots)
+        return True
+
+    # a setpoint measured within the cache age is not measured again, its cached count completes the next image group.
+    # returns True when it did, the optimizer then moved to a new setpoint without taking a frame
+    def reuse_cached_measurement(self):
+        if not self.cache_reuse or self.measurement_cache is None or self.image_groups_processed == 0:
+            return False
+        if self.cached_groups_in_a_row >= self.cache_reuse_limit:
+            return False
+
+        # the optimizer did not move, the setpoint is measured again
+        if self.last_measured_setpoint is not None and self.current_setpoint() == self.last_measured_setpoint:
+            return False
+
+        cached = self.measurement_cache.get(self.setpoint)
+        if cached is None or cached[0] < (self.min_image_group if self.adaptive_image_group else self.image_group):
+            return False
+
+        self.cached_groups_in_a_row += 1
+        self.complete_image_group(cached[1], 0)
+        return True
+
+    # one image group measured (shots frames, none when it came from the cache), the optimizer moves the setpoint
+    def complete_image_group(self, mean_count, shots):
+        self.mean_count_per_image_group = mean_count
+        self.last_measured_setpoint = self.current_setpoint()
+
+        # append to count_history list to keep track of count through the optimization process
+        self.count_history.append(self.mean_count_per_image_group)
+        self.shots_per_setpoint.append(shots)
+
+        # add the measurement to the local fit (before the optimizer moves the setpoint)
+        if self.gradient_estimator == 'least_squares' and shots:
+            self.local_fit.add(self.setpoint, self.mean_count_per_image_group, weight=shots)
+
+        # update count for 'images_group' processed (number of image groups processed)
+        self.image_groups_processed += 1
+        self.iteration_data.append(self.image_groups_processed)
+        self.moved = np.zeros(self.dimension, dtype=bool)
+
+        # if we are in the first time where the algorithm needs to adjust the value
+        if self.image_groups_processed == 1:
+            print('-------------')
+
+            # print to help track the evolution of the system
+            print(f"initial values are: {self.describe(self.initial_setpoint)}")
+            print(f"initial directions are: {self.describe(self.random_direction)}")
+
+            # call function to take random directions
+            if self.optimizer_mode == 'spsa':
+                self.initial_spsa_optimize()
+            elif self.optimizer_mode == 'bayesian':
+                self.initial_bayesian_optimize()
+            else:
+                self.initial_optimize()
+
+        else:
+            self.image_groups_dir_run_count += 1
+            if self.optimizer_mode == 'spsa':
+                self.spsa_optimize()
+            elif self.optimizer_mode == 'bayesian':
+                self.bayesian_optimize()
+            else:
+                self.optimize_count()
+
+        # add the new setpoint to the history, with the parameters this image group moved
+        self.setpoint_history.append(self.setpoint)
+        self.moved_history.append(self.moved)
+
+    # "focus -150, second_dispersion 36100, ..." for the printed messages
+    def describe(self, values):
+        return ', '.join(f'{name} {value}' for name, value in zip(self.parameter_names, values))
+
+    def image_group_is_complete(self):
+        if not self.adaptive_image_group:
+            return self.group_shots >= self.image_group
+        if self.group_shots < max(self.min_image_group, 2):
+            return False
+
+        # standard error of the group mean against the count change the next step is expected to make (the last change),
+        # changes below count_change_tolerance count as converged anyway so there is no need to resolve them
+        self.group_standard_error = np.sqrt(self.group_m2 / (self.group_shots - 1) / self.group_shots)
+        expected_change = np.abs(self.count_history[-1] - self.count_history[-2]) if len(self.count_history) >= 2 else 0.0
+        target = max(expected_change, self.count_change_tolerance) / self.resolution_sigma
+        return self.group_standard_error <= target or self.group_shots >= self.max_image_group
+
+    # number of frames kept, their mean count and sum of squared deviations, over the frames of the current image group
+    def group_statistics(self):
+        counts = np.array(self.group_counts)
+        keep = np.ones(len(counts), dtype=bool)
+
+        # the frame statistics only when every frame of the group has them (not the frames restored from a version 2 journal)
+        values = np.column_stack([counts, self.group_quality]) if len(self.group_quality) == len(counts) else counts[:, None]
+        if len(counts) >= self.min_outlier_group:
+            if self.group_estimator == 'median_mad':
+                keep = robust_inliers(values, self.outlier_sigma)
+            elif self.group_estimator == 'trimmed_mean':
+                keep = trimmed_inliers(counts, self.trim_fraction)
+        elif self.group_estimator != 'mean' and len(self.recent_frames) >= self.min_reference_frames:
+            reference = np.array(self.recent_frames)
+            if reference.shape[1] == values.shape[1]:
+                keep = reference_inliers(values, reference, self.outlier_sigma)
+                if not keep.any():
+                    keep[:] = True
+
+        self.recent_frames = (self.recent_frames + values[keep].tolist())[-self.reference_frames:]
+        self.group_kept = keep
+        kept = counts[keep]
+        mean_count = float(kept.mean())
+        return len(kept), mean_count, float(((kept - mean_count) ** 2).sum())
+
+    def reset_group_statistics(self):
+        self.group_shots = 0
+        self.group_mean = 0.0
+        self.group_m2 = 0.0
+        self.group_counts = []
+        self.group_quality = []
+
+    def reset_image_group(self):
+        # reset variables for next optimization round
+        self.image_group_count_sum = 0
+        self.mean_count_per_image_group  = 0
+        self.img_mean_count = 0
+        self.reset_group_statistics()
+
+    def mark_converged(self):
+        if not self.converged:
+            self.converged = True
+            self.shots_to_convergence = self.images_processed
+
+    # initial method to start optimization process
+    def initial_optimize(self):
+
+        # take random direction for each of the variables, the values have to be rounded and clipped due to physical constraints
+        new_setpoint = np.rint(np.clip(self.setpoint + np.asarray(self.random_direction[:self.dimension]), self.lower_bounds, self.upper_bounds)).astype(int)
+
+        self.moved = np.ones(self.dimension, dtype=bool)
+        self.previous_setpoint = self.setpoint.copy()
+        self.write_setpoint(new_setpoint)
+
+    def calc_derivatives(self):
+
+        if self.use_local_fit():
+            # slope of the local fit at the current setpoint, every past measurement in the window is used
+            self.derivatives = self.local_fit.gradient(self.setpoint)
+
+        else:
+            # take derivative for every parameter, along its last move
+            self.derivatives = (self.count_history[-1] - self.count_history[-2]) / (self.setpoint - self.previous_setpoint)
+
+        # add the derivatives to according history lists for plotting
+        self.derivative_history.append(self.derivatives)
+
+        # add all derivatives for different parameters
+        self.total_gradient = np.sum(self.derivatives)
+
+        # add to respective lists for plotting and tracking
+        self.total_gradient_history.append(self.total_gradient)
+        self.der_iteration_data.append(self.image_groups_dir_run_count)
+
+        return self.derivatives
+
+    # main optimization block for gradient descent
+    def optimize_count(self):
+
+        # the local fit needs measurements spread around the setpoint before its slope means anything
+        if self.gradient_estimator == 'least_squares' and not self.local_fit.is_ready():
+            self.probe_setpoint(np.ones(self.dimension, dtype=bool))
+            return
+
+        # get count derivatives for parameters
+        derivatives = self.calc_derivatives()
+        steps = self.learning_rates * derivatives
+        if self.use_local_fit():
+            max_steps = self.fit_max_step_fraction * self.parameter_ranges
+            steps = np.clip(steps, -max_steps, max_steps)
+        step_sizes = np.abs(steps)
+
+        # only parameters whose step is at least one (integer) unit move, rounded and clipped to their bounds
+        moving = step_sizes > 1
+        new_setpoint = np.where(moving, np.rint(np.clip(self.setpoint + steps, self.lower_bounds, self.upper_bounds)), self.setpoint).astype(int)
+
+        self.moved = moving
+        self.previous_setpoint[moving] = self.setpoint[moving]
+        self.write_setpoint(new_setpoint)
+
+        if self.use_local_fit():
+            self.probe_setpoint(self.local_fit.unexplored())
+
+        # if the change in all variables is less than one (we can not take smaller steps thus this is the optimization boundry)
+        below_resolution = step_sizes < 1
+        if below_resolution.all():
+            print("Convergence achieved")
+            self.mark_converged()
+
+        # stop optimizing parameter if we reached optimization resolution limit
+        elif below_resolution.any():
+            print(f"Convergence achieved in {', '.join(name for name, converged in zip(self.parameter_names, below_resolution) if converged)}")
+
+        if self.image_groups_processed >2:
+            if self.use_local_fit():
+                # the fit residual measures the count noise, if no slope stands out of it we are near the peak
+                print(f"Local fit residual: {self.local_fit.residual_std():.2f}")
+                if self.local_fit.gradient_is_within_noise(self.setpoint):
+                    print("Convergence achieved")
+                    self.mark_converged()
+
+            # if the count is not changing much this means that we are near the peak
+            elif np.abs(self.count_history[-1] - self.count_history[-2]) <= self.count_change_tolerance:
+                print("Convergence achieved")
+                self.mark_converged()
+
+    # move the probed parameters one probe step in a random direction
+    def probe_setpoint(self, probed):
+        directions = np.array([random.choice([-1, 1]) for _ in range(self.dimension)])
+        new_setpoint = np.where(probed, np.rint(np.clip(self.setpoint + directions * self.fit_probe_steps, self.lower_bounds, self.upper_bounds)), self.setpoint).astype(int)
+
+        probed = new_setpoint != self.setpoint
+        self.moved = self.moved | probed
+        self.previous_setpoint[probed] = self.setpoint[probed]
+        self.write_setpoint(new_setpoint)
+
+    # the setpoint the last image group was measured at
+    def current_setpoint(self):
+        return self.setpoint.tolist()
+
+    def use_local_fit(self):
+        return self.gradient_estimator == 'least_squares' and self.local_fit.is_ready()
+
+    # the setpoint goes into the actuator values that are written to the parameter files
+    def write_setpoint(self, setpoint):
+        self.setpoint = np.array(setpoint, dtype=int)
+        for index, value in zip(self.mirror_actuators, self.setpoint.tolist()):
+            self.mirror_values[index] = value
+        self.dispersion_values[0], self.dispersion_values[1] = self.setpoint[-2:].tolist()
+
+    # move all parameters to a new (integer) setpoint
+    def apply_setpoint(self, setpoint):
+        self.moved = np.ones(self.dimension, dtype=bool)
+        self.previous_setpoint = self.setpoint.copy()
+        self.write_setpoint(setpoint)
+
+    # initial method for the spsa mode, the first measurement is the initial setpoint
+    def initial_spsa_optimize(self):
+        self.spsa = self.new_spsa()
+
+        # take the random directions (+1 or -1) for the first perturbation
+        self.apply_setpoint(self.spsa.ask())
+        self.random_direction = self.spsa.random_direction
+
+    # spsa block, every gradient takes two image groups (one on each side of the current setpoint) whatever the number of parameters
+    def spsa_optimize(self):
+        gradient = self.spsa.tell(self.count_history[-1])
+
+        if gradient is not None:
+            self.derivatives = gradient
+
+            # add the derivatives to according history lists for plotting
+            self.derivative_history.append(self.derivatives)
+
+            self.total_gradient = np.sum(gradient)
+            self.total_gradient_history.append(self.total_gradient)
+            self.der_iteration_data.append(self.image_groups_dir_run_count)
+
+            # no slope stands out of the noise of the gradient estimates and the count stopped climbing
+            if self.spsa.has_converged(self.spsa_convergence_updates, self.spsa_convergence_significance):
+                print(f"Convergence achieved after {self.images_processed} shots")
+                self.mark_converged()
+
+        self.apply_setpoint(self.spsa.ask())
+        self.random_direction = self.spsa.random_direction
+
+    # initial method for the bayesian mode, the surrogate starts from the measurement at the initial setpoint
+    def initial_bayesian_optimize(self):
+        self.gaussian_process = self.new_gaussian_process()
+        self.bayesian_optimize()
+
+    # bayesian block, the surrogate is updated with the last measurement and suggests the next integer setpoint
+    def bayesian_optimize(self):
+        self.gaussian_process.tell(self.setpoint, self.count_history[-1])
+        self.apply_setpoint(self.gaussian_process.ask())
+
+        print(f"Best so far: count {self.gaussian_process.best_count():.2f} at {self.describe(self.gaussian_process.best_setpoint())}")
@@ -0,0 +1,353 @@
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+
+import numpy as np
+
+from measurement_cache import MeasurementCache
+
+JOURNAL_MAGIC = b'BTRNJRNL'
+JOURNAL_VERSION = 3
+
+# optimizer settings the header keeps as they are and a resumed run takes again (version 3 journals, older ones keep the
+# optimizer's own). the other settings have their own header entries
+JOURNAL_SETTINGS = [
+    'group_estimator', 'outlier_sigma', 'min_outlier_group', 'trim_fraction', 'reference_frames', 'min_reference_frames',
+    'count_change_tolerance', 'history_maxlen', 'fit_window', 'fit_quadratic', 'fit_probe_steps', 'fit_max_step_fraction',
+    'spsa_gain', 'spsa_a', 'spsa_A', 'spsa_alpha', 'spsa_gamma', 'spsa_c', 'spsa_convergence_updates', 'spsa_convergence_significance',
+    'gp_length_scale', 'gp_noise_std', 'gp_acquisition',
+]
+
+# header entries a resumed run takes from the journal in place of the optimizer's own settings
+RUN_SETTINGS = ['optimizer_mode', 'gradient_estimator', 'image_group', 'measurement_cache', 'adaptive_image_group', 'learning_rates'] + JOURNAL_SETTINGS
+
+# record kinds
+FRAME_RECORD = 0
+GROUP_RECORD = 1
+
+# one fixed-width record per frame and one per completed image group, so the file can be memory mapped as a numpy array.
+# frame records only fill time, shot, image_group, count and setpoint. the per parameter fields have one column for every
+# optimized parameter (focus, order2 and order3 by default, the header lists them). version 1 journals have no kept_frames,
+# version 2 journals no frame quality
+def journal_dtype(dimension, version=JOURNAL_VERSION):
+    fields = [
+        ('kind', 'u1'),
+        ('converged', 'u1'),
+        # which parameters got a new value appended to their history by this image group
+        ('moved', 'u1', dimension),
+        ('time', 'f8'),
+        # frames processed and image groups completed, including this record
+        ('shot', 'u4'),
+        ('image_group', 'u4'),
+        # frame count, or the group count handed to the optimizer
+        ('count', 'f8'),
+        # setpoint the frame or group was measured at, and the one the optimizer moved to
+        ('setpoint', 'i4', dimension),
+        ('next_setpoint', 'i4', dimension),
+        # derivatives of every parameter and the total gradient, nan when the group computed none
+        ('derivatives', 'f8', dimension),
+        ('total_gradient', 'f8'),
+        ('der_iteration', 'i4'),
+        # spsa keeps a real valued estimate next to the integer setpoints, nan in the other modes
+        ('theta', 'f8', dimension),
+    ]
+    if version >= 2:
+        # bit i is set when the i-th frame of the image group went into its count (frames past the 64th always do)
+        fields.append(('kept_frames', 'u8'))
+    if version >= 3:
+        # background and spread of a frame (frame_quality.py), nan when the frames are reduced to their counts only
+        fields.append(('quality', 'f8', 2))
+    return np.dtype(fields, align=True)
+
+JOURNAL_DTYPE = journal_dtype(3)
+
+def header_dtype(header):
+    return journal_dtype(len(header.get('parameter_names', ['focus', 'second_dispersion', 'third_dispersion'])), header.get('version', JOURNAL_VERSION))
+
+# append-only run journal: magic, header length, json header (initial setpoint, bounds, optimizer settings) padded so the
+# records start on an 8 byte boundary, then the records
+class RunJournal:
+    def __init__(self, path, header=None, fsync=False):
+        self.path = path
+        self.fsync = fsync
+
+        if header is not None:
+            # new journal
+            self.header = header
+            self.file = open(path, 'wb')
+            self.file.write(encode_header(header))
+        else:
+            # append to an existing journal, a record cut short by a crash is dropped
+            self.header, self.records_offset, record_count = read_layout(path)
+            self.file = open(path, 'r+b')
+            self.file.truncate(self.records_offset + record_count * header_dtype(self.header).itemsize)
+            self.file.seek(0, os.SEEK_END)
+
+        self.record = np.zeros(1, dtype=header_dtype(self.header))
+
+    def append_frame(self, shot, image_group, count, setpoint, quality=None):
+        record = self.record
+        record.fill(0)
+        record['kind'] = FRAME_RECORD
+        record['time'] = time.time()
+        record['shot'] = shot
+        record['image_group'] = image_group
+        record['count'] = count
+        record['setpoint'] = setpoint
+        if 'quality' in record.dtype.names:
+            record['quality'] = np.nan if quality is None else quality
+        self.file.write(record.tobytes())
+
+    def append_group(self, shot, image_group, count, setpoint, next_setpoint, moved, derivatives=None, total_gradient=np.nan, der_iteration=-1, theta=None, converged=False, kept_frames=None):
+        record = self.record
+        record.fill(0)
+        record['kind'] = GROUP_RECORD
+        record['converged'] = converged
+        record['moved'] = moved
+        record['time'] = time.time()
+        record['shot'] = shot
+        record['image_group'] = image_group
+        record['count'] = count
+        record['setpoint'] = setpoint
+        record['next_setpoint'] = next_setpoint
+        record['derivatives'] = np.nan if derivatives is None else derivatives
+        record['total_gradient'] = total_gradient
+        record['der_iteration'] = der_iteration
+        record['theta'] = np.nan if theta is None else theta
+        if 'kept_frames' in record.dtype.names:
+            record['kept_frames'] = frame_bits(kept_frames)
+        self.file.write(record.tobytes())
+
+        # every image group is on disk before the new setpoint is applied
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+# kept flags of the frames of an image group as the bits of kept_frames (None keeps every frame)
+def frame_bits(kept):
+    if kept is None:
+        return np.iinfo(np.uint64).max
+    kept = np.asarray(kept, dtype=bool)[:64]
+    return int(np.sum(np.left_shift(np.uint64(1), np.flatnonzero(kept).astype(np.uint64)), dtype=np.uint64))
+
+def encode_header(header):
+    text = json.dumps(header).encode()
+    padding = -(len(JOURNAL_MAGIC) + 4 + len(text)) % 8
+    return JOURNAL_MAGIC + struct.pack('<I', len(text) + padding) + text + b' ' * padding
+
+def read_layout(path):
+    # header, offset of the first record and the number of complete records
+    with open(path, 'rb') as file:
+        if file.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+            raise ValueError(f'{path} is not a run journal')
+        (header_length,) = struct.unpack('<I', file.read(4))
+        header = json.loads(file.read(header_length))
+
+    records_offset = len(JOURNAL_MAGIC) + 4 + header_length
+    record_count = (os.path.getsize(path) - records_offset) // header_dtype(header).itemsize
+    return header, records_offset, record_count
+
+def read_journal(path):
+    # header and the records as a read-only memory mapped structured array (no copy, works while the run is still writing)
+    header, records_offset, record_count = read_layout(path)
+    if record_count == 0:
+        return header, np.zeros(0, dtype=header_dtype(header))
+    return header, np.memmap(path, dtype=header_dtype(header), mode='r', offset=records_offset, shape=(record_count,))
+
+# header of a new journal: what is needed to rebuild the optimizer besides the records
+def journal_header(optimizer):
+    return {
+        'version': JOURNAL_VERSION,
+        'started': time.time(),
+        'parameter_names': list(optimizer.parameter_names),
+        'mirror_actuators': list(optimizer.mirror_actuators),
+        'initial_setpoint': optimizer.initial_setpoint.tolist(),
+        'lower_bounds': optimizer.lower_bounds.tolist(),
+        'upper_bounds': optimizer.upper_bounds.tolist(),
+        'parameter_ranges': optimizer.parameter_ranges.tolist(),
+        'random_direction': [int(value) for value in optimizer.random_direction],
+        'random_seed': optimizer.random_seed,
+        'optimizer_mode': optimizer.optimizer_mode,
+        'gradient_estimator': optimizer.gradient_estimator,
+        'image_group': optimizer.image_group,
+        'measurement_cache': [optimizer.measurement_cache.max_age if optimizer.measurement_cache is not None else None, optimizer.cache_combine, optimizer.cache_reuse, optimizer.cache_reuse_limit],
+        'adaptive_image_group': [optimizer.adaptive_image_group, optimizer.min_image_group, optimizer.max_image_group, optimizer.resolution_sigma],
+        'learning_rates': optimizer.learning_rates.tolist(),
+        **{name: json_value(getattr(optimizer, name)) for name in JOURNAL_SETTINGS},
+    }
+
+# numpy arrays and scalars of the settings as json lists and numbers
+def json_value(value):
+    return value.tolist() if isinstance(value, (np.ndarray, np.generic)) else value
+
+# the run settings of a journal that differ from the optimizer's, as (name, journal value, optimizer value)
+def changed_settings(header, optimizer):
+    current = journal_header(optimizer)
+    return [(name, header[name], current[name]) for name in RUN_SETTINGS if name in header and header[name] != current[name]]
+
+def fill_history(history, values):
+    history.clear()
+    history.extend(values)
+
+# which frames of completed image groups went into their group's count (every frame in a version 1 journal)
+def kept_frames(frames, groups):
+    if 'kept_frames' not in groups.dtype.names or not len(frames):
+        return np.ones(len(frames), dtype=bool)
+
+    # a frame belongs to the first image group completed at or after its shot, its position counts from the group's first frame
+    group_index = np.searchsorted(groups['shot'], frames['shot'])
+    first_shot = np.concatenate(([0], groups['shot']))[group_index] + 1
+    position = frames['shot'].astype(np.int64) - first_shot
+    bits = np.right_shift(groups['kept_frames'][group_index], np.minimum(position, 63).astype(np.uint64)) & np.uint64(1)
+    return (bits == 1) | (position >= 64)
+
+# background and spread of the frames, None when a frame has none (version 2 journals, frames reduced to their counts)
+def frame_quality(frames):
+    if 'quality' not in frames.dtype.names or np.isnan(frames['quality']).any():
+        return None
+    return np.array(frames['quality'], dtype=float)
+
+# put a fresh BetatronOptimizer in the state it had after the last journaled record
+def restore_optimizer(optimizer, header, records):
+    frames = records[records['kind'] == FRAME_RECORD]
+    groups = records[records['kind'] == GROUP_RECORD]
+
+    if header.get('version', JOURNAL_VERSION) > JOURNAL_VERSION:
+        raise ValueError(f"the journal is version {header['version']}, this version reads journals up to version {JOURNAL_VERSION}")
+
+    # the optimizer has to be built over the same parameters (mirror actuators) as the journaled run
+    parameter_names = header.get('parameter_names', ['focus', 'second_dispersion', 'third_dispersion'])
+    if list(optimizer.parameter_names) != list(parameter_names):
+        raise ValueError(f"the journal optimizes {', '.join(parameter_names)}, the optimizer {', '.join(optimizer.parameter_names)}")
+
+    # settings and bounds of the run, not of the parameter files (they hold the last setpoint by now)
+    optimizer.optimizer_mode = header['optimizer_mode']
+    optimizer.gradient_estimator = header['gradient_estimator']
+    optimizer.image_group = header['image_group']
+    optimizer.adaptive_image_group, optimizer.min_image_group, optimizer.max_image_group, optimizer.resolution_sigma = header['adaptive_image_group']
+    cache_max_age, optimizer.cache_combine, optimizer.cache_reuse, optimizer.cache_reuse_limit = header['measurement_cache']
+    optimizer.measurement_cache = MeasurementCache(max_age=cache_max_age) if cache_max_age is not None else None
+    optimizer.learning_rates[:] = header['learning_rates']
+    optimizer.random_direction = list(header['random_direction'])
+    optimizer.random_seed = header['random_seed']
+    optimizer.initial_setpoint[:] = header['initial_setpoint']
+    optimizer.lower_bounds[:] = header['lower_bounds']
+    optimizer.upper_bounds[:] = header['upper_bounds']
+    optimizer.parameter_ranges[:] = header.get('parameter_ranges', optimizer.parameter_ranges)
+    for name in JOURNAL_SETTINGS:
+        if name in header:
+            setattr(optimizer, name, np.array(header[name]) if isinstance(header[name], list) else header[name])
+
+    # histories
+    fill_history(optimizer.count_history, groups['count'])
+    fill_history(optimizer.iteration_data, groups['image_group'])
+    shots_per_setpoint = np.diff(groups['shot'], prepend=0)
+    fill_history(optimizer.shots_per_setpoint, shots_per_setpoint)
+    fill_history(optimizer.setpoint_history, groups['next_setpoint'])
+    fill_history(optimizer.moved_history, groups['moved'].astype(bool))
+
+    with_derivatives = groups[groups['der_iteration'] >= 0]
+    fill_history(optimizer.derivative_history, with_derivatives['derivatives'])
+    fill_history(optimizer.total_gradient_history, with_derivatives['total_gradient'])
+    fill_history(optimizer.der_iteration_data, with_derivatives['der_iteration'])
+
+    # counters, the frames after the last image group are part of the group being collected
+    optimizer.image_groups_processed = len(groups)
+    optimizer.image_groups_dir_run_count = max(len(groups) - 1, 0)
+    optimizer.images_processed = len(frames)
+    pending = frames[frames['shot'] > (groups['shot'][-1] if len(groups) else 0)]
+    optimizer.image_group_count_sum = float(pending['count'].sum())
+    optimizer.img_mean_count = float(pending['count'][-1]) if len(pending) else 0
+    optimizer.group_shots = len(pending)
+    optimizer.group_mean = float(pending['count'].mean()) if len(pending) else 0.0
+    optimizer.group_m2 = float(((pending['count'] - optimizer.group_mean) ** 2).sum())
+    optimizer.group_counts = pending['count'].tolist()
+    pending_quality = frame_quality(pending)
+    optimizer.group_quality = pending_quality.tolist() if pending_quality is not None else []
+
+    # image groups taken from the measurement cache in a row at the end of the run
+    if len(groups):
+        optimizer.last_measured_setpoint = [int(value) for value in groups['setpoint'][-1]]
+        measured = np.flatnonzero(shots_per_setpoint)
+        optimizer.cached_groups_in_a_row = len(groups) - 1 - measured[-1] if len(measured) else len(groups)
+
+    # the last frames that went into their group's count are the reference of the small image groups
+    completed = frames[frames['shot'] <= (groups['shot'][-1] if len(groups) else 0)]
+    kept = kept_frames(completed, groups)
+    reference = completed[kept][-optimizer.reference_frames:] if optimizer.reference_frames else completed[:0]
+    quality = frame_quality(reference)
+    optimizer.recent_frames = (np.column_stack([reference['count'], quality]) if quality is not None else reference['count'][:, None]).tolist()
+
+    # the cache holds the frames of completed image groups taken within its age that went into their group's count, pooled by setpoint
+    if optimizer.measurement_cache is not None:
+        cached = completed[kept & (completed['time'] >= time.time() - optimizer.measurement_cache.max_age)]
+        if len(cached):
+            setpoints, inverse = np.unique(cached['setpoint'], axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            shots = np.bincount(inverse)
+            means = np.bincount(inverse, weights=cached['count']) / shots
+            m2 = np.bincount(inverse, weights=(cached['count'] - means[inverse]) ** 2)
+            first_times = np.full(len(setpoints), np.inf)
+            np.minimum.at(first_times, inverse, cached['time'])
+            for setpoint, shot_count, mean, deviations, first_time in zip(setpoints, shots, means, m2, first_times):
+                optimizer.measurement_cache.add(setpoint, int(shot_count), mean, deviations, now=first_time)
+
+    converged = np.flatnonzero(groups['converged'])
+    optimizer.converged = bool(len(converged))
+    optimizer.shots_to_convergence = int(groups['shot'][converged[0]]) if len(converged) else None
+
+    # the setpoint the optimizer moved to last, and the value every parameter had before its last move
+    optimizer.write_setpoint(groups['next_setpoint'][-1] if len(groups) else optimizer.initial_setpoint)
+    optimizer.previous_setpoint = optimizer.initial_setpoint.copy()
+    for index in range(optimizer.dimension):
+        values = optimizer.parameter_history(index)
+        if len(values) >= 2:
+            optimizer.previous_setpoint[index] = values[-2]
+    if len(groups):
+        optimizer.moved = groups['moved'][-1].astype(bool)
+
+    # the models of the optimizer modes
+    optimizer.local_fit = optimizer.new_local_fit()
+    if optimizer.gradient_estimator == 'least_squares':
+        window = optimizer.local_fit.window
+        for group, shots in zip(groups[-window:], shots_per_setpoint[-window:]):
+            optimizer.local_fit.add(group['setpoint'], group['count'], weight=shots)
+
+    if optimizer.optimizer_mode == 'spsa' and len(groups):
+        optimizer.spsa = optimizer.new_spsa()
+        # continue the gain schedules from the last estimate, a perturbation pair that was cut in half is started again
+        with_theta = groups[~np.isnan(groups['theta'][:, 0])]
+        if len(with_theta):
+            optimizer.spsa.theta = np.array(with_theta['theta'][-1], dtype=float)
+        optimizer.spsa.k = len(with_derivatives)
+        # the last gradient estimates and the mean counts of their perturbation pairs decide the convergence
+        recent = np.flatnonzero(groups['der_iteration'] >= 0)[-optimizer.spsa.max_recent_gradients:]
+        optimizer.spsa.recent_gradients = list(groups['derivatives'][recent].astype(float))
+        optimizer.spsa.recent_counts = ((groups['count'][recent] + groups['count'][np.maximum(recent - 1, 0)]) / 2).tolist()
+        optimizer.apply_setpoint(optimizer.spsa.ask())
+        optimizer.random_direction = optimizer.spsa.random_direction
+
+    if optimizer.optimizer_mode == 'bayesian' and len(groups):
+        optimizer.gaussian_process = optimizer.new_gaussian_process()
+        optimizer.gaussian_process.fit(groups['setpoint'], groups['count'])
+
+# one line per image group of a journal, for a quick look without loading it into the app
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print the image groups of a run journal')
+    parser.add_argument('journal')
+    args = parser.parse_args(argv)
+
+    header, records = read_journal(args.journal)
+    groups = records[records['kind'] == GROUP_RECORD]
+    print(f"{header['optimizer_mode']} run started {time.ctime(header['started'])}, {np.count_nonzero(records['kind'] == FRAME_RECORD)} frames, {len(groups)} image groups")
+    for group in groups:
+        print(f"{group['image_group']:>6} {group['shot']:>7} {group['count']:>10.2f} {' '.join(f'{value:>7}' for value in group['setpoint'])} -> {' '.join(f'{value:>7}' for value in group['next_setpoint'])}")
+
+if __name__ == "__main__":
+    sys.exit(main())
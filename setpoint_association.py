@@ -0,0 +1,99 @@
+import os
+import csv
+import time
+import struct
+import bisect
+import threading
+
+# tiff tags holding the time the camera wrote into the file
+TIFF_DATETIME_TAG = 306
+TIFF_SUBSEC_TIME_TAG = 37520
+
+def tiff_datetime(image_path):
+    # DateTime (and SubSecTime) of the first image of a tiff file as a unix time, None if the file has no DateTime
+    with open(image_path, 'rb') as file:
+        header = file.read(8)
+        byte_order = {b'II': '<', b'MM': '>'}[header[:2]]
+        (ifd_offset,) = struct.unpack(byte_order + 'I', header[4:8])
+
+        file.seek(ifd_offset)
+        (entry_count,) = struct.unpack(byte_order + 'H', file.read(2))
+        entries = file.read(12 * entry_count)
+
+        texts = {}
+        for index in range(entry_count):
+            tag, field_type, value_count = struct.unpack(byte_order + 'HHI', entries[12 * index:12 * index + 8])
+            if tag not in (TIFF_DATETIME_TAG, TIFF_SUBSEC_TIME_TAG) or field_type != 2:
+                continue
+
+            # ascii values of up to 4 bytes are stored in the entry itself, longer ones at an offset
+            if value_count <= 4:
+                value = entries[12 * index + 8:12 * index + 8 + value_count]
+            else:
+                (value_offset,) = struct.unpack(byte_order + 'I', entries[12 * index + 8:12 * index + 12])
+                position = file.tell()
+                file.seek(value_offset)
+                value = file.read(value_count)
+                file.seek(position)
+            texts[tag] = value.split(b'\0')[0].decode('ascii').strip()
+
+    if TIFF_DATETIME_TAG not in texts:
+        return None
+
+    timestamp = time.mktime(time.strptime(texts[TIFF_DATETIME_TAG], '%Y:%m:%d %H:%M:%S'))
+    subseconds = texts.get(TIFF_SUBSEC_TIME_TAG)
+    if subseconds and subseconds.isdigit():
+        timestamp += int(subseconds) / 10 ** len(subseconds)
+    return timestamp
+
+# when the frame was taken: the time the camera wrote into the tiff ('tiff', falls back to the file time) or the time
+# the file was last written ('mtime', exact to the file system resolution and always there)
+def acquisition_time(image_path, source='mtime'):
+    if source == 'tiff':
+        try:
+            timestamp = tiff_datetime(image_path)
+            if timestamp is not None:
+                return timestamp
+        except (OSError, KeyError, ValueError, struct.error):
+            pass
+    return os.stat(image_path).st_mtime
+
+# when every setpoint reached the actuators, so frames can be matched to the setpoint they were taken at
+class ActuationLog:
+    def __init__(self, settle_delay=0.0, log_path=None):
+        # seconds the mirror and the dazzler need after the new values are applied before frames can be counted
+        self.settle_delay = settle_delay
+
+        # also written as csv (time, generation, focus, order2, order3) to line up with the parameter log offline
+        self.log_path = log_path
+
+        # applied times and setpoint generations, in the order they were applied
+        self.applied_times = []
+        self.generations = []
+        self.setpoints = []
+        self.lock = threading.Lock()
+
+    def record(self, generation, setpoint, applied_time=None):
+        applied_time = time.time() if applied_time is None else applied_time
+        with self.lock:
+            self.applied_times.append(applied_time)
+            self.generations.append(generation)
+            self.setpoints.append(tuple(setpoint))
+
+        if self.log_path is not None:
+            with open(self.log_path, 'a', newline='') as file:
+                csv.writer(file).writerow([f'{applied_time:.6f}', generation, *setpoint])
+
+    def generation_at(self, acquisition_time):
+        # generation of the setpoint the actuators had settled at when the frame was taken, None while they were moving
+        with self.lock:
+            index = bisect.bisect_right(self.applied_times, acquisition_time) - 1
+            if index < 0:
+                return None
+            if acquisition_time < self.applied_times[index] + self.settle_delay:
+                return None
+            return self.generations[index]
+
+    def last_generation(self):
+        with self.lock:
+            return self.generations[-1] if self.generations else None
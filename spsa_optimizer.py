@@ -0,0 +1,110 @@
+import numpy as np
+
+# simultaneous perturbation stochastic approximation (gradient ascent), two measurements per gradient estimate for any number of parameters
+class SPSAOptimizer:
+    def __init__(self, initial_values, lower_bounds, upper_bounds, a, c, A=10, alpha=0.602, gamma=0.101, seed=None):
+        self.theta = np.asarray(initial_values, dtype=float)
+        self.lower_bounds = np.asarray(lower_bounds, dtype=float)
+        self.upper_bounds = np.asarray(upper_bounds, dtype=float)
+
+        # gain schedules a_k = a / (k + 1 + A)^alpha and c_k = c / (k + 1)^gamma, a and c can be set per parameter
+        self.a = np.broadcast_to(np.asarray(a, dtype=float), self.theta.shape)
+        self.c = np.broadcast_to(np.asarray(c, dtype=float), self.theta.shape)
+        self.A = A
+        self.alpha = alpha
+        self.gamma = gamma
+
+        self.rng = np.random.default_rng(seed)
+
+        # number of gradient estimates taken so far
+        self.k = 0
+
+        # the two setpoints of the current estimate and what was measured there
+        self.phase = 'plus'
+        self.random_direction = None
+        self.theta_plus = None
+        self.theta_minus = None
+        self.count_plus = None
+
+        self.gradient = None
+        self.last_step = None
+
+        # the last gradient estimates and mean counts of the two measurements, to tell progress from noise
+        self.recent_gradients = []
+        self.recent_counts = []
+        self.max_recent_gradients = 64
+
+    def round_and_clip(self, values):
+        # the values have to be rounded and clipped due to physical constraints
+        return np.rint(np.clip(values, self.lower_bounds, self.upper_bounds)).astype(int)
+
+    def gains(self):
+        a_k = self.a / (self.k + 1 + self.A) ** self.alpha
+        c_k = self.c / (self.k + 1) ** self.gamma
+        return a_k, c_k
+
+    def setpoint(self):
+        return self.round_and_clip(self.theta)
+
+    def ask(self):
+        if self.phase == 'plus':
+            # +1 or -1 for every parameter, all parameters are perturbed at the same time
+            self.random_direction = self.rng.choice([-1, 1], size=self.theta.shape)
+
+            # the perturbation is at least one step so the two integer setpoints always differ
+            _, c_k = self.gains()
+            perturbation = np.maximum(np.rint(c_k), 1) * self.random_direction
+
+            self.theta_plus = self.round_and_clip(self.theta + perturbation)
+            self.theta_minus = self.round_and_clip(self.theta - perturbation)
+            return self.theta_plus
+
+        return self.theta_minus
+
+    def tell(self, count):
+        if self.phase == 'plus':
+            self.count_plus = count
+            self.phase = 'minus'
+            return None
+
+        count_minus = count
+        self.phase = 'plus'
+
+        # use the setpoints that were actually measured (after rounding and clipping) for the differences
+        setpoint_difference = (self.theta_plus - self.theta_minus).astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.gradient = np.where(setpoint_difference != 0, (self.count_plus - count_minus) / setpoint_difference, 0.0)
+
+        # gradient ascent step, theta is kept as a float so steps smaller than one add up
+        a_k, _ = self.gains()
+        previous_setpoint = self.setpoint()
+        self.theta = np.clip(self.theta + a_k * self.gradient, self.lower_bounds, self.upper_bounds)
+        self.last_step = self.setpoint() - previous_setpoint
+        self.recent_gradients = (self.recent_gradients + [self.gradient])[-self.max_recent_gradients:]
+        self.recent_counts = (self.recent_counts + [(self.count_plus + count_minus) / 2])[-self.max_recent_gradients:]
+        self.k += 1
+
+        return self.gradient
+
+    def gradient_is_within_noise(self, updates=8, significance=2.0):
+        # the mean of the last gradient estimates is within significance standard errors of zero for every parameter, a
+        # single estimate is mostly noise (the other parameters' slopes and the count noise) so several are averaged
+        if len(self.recent_gradients) < updates:
+            return False
+        gradients = np.array(self.recent_gradients[-updates:])
+        standard_error = gradients.std(axis=0, ddof=1) / np.sqrt(updates)
+        return bool(np.all(np.abs(gradients.mean(axis=0)) <= significance * standard_error))
+
+    def count_stopped_improving(self, updates=8, significance=2.0):
+        # the mean count of the later half of the last updates is not significantly above the earlier half
+        if len(self.recent_counts) < updates:
+            return False
+        counts = np.array(self.recent_counts[-updates:])
+        earlier, later = counts[:updates // 2], counts[updates // 2:]
+        standard_error = np.sqrt(earlier.var(ddof=1) / len(earlier) + later.var(ddof=1) / len(later))
+        return bool(later.mean() - earlier.mean() <= significance * standard_error)
+
+    def has_converged(self, updates=8, significance=2.0):
+        # with many parameters a single estimate carries the slopes of all the others, so the gradient alone can look
+        # like noise while the count still climbs, and a gain too small to climb still gives a consistent gradient
+        return self.gradient_is_within_noise(updates, significance) and self.count_stopped_improving(updates, significance)
@@ -0,0 +1,132 @@
+import os
+import sys
+import csv
+import json
+import time
+import threading
+from collections import deque, Counter
+from contextlib import contextmanager
+
+import numpy as np
+
+# per-stage latencies of the hot path: the last `window` durations of every stage for rolling percentiles, plus an optional
+# trace of every measurement (stage, thread, start, duration) that can be exported as csv or as a chrome/perfetto json trace
+class StageTimer:
+    def __init__(self, window=1024, trace_maxlen=0, summary_interval=30.0):
+        self.window = window
+
+        # durations in seconds, one ring buffer per stage
+        self.durations = {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+        # trace_maxlen 0 keeps no trace
+        self.trace = deque(maxlen=trace_maxlen) if trace_maxlen else None
+
+        # seconds between two summaries printed by maybe_print_summary
+        self.summary_interval = summary_interval
+        self.last_summary = time.monotonic()
+
+    def record(self, stage, duration, start=None):
+        with self.lock:
+            durations = self.durations.get(stage)
+            if durations is None:
+                durations = self.durations[stage] = np.zeros(self.window)
+            durations[self.counts[stage] % self.window] = duration
+            self.counts[stage] += 1
+
+            if self.trace is not None:
+                start = time.perf_counter() - duration if start is None else start
+                self.trace.append((stage, threading.current_thread().name, start, duration))
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, start)
+
+    def percentiles(self):
+        # count, p50, p95, p99 and max in milliseconds over the last `window` measurements of every stage
+        with self.lock:
+            windows = {stage: durations[:min(self.counts[stage], self.window)].copy() for stage, durations in self.durations.items()}
+            counts = dict(self.counts)
+
+        summary = {}
+        for stage, durations in windows.items():
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99]) * 1e3
+            summary[stage] = {'count': counts[stage], 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': durations.max() * 1e3}
+        return summary
+
+    def summary_text(self):
+        lines = [f"{'stage':<18} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for stage, row in self.percentiles().items():
+            lines.append(f"{stage:<18} {row['count']:>7} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['max_ms']:>9.3f}")
+        return '\n'.join(lines)
+
+    def maybe_print_summary(self):
+        now = time.monotonic()
+        if self.summary_interval and now - self.last_summary >= self.summary_interval:
+            self.last_summary = now
+            print(self.summary_text())
+
+    def export(self, path):
+        # .json is written in the chrome trace event format (chrome://tracing, ui.perfetto.dev), anything else as csv
+        with self.lock:
+            trace = list(self.trace) if self.trace is not None else []
+
+        if path.endswith('.json'):
+            events = [
+                {'name': stage, 'ph': 'X', 'pid': 0, 'tid': thread, 'ts': start * 1e6, 'dur': duration * 1e6}
+                for stage, thread, start, duration in trace
+            ]
+            with open(path, 'w') as file:
+                json.dump({'traceEvents': events, 'summary': self.percentiles()}, file)
+        else:
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['stage', 'thread', 'start_s', 'duration_ms'])
+                for stage, thread, start, duration in trace:
+                    writer.writerow([stage, thread, f'{start:.6f}', f'{duration * 1e3:.4f}'])
+
+# samples the stacks of every thread at a fixed interval (sys._current_frames, no tracing overhead on the profiled code)
+# and writes them as collapsed stacks ("thread;outer;...;inner count"), the input format of flamegraph.pl and speedscope
+class SamplingProfiler:
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.sample, name='sampling_profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def sample(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
@@ -0,0 +1,146 @@
+import json
+import queue
+import socket
+import threading
+
+# sends the engine state to live plot clients in other processes, one json object per line over a local tcp socket
+class StatePublisher:
+    def __init__(self, host='127.0.0.1', port=0, max_pending=1000, send_timeout=1.0):
+        self.host = host
+        self.port = port
+        self.send_timeout = send_timeout
+
+        # publish only queues the state, a slow or stuck client can never hold up the engine (the oldest state is dropped when full)
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        self.server_socket = None
+        self.running = False
+
+    def start(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen()
+        self.port = self.server_socket.getsockname()[1]
+        self.running = True
+
+        threading.Thread(target=self.accept_clients, daemon=True).start()
+        threading.Thread(target=self.send_states, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.pending.put(None)
+        if self.server_socket is not None:
+            self.server_socket.close()
+        with self.clients_lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def client_count(self):
+        with self.clients_lock:
+            return len(self.clients)
+
+    def accept_clients(self):
+        while self.running:
+            try:
+                client, _ = self.server_socket.accept()
+            except OSError:
+                return
+            client.settimeout(self.send_timeout)
+            with self.clients_lock:
+                self.clients.append(client)
+
+    def publish(self, state):
+        line = (json.dumps(state) + '\n').encode()
+        while True:
+            try:
+                self.pending.put_nowait(line)
+                return
+            except queue.Full:
+                try:
+                    self.pending.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def send_states(self):
+        while self.running:
+            line = self.pending.get()
+            if line is None:
+                return
+
+            with self.clients_lock:
+                clients = list(self.clients)
+
+            # clients that went away or stopped reading are dropped
+            for client in clients:
+                try:
+                    client.sendall(line)
+                except OSError:
+                    client.close()
+                    with self.clients_lock:
+                        if client in self.clients:
+                            self.clients.remove(client)
+
+# receives the states of a StatePublisher on a background thread and hands each one to the callback, reconnecting when the engine restarts
+class StateSubscriber:
+    def __init__(self, host, port, callback, reconnect_interval=1.0):
+        self.host = host
+        self.port = port
+        self.callback = callback
+        self.reconnect_interval = reconnect_interval
+
+        self.connected = threading.Event()
+        self.stopped = threading.Event()
+        self.connection = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.receive_states, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.connection is not None:
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.connection.close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def receive_states(self):
+        while not self.stopped.is_set():
+            try:
+                self.connection = socket.create_connection((self.host, self.port))
+            except OSError:
+                self.stopped.wait(self.reconnect_interval)
+                continue
+
+            self.connected.set()
+            try:
+                with self.connection.makefile('r') as lines:
+                    for line in lines:
+                        try:
+                            state = json.loads(line)
+                        except ValueError as e:
+                            print(f"Error reading state: {e}")
+                            continue
+                        self.callback(state)
+            except OSError:
+                pass
+            finally:
+                self.connected.clear()
+                self.connection.close()
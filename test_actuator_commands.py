@@ -0,0 +1,78 @@
+import time
+import threading
+
+from actuator_commands import ActuatorCommandQueue
+
+def command(generation, focus, order2=36100):
+    return {'generation': generation, 'setpoint': [focus, order2, -27000], 'mirror': f'{focus} 0 0', 'dazzler': f'order2 = {order2}\norder3 = -27000\n'}
+
+def test_only_changed_devices_are_written():
+    writes = []
+    failing = set()
+
+    def apply(command, devices):
+        writes.append((command['generation'], devices))
+        return {device: None if device in failing else time.time() for device in devices}
+
+    commands = ActuatorCommandQueue(apply)
+    commands.mark_applied(command(0, -150))
+    commands.put(command(1, -149))
+    commands.put(command(2, -149, 36101))
+    commands.put(command(3, -149, 36101))
+
+    # a device that did not acknowledge is written again with the next command
+    failing.add('mirror')
+    commands.put(command(4, -148, 36101))
+    assert commands.needs_retry()
+    failing.clear()
+    commands.put(command(5, -148, 36101))
+
+    assert not commands.needs_retry()
+    assert writes == [(1, ['mirror']), (2, ['dazzler']), (3, []), (4, ['mirror']), (5, ['mirror'])]
+    assert (commands.skipped_writes, commands.failed_writes) == (6, 1)
+    assert [entry['acknowledged'] is None for entry in commands.history] == [False, False, False, True, False]
+
+def test_only_the_newest_command_is_sent_while_an_upload_is_in_flight():
+    writes = []
+    uploading = threading.Event()
+    release = threading.Event()
+
+    def apply(command, devices):
+        uploading.set()
+        release.wait()
+        writes.append(command['generation'])
+        return dict.fromkeys(devices, time.time())
+
+    commands = ActuatorCommandQueue(apply)
+    commands.start()
+    commands.put(command(1, -149))
+    assert uploading.wait(1.0)
+    for generation in (2, 3, 4):
+        commands.put(command(generation, -150 + generation))
+    assert commands.depth() == 1
+    release.set()
+    commands.close()
+
+    assert writes == [1, 4]
+    assert commands.coalesced_commands() == 2
+    for entry in commands.history:
+        assert entry['queued'] <= entry['applied'] <= entry['acknowledged']
+
+def test_a_command_that_raises_is_sent_again():
+    failures = [OSError('No such file or directory')]
+
+    def apply(command, devices):
+        if failures:
+            raise failures.pop()
+        return dict.fromkeys(devices, time.time())
+
+    commands = ActuatorCommandQueue(apply)
+    commands.mark_applied(command(0, -150))
+    commands.put(command(1, -149))
+    assert commands.needs_retry()
+    assert commands.failed_writes == 1
+    assert commands.history[-1]['acknowledged'] is None
+
+    commands.put(command(1, -149))
+    assert not commands.needs_retry()
+    assert commands.history[-1]['devices'] == ['mirror']
@@ -0,0 +1,68 @@
+import time
+
+from actuator_upload import FTPConnection, ActuatorUploader
+from local_ftp_server import LocalFTPServer
+
+def make_uploader(mirror_server, dazzler_server, keepalive_interval=0):
+    return ActuatorUploader([
+        FTPConnection('mirror', mirror_server.host, mirror_server.user, mirror_server.password, port=mirror_server.port),
+        FTPConnection('dazzler', dazzler_server.host, dazzler_server.user, dazzler_server.password, port=dazzler_server.port),
+    ], keepalive_interval=keepalive_interval)
+
+def test_upload_to_both_computers_over_one_session():
+    with LocalFTPServer() as mirror_server, LocalFTPServer() as dazzler_server:
+        uploader = make_uploader(mirror_server, dazzler_server)
+
+        for focus in range(3):
+            results = uploader.upload({
+                'mirror': ('dm_parameters.txt', f'{focus} 0 0'.encode()),
+                'dazzler': ('dazzler_parameters.txt', b'order2 = 1\norder3 = 2\n'),
+            })
+            assert results == {'mirror': True, 'dazzler': True}
+
+        uploader.close()
+
+        assert mirror_server.files['dm_parameters.txt'] == b'2 0 0'
+        assert dazzler_server.files['dazzler_parameters.txt'] == b'order2 = 1\norder3 = 2\n'
+
+        # the session stays open between uploads, only one login per computer
+        assert mirror_server.commands.count('USER') == 1
+        assert dazzler_server.commands.count('USER') == 1
+
+def test_reconnect_after_dropped_session():
+    with LocalFTPServer() as mirror_server, LocalFTPServer() as dazzler_server:
+        uploader = make_uploader(mirror_server, dazzler_server)
+        uploader.upload({'mirror': ('dm_parameters.txt', b'1 0 0')})
+
+        mirror_server.drop_sessions()
+        time.sleep(0.05)
+
+        assert uploader.upload({'mirror': ('dm_parameters.txt', b'2 0 0')}) == {'mirror': True}
+        assert mirror_server.files['dm_parameters.txt'] == b'2 0 0'
+        assert mirror_server.commands.count('USER') == 2
+        uploader.close()
+
+def test_upload_error_is_reported_per_computer():
+    with LocalFTPServer() as mirror_server, LocalFTPServer() as dazzler_server:
+        uploader = ActuatorUploader([
+            FTPConnection('mirror', mirror_server.host, mirror_server.user, mirror_server.password, port=mirror_server.port),
+            FTPConnection('dazzler', dazzler_server.host, dazzler_server.user, 'wrong password', port=dazzler_server.port),
+        ], keepalive_interval=0)
+
+        results = uploader.upload({
+            'mirror': ('dm_parameters.txt', b'1 0 0'),
+            'dazzler': ('dazzler_parameters.txt', b'order2 = 1\norder3 = 2\n'),
+        })
+        uploader.close()
+
+        assert results == {'mirror': True, 'dazzler': False}
+        assert 'dazzler_parameters.txt' not in dazzler_server.files
+
+def test_keepalive_sends_noop():
+    with LocalFTPServer() as mirror_server, LocalFTPServer() as dazzler_server:
+        uploader = make_uploader(mirror_server, dazzler_server, keepalive_interval=0.1)
+        time.sleep(0.4)
+        uploader.close()
+
+        assert 'NOOP' in mirror_server.commands
+        assert 'NOOP' in dazzler_server.commands
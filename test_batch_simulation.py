@@ -0,0 +1,47 @@
+import os
+import time
+import contextlib
+
+import numpy as np
+
+from batch_simulation import simulate_gradient_ascent, sweep
+from benchmark_optimizer import INITIAL_SETPOINT, SyntheticLandscape
+from optimizer_core import BetatronOptimizer
+
+def run_optimizer(landscape, learning_rates, image_group, count_change_tolerance, random_direction, max_groups):
+    optimizer = BetatronOptimizer([INITIAL_SETPOINT[0]], {0: INITIAL_SETPOINT[1], 1: INITIAL_SETPOINT[2]})
+    optimizer.focus_learning_rate, optimizer.second_dispersion_learning_rate, optimizer.third_dispersion_learning_rate = learning_rates
+    optimizer.image_group = image_group
+    optimizer.count_change_tolerance = count_change_tolerance
+    optimizer.random_direction = list(random_direction)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), np.errstate(divide='ignore', invalid='ignore'):
+        for shot in range(max_groups * image_group):
+            optimizer.add_image_count(landscape.true_count(optimizer.current_setpoint()))
+    return optimizer
+
+def test_matches_the_real_optimizer_without_noise():
+    landscape = SyntheticLandscape((-140, 36300, -26200), (8, 200, 800))
+    learning_rates = np.array([[0.1, 0.1, 0.1], [0.05, 50.0, 500.0], [0.3, 20.0, 2000.0]])
+    random_direction = np.array([[1, -1, 1], [-1, 1, 1], [1, 1, -1]])
+
+    result = simulate_gradient_ascent(landscape, learning_rates, image_group=2, count_change_tolerance=10, max_groups=30, random_direction=random_direction)
+
+    for run in range(len(learning_rates)):
+        optimizer = run_optimizer(landscape, learning_rates[run], 2, 10, random_direction[run], 30)
+        assert list(result['final_setpoint'][run]) == optimizer.current_setpoint()
+        assert result['converged'][run] == optimizer.converged
+        if optimizer.converged:
+            assert result['shots_to_convergence'][run] == optimizer.shots_to_convergence
+
+def test_sweep_maps_have_the_grid_shape_and_run_fast():
+    landscape = SyntheticLandscape((-140, 36300, -26200), (8, 200, 800), noise_std=10, seed=0)
+
+    start = time.perf_counter()
+    maps = sweep(landscape, [0.03, 0.1, 0.3], [1.0, 10.0], [10.0, 100.0], [1, 2, 4], [5, 10], repeats=100, max_groups=100, seed=0)
+    elapsed = time.perf_counter() - start
+
+    assert maps['convergence_rate'].shape == (3, 2, 2, 3, 2)
+    assert maps['median_shots'].shape == (3, 2, 2, 3, 2)
+    assert np.all((maps['success_rate'] >= 0) & (maps['success_rate'] <= maps['convergence_rate']))
+    assert elapsed < 10
@@ -0,0 +1,45 @@
+import time
+
+import numpy as np
+
+from bayesian_optimizer import GaussianProcessOptimizer
+
+def count_function(setpoint):
+    focus, second_dispersion, third_dispersion = setpoint
+    return 2000 - (((focus + 5) / 10) ** 2 + ((second_dispersion - 36300) / 250) ** 2 + ((third_dispersion + 26500) / 1000) ** 2) * 100
+
+def test_incremental_factor_matches_direct_inverse():
+    optimizer = GaussianProcessOptimizer([-20, 35600, -29000], [20, 36600, -25000], seed=0)
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        setpoint = rng.integers(optimizer.lower_bounds, optimizer.upper_bounds + 1)
+        optimizer.tell(setpoint, count_function(setpoint))
+
+    X = optimizer.X[:optimizer.n]
+    K = optimizer.kernel(X, X) + optimizer.noise_variance * np.eye(optimizer.n)
+    L_inv = optimizer.L_inv[:optimizer.n, :optimizer.n]
+
+    assert np.allclose(L_inv.T @ L_inv, np.linalg.inv(K), atol=1e-6)
+
+def test_finds_the_peak_in_few_evaluations():
+    optimizer = GaussianProcessOptimizer([-20, 35600, -29000], [20, 36600, -25000], seed=1)
+    rng = np.random.default_rng(1)
+
+    setpoint = np.array([0, 36100, -27000])
+    for _ in range(40):
+        optimizer.tell(setpoint, count_function(setpoint) + rng.normal(0, 1))
+        setpoint = optimizer.ask()
+        assert np.all(setpoint >= optimizer.lower_bounds) and np.all(setpoint <= optimizer.upper_bounds)
+
+    assert count_function(optimizer.best_setpoint()) > 2000 - 10
+
+def test_ask_stays_fast_with_many_observations():
+    optimizer = GaussianProcessOptimizer([-20, 35600, -29000], [20, 36600, -25000], seed=2)
+    rng = np.random.default_rng(2)
+    for _ in range(300):
+        setpoint = rng.integers(optimizer.lower_bounds, optimizer.upper_bounds + 1)
+        optimizer.tell(setpoint, count_function(setpoint))
+
+    start = time.perf_counter()
+    optimizer.ask()
+    assert time.perf_counter() - start < 0.5
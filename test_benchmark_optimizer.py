@@ -0,0 +1,81 @@
+import sys
+import subprocess
+
+import numpy as np
+
+from benchmark_optimizer import OPTIMIZER_MODES, SyntheticLandscape, ReplayLandscape, default_landscapes, run_benchmark, run_suite
+
+def test_every_mode_runs_headless():
+    for settings in OPTIMIZER_MODES.values():
+        result = run_benchmark(default_landscapes(seed=0)['noisy'], settings, max_shots=40, seed=0)
+        assert result['image_groups'] == 20
+        assert result['step_time_mean_us'] > 0
+        assert len(result['final_setpoint']) == 3
+
+def test_benchmark_does_not_import_qt():
+    code = "import sys, benchmark_optimizer; print(any(name.startswith(('PyQt', 'PySide', 'pyqtgraph')) for name in sys.modules))"
+    assert subprocess.check_output([sys.executable, '-c', code], text=True).strip() == 'False'
+
+def test_synthetic_landscape_features():
+    landscape = SyntheticLandscape((0, 0, 0), (1, 1, 1), height=100, background=10, plateau_step=25, drift=(1, 0, 0))
+    assert landscape.true_count((0, 0, 0)) == 100
+    assert landscape.true_count((5, 0, 0), shot=5) == 100
+    assert landscape.true_count((40, 0, 0)) == 0
+
+def test_shots_to_target_on_an_easy_landscape():
+    # the peak is 10 focus steps (more than a width) away from the start, the count starts below the target
+    landscape = SyntheticLandscape((-140, 36100, -27000), (8, 200, 800))
+    assert landscape.true_count((-150, 36100, -27000)) < 1900
+    result = run_benchmark(landscape, OPTIMIZER_MODES['gradient'], max_shots=40, seed=0)
+    assert 4 <= result['shots_to_target'] <= 20
+
+def test_replay_of_a_parameter_log(tmp_path):
+    log_path = tmp_path / 'parameter_log.csv'
+    log_path.write_text(
+        '0.0,1,-150,36100,-27000,1000.0,\n'
+        '1.0,2,-149,36101,-26999,1500.0,\n'
+    )
+    landscape = ReplayLandscape(str(log_path), seed=0)
+
+    assert landscape.initial_setpoint == (-150, 36100, -27000)
+    assert landscape.true_count((-149, 36101, -26999)) == 1500.0
+    assert landscape.count_range() == (1000.0, 1500.0)
+
+    summary = run_suite({'replay': lambda seed: ReplayLandscape(str(log_path), seed=seed)}, ['gradient'], repeats=2, max_shots=10, initial_setpoint=landscape.initial_setpoint)
+    assert summary[0]['landscape'] == 'replay'
+    assert np.isfinite(summary[0]['final_count'])
+
+def test_replay_of_a_parameter_log_of_every_actuator(tmp_path):
+    log_path = tmp_path / 'parameter_log.csv'
+    log_path.write_text(
+        '0.0,1,-150,3,-4,36100,-27000,1000.0,\n'
+        '1.0,2,-149,4,-4,36101,-26999,1500.0,a.tiff;b.tiff\n'
+    )
+    landscape = ReplayLandscape(str(log_path), seed=0)
+
+    assert landscape.initial_setpoint == (-150, 3, -4, 36100, -27000)
+    assert landscape.true_count((-149, 4, -4, 36101, -26999)) == 1500.0
+
+    result = run_benchmark(landscape, OPTIMIZER_MODES['gradient_least_squares'], initial_setpoint=landscape.initial_setpoint, max_shots=10, seed=0)
+    assert len(result['final_setpoint']) == 5
+
+def test_adaptive_image_group_takes_more_shots_where_the_count_is_noisy():
+    settings = {**OPTIMIZER_MODES['gradient'], 'adaptive_image_group': True, 'max_image_group': 12}
+    quiet = run_benchmark(SyntheticLandscape((-140, 36300, -26200), (8, 200, 800), noise_std=1, seed=0), settings, max_shots=60, seed=0)
+    noisy = run_benchmark(SyntheticLandscape((-140, 36300, -26200), (8, 200, 800), noise_std=100, seed=0), settings, max_shots=60, seed=0)
+
+    assert quiet['shots_per_setpoint'] == 2
+    assert 2 < noisy['shots_per_setpoint'] <= 12
+
+def test_least_squares_gradient_reaches_the_peak():
+    for seed in range(3):
+        for quadratic in (False, True):
+            settings = {**OPTIMIZER_MODES['gradient_least_squares'], 'fit_quadratic': quadratic}
+            result = run_benchmark(default_landscapes(seed=seed)['quadratic'], settings, max_shots=400, seed=seed)
+            assert result['shots_to_target'] is not None
+
+def test_spsa_reaches_the_peak():
+    for seed in range(3):
+        result = run_benchmark(default_landscapes(seed=seed)['quadratic'], OPTIMIZER_MODES['spsa'], max_shots=400, seed=seed)
+        assert result['shots_to_target'] is not None
+        assert result['shots_to_reported_convergence'] is None or result['shots_to_reported_convergence'] >= result['shots_to_target']
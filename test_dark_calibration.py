@@ -0,0 +1,55 @@
+import os
+
+import cv2
+import numpy as np
+
+from dark_calibration import DarkCalibration, calibrate, load_calibration, synthetic_frames, benchmark
+
+def write_backgrounds(tmp_path, count=8):
+    rng = np.random.default_rng(1)
+    dark = rng.normal(400, 5, (48, 64))
+    dark[10, 20] = 9000
+    paths = []
+    for index in range(count):
+        path = str(tmp_path / f'background_{index}.tiff')
+        cv2.imwrite(path, np.rint(dark + rng.normal(0, 3, dark.shape)).astype(np.uint16))
+        paths.append(path)
+    return paths, dark
+
+def test_hot_pixels_are_masked_and_the_calibration_is_cached(tmp_path):
+    paths, dark = write_backgrounds(tmp_path)
+    cache_path = str(tmp_path / 'dark_calibration.npz')
+
+    calibration = calibrate(paths, cache_path, roi=(0, 0, 60, 48))
+    assert not calibration.mask[10, 20]
+    assert not calibration.mask[:, 60:].any()
+    assert np.abs(calibration.dark - dark).max() < 5
+
+    # the same backgrounds and settings load the cached file, anything else rebuilds it
+    modified = os.path.getmtime(cache_path)
+    os.utime(cache_path, (modified - 10, modified - 10))
+    assert calibrate(paths, cache_path, roi=(0, 0, 60, 48)).roi == [0, 0, 60, 48]
+    assert os.path.getmtime(cache_path) == modified - 10
+    assert calibrate(paths, cache_path).roi is None
+    assert load_calibration(cache_path).mask[:, 60:].all()
+
+def test_masked_mean_is_dark_subtracted_and_clips_spikes(tmp_path):
+    dark = np.full((16, 16), 100.0)
+    mask = np.ones((16, 16), dtype=bool)
+    mask[0, 0] = False
+    image = np.full((16, 16), 150, dtype=np.uint16)
+    image[0, 0] = 60000
+    assert DarkCalibration(dark, mask).reduce(image) == 50.0
+
+    image[5, 5] = 60000
+    assert DarkCalibration(dark, mask).reduce(image) > 200
+    assert DarkCalibration(dark, mask, clip_counts=100).reduce(image) == (150 * 254 + 200) / 255 - 100
+
+    path = str(tmp_path / 'frame.tiff')
+    cv2.imwrite(path, image)
+    assert DarkCalibration(dark, mask, clip_counts=100).count(path) == DarkCalibration(dark, mask, clip_counts=100).reduce(image)
+
+def test_calibrated_counts_follow_blur_then_mean():
+    result = benchmark(*synthetic_frames(6, shape=(128, 160)), repeats=1)
+    assert abs(result['slope'] - 1) < 0.01
+    assert result['correlation'] > 0.9999
@@ -0,0 +1,93 @@
+import time
+import random
+import threading
+
+from frame_pipeline import StageQueue, LatestWinsStage, FramePipeline
+
+def slow_reduce(image_path):
+    time.sleep(random.uniform(0, 0.005))
+    return float(image_path)
+
+def test_frames_reach_the_consumer_in_acquisition_order():
+    results = []
+    pipeline = FramePipeline(lambda frame, count: results.append(count), reduce_function=slow_reduce, max_workers=4)
+    pipeline.submit([str(i) for i in range(100)])
+    pipeline.shutdown()
+
+    assert results == [float(i) for i in range(100)]
+    assert pipeline.max_queue_depths()['reduce'] <= pipeline.max_in_flight
+
+def test_burst_with_slow_consumer_stays_bounded():
+    results = []
+
+    def slow_consumer(frame, count):
+        time.sleep(0.002)
+        results.append(count)
+
+    pipeline = FramePipeline(slow_consumer, reduce_function=float, max_workers=2, detection_queue_size=20, aggregation_queue_size=5, max_in_flight=4)
+
+    # the file watcher is never blocked, the oldest frames are dropped instead
+    start = time.monotonic()
+    pipeline.submit([str(i) for i in range(500)])
+    assert time.monotonic() - start < 0.5
+    pipeline.shutdown()
+
+    max_depths = pipeline.max_queue_depths()
+    assert max_depths['detection'] <= 20
+    assert max_depths['aggregation'] <= 5
+    assert max_depths['reduce'] <= 4
+    assert pipeline.dropped_frames() == 500 - len(results)
+
+    # what got through is still in order and ends with the newest frames
+    assert results == sorted(results)
+    assert results[-1] == 499.0
+
+def test_failed_frames_free_their_slot():
+    results = []
+
+    def reduce_or_fail(image_path):
+        if image_path.startswith('bad'):
+            raise ValueError('truncated frame')
+        return 1.0
+
+    pipeline = FramePipeline(lambda frame, count: results.append(frame['path']), reduce_function=reduce_or_fail, max_workers=1, max_in_flight=1)
+    pipeline.submit(['bad0', 'a', 'bad1', 'b'])
+    pipeline.shutdown()
+
+    assert results == ['a', 'b']
+    assert pipeline.queue_depths()['reduce'] == 0
+
+def test_blocking_queue_applies_backpressure():
+    queue = StageQueue('test', maxsize=2)
+    queue.put(1)
+    queue.put(2)
+
+    put_done = threading.Event()
+    threading.Thread(target=lambda: (queue.put(3), put_done.set()), daemon=True).start()
+    assert not put_done.wait(0.05)
+
+    assert queue.get() == 1
+    assert put_done.wait(1.0)
+    assert queue.depth() == 2
+
+def test_latest_wins_stage_skips_superseded_items():
+    applied = []
+    release = threading.Event()
+
+    def apply(item):
+        release.wait()
+        applied.append(item)
+
+    stage = LatestWinsStage('actuation', apply)
+    stage.put(0)
+    time.sleep(0.05)
+
+    # 1 and 2 arrive while 0 is still being applied, only 2 is applied after it
+    stage.put(1)
+    stage.put(2)
+    release.set()
+    stage.wait()
+    stage.close()
+
+    assert applied == [0, 2]
+    assert stage.replaced == 1
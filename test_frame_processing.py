@@ -0,0 +1,55 @@
+import time
+import random
+
+import cv2
+import numpy as np
+
+from frame_processing import FramePool, calc_count_per_image, read_and_reduce
+
+def slow_reduce(image_path):
+    # finish frames out of order on purpose
+    time.sleep(random.uniform(0, 0.01))
+    return float(image_path)
+
+def test_counts_come_back_in_acquisition_order():
+    results = []
+    pool = FramePool(lambda image_path, count: results.append(count), reduce_function=slow_reduce, max_workers=4)
+
+    pool.submit([str(i) for i in range(50)])
+    pool.wait()
+    pool.shutdown()
+
+    assert results == [float(i) for i in range(50)]
+    assert pool.queue_depth() == 0
+    assert pool.max_queue_depth == 50
+
+def test_failed_frame_is_skipped():
+    results = []
+
+    def reduce_or_fail(image_path):
+        if image_path == 'bad':
+            raise ValueError('truncated frame')
+        return 1.0
+
+    pool = FramePool(lambda image_path, count: results.append(image_path), reduce_function=reduce_or_fail, max_workers=2)
+    pool.submit(['a', 'bad', 'b'])
+    pool.wait()
+    pool.shutdown()
+
+    assert results == ['a', 'b']
+
+def test_calc_count_per_image_matches_blur_then_mean(tmp_path):
+    image = np.random.default_rng(0).integers(0, 4000, size=(64, 80), dtype=np.uint16)
+    image_path = str(tmp_path / 'frame.tiff')
+    cv2.imwrite(image_path, image)
+
+    assert calc_count_per_image(image_path) == cv2.medianBlur(image, 5).mean()
+
+def test_read_and_reduce_maps_tiffs_and_decodes_anything_else(tmp_path):
+    image = np.random.default_rng(1).integers(0, 4000, size=(32, 40), dtype=np.uint16)
+    tiff_path, png_path = str(tmp_path / 'frame.tiff'), str(tmp_path / 'frame.png')
+    cv2.imwrite(tiff_path, image)
+    cv2.imwrite(png_path, image)
+
+    for image_path in (tiff_path, png_path):
+        assert read_and_reduce(image_path, lambda frame: (frame.shape, int(frame.sum()))) == ((32, 40), int(image.sum()))
@@ -0,0 +1,77 @@
+import time
+
+import cv2
+import numpy as np
+
+from frame_quality import FrameStatistics, frame_statistics, calc_frame_statistics, robust_inliers, trimmed_inliers
+from optimization_engine import OptimizationEngine
+from optimizer_core import BetatronOptimizer
+
+def test_statistics_come_with_the_same_count(tmp_path):
+    rng = np.random.default_rng(0)
+    image = rng.integers(900, 1100, (64, 80), dtype=np.uint16)
+    image[20:40, 30:50] += 2000
+    image[30, 40:44] = 65535
+    path = str(tmp_path / 'frame.tiff')
+    cv2.imwrite(path, image)
+
+    statistics = calc_frame_statistics(path)
+    assert statistics.count == cv2.medianBlur(image, 5).mean()
+    assert statistics.saturated_fraction == 4 / image.size
+    assert abs(statistics.background - 1000) < 5
+    assert statistics.spread > 500
+    assert frame_statistics(image, saturation_level=3000).saturated_fraction == np.count_nonzero(image >= 3000) / image.size
+
+def test_outliers_are_left_out_in_any_statistic():
+    # count, background, spread: a misfire (no x-rays) and a partial frame (dark lower half)
+    frames = np.array([[1500, 1000, 400], [1510, 1001, 405], [1000, 1000, 60], [1490, 999, 398], [1505, 500, 700], [1495, 1002, 402]])
+    assert robust_inliers(frames).tolist() == [True, True, False, True, False, True]
+
+    # a statistic that does not change between the frames cannot tell them apart
+    assert robust_inliers([[10, 5], [11, 5], [12, 5], [10.5, 6]]).all()
+    assert trimmed_inliers([5, 1, 3, 100], 0.25).tolist() == [True, False, True, False]
+
+def test_misfired_frames_do_not_move_the_group_count():
+    optimizer = BetatronOptimizer([-150], {0: 36100, 1: -27000})
+    optimizer.image_group = 4
+    for count, quality in ((1500, (1000, 400)), (1000, (1000, 60)), (1510, (1001, 405)), (1490, (999, 398))):
+        optimizer.add_image_count(count, quality)
+    assert list(optimizer.count_history) == [1500.0]
+    assert optimizer.rejected_shots == 1
+
+    # the whole group counts, not only its last frame
+    optimizer = BetatronOptimizer([-150], {0: 36100, 1: -27000})
+    for count in (100.0, 200.0):
+        optimizer.add_image_count(count)
+    assert list(optimizer.count_history) == [150.0]
+
+def test_a_misfire_in_a_group_of_two_frames_is_left_out_at_the_defaults():
+    optimizer = BetatronOptimizer([-150], {0: 36100, 1: -27000})
+    assert optimizer.image_group == 2
+    rng = np.random.default_rng(0)
+    for _ in range(8):
+        optimizer.add_image_count(1500 + rng.normal(0, 10), (1000 + rng.normal(0, 2), 400 + rng.normal(0, 5)))
+
+    # no x-rays: the count drops to the background and the spread collapses
+    optimizer.add_image_count(1000.0, (1000.0, 60.0))
+    optimizer.add_image_count(1505.0, (1001.0, 402.0))
+    assert optimizer.count_history[-1] == 1505.0
+    assert optimizer.rejected_shots == 1
+
+    # a group whose frames both moved away is a new count, not a misfire
+    optimizer.add_image_count(1800.0, (1000.0, 450.0))
+    optimizer.add_image_count(1810.0, (1001.0, 452.0))
+    assert optimizer.count_history[-1] == 1805.0
+    assert optimizer.rejected_shots == 1
+
+def test_saturated_frames_never_reach_the_image_group():
+    engine = OptimizationEngine([-150, 0, 0], {0: 36100, 1: -27000})
+
+    def frame(name):
+        return {'path': name, 'detected': time.monotonic(), 'tag': engine.setpoint_generation}
+
+    engine.process_frame(frame('saturated.tiff'), FrameStatistics(3000.0, 0.2, 1000.0, 5000.0))
+    engine.process_frame(frame('good.tiff'), FrameStatistics(1500.0, 0.0, 1000.0, 400.0))
+    assert engine.saturated_frames == 1
+    assert engine.optimizer.group_counts == [1500.0]
+    assert engine.optimizer.group_quality == [(1000.0, 400.0)]
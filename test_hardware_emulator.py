@@ -0,0 +1,18 @@
+from benchmark_optimizer import SyntheticLandscape
+from hardware_emulator import HardwareEmulator, run_emulation
+
+def test_closed_loop_through_the_emulated_hardware(tmp_path):
+    landscape = SyntheticLandscape((-140, 36300, -26200), (8, 200, 800), noise_std=5, seed=0)
+    emulator = HardwareEmulator(landscape, rep_rate=40.0, settle_delay=0.02, shape=(64, 80), workdir=str(tmp_path), seed=0)
+    report = run_emulation(emulator, duration=2.0, gui=False)
+
+    # every frame the camera wrote was read exactly once, counted or dropped as taken before its setpoint settled
+    assert report['frames_processed'] + report['unsettled_frames'] + report['stale_frames'] == report['frames_written']
+    assert report['frames_per_second'] > 5
+    assert report['image_groups'] == report['frames_processed'] // 2
+
+    # every new setpoint went through the ftp endpoints, only the parameter files that changed, and the camera moved with them
+    assert report['setpoint_commands'] + report['unchanged_setpoints'] == report['image_groups']
+    assert report['uploads'] == 2 * report['setpoint_commands'] - report['skipped_writes']
+    assert report['final_setpoint'] == emulator.engine.optimizer.current_setpoint()
+    assert report['loop_latency_p50_ms'] is not None
@@ -0,0 +1,64 @@
+import numpy as np
+
+from history_buffer import HistoryBuffer
+
+def test_growing_buffer_matches_np_append():
+    history = HistoryBuffer(float, capacity=2)
+    reference = np.array([])
+
+    for value in range(100):
+        history.append(value * 0.5)
+        reference = np.append(reference, value * 0.5)
+
+    assert len(history) == 100
+    assert np.array_equal(history.values(), reference)
+    assert history[-1] == reference[-1]
+    assert history[-2] == reference[-2]
+
+def test_values_are_views():
+    history = HistoryBuffer(int, capacity=8)
+    for value in range(5):
+        history.append(value)
+
+    view = history.values()
+    assert view.base is history.data
+    assert not view.flags.writeable
+
+def test_ring_buffer_keeps_latest_values():
+    history = HistoryBuffer(int, maxlen=3)
+    for value in range(7):
+        history.append(value)
+
+    assert len(history) == 3
+    assert list(history.values()) == [4, 5, 6]
+    assert history[-1] == 6
+    assert history[-2] == 5
+    assert history.values().base is history.data
+
+def test_rows_of_a_fixed_shape():
+    history = HistoryBuffer(int, capacity=1, shape=(3,))
+    for row in range(5):
+        history.append([row, row + 1, row + 2])
+    history.extend([[5, 6, 7], [6, 7, 8]])
+
+    assert len(history) == 7
+    assert history.values().shape == (7, 3)
+    assert history[-1].tolist() == [6, 7, 8]
+    assert history.values()[:, 0].tolist() == list(range(7))
+
+    ring = HistoryBuffer(float, maxlen=2, shape=(2,))
+    for row in range(3):
+        ring.append([row, -row])
+    assert ring.values().tolist() == [[1, -1], [2, -2]]
+
+def test_resized_keeps_the_latest_values():
+    history = HistoryBuffer(int, shape=(2,))
+    history.extend([[value, -value] for value in range(6)])
+
+    shorter = history.resized(4)
+    assert shorter.maxlen == 4
+    assert shorter.values().tolist() == [[2, -2], [3, -3], [4, -4], [5, -5]]
+    shorter.append([6, -6])
+    assert shorter[0].tolist() == [3, -3]
+
+    assert shorter.resized(None).values().tolist() == [[3, -3], [4, -4], [5, -5], [6, -6]]
@@ -0,0 +1,44 @@
+import os
+
+from image_index import ImageIndex
+
+def touch(path):
+    with open(path, 'wb') as file:
+        file.write(b'')
+
+def test_scan_then_incremental_updates(tmp_path):
+    for name in ['a.tiff', 'b.tiff', 'notes.txt']:
+        touch(tmp_path / name)
+        os.utime(tmp_path / name)
+
+    index = ImageIndex(str(tmp_path))
+    assert sorted(os.path.basename(path) for path in index.scan()) == ['a.tiff', 'b.tiff']
+
+    new_path = str(tmp_path / 'c.tiff')
+    touch(new_path)
+    key = index.add(new_path)
+
+    # the key is set once, adding again does not stat or reorder
+    assert index.add(new_path) == key
+    assert max(index.order_keys.values()) == key
+    assert len(index) == 3
+
+    index.remove(str(tmp_path / 'a.tiff'))
+    assert str(tmp_path / 'a.tiff') not in index
+    assert len(index) == 2
+
+def test_out_of_order_add_is_sorted(tmp_path):
+    index = ImageIndex(str(tmp_path))
+    index.add(str(tmp_path / 'late.tiff'), ctime=2.0)
+    index.add(str(tmp_path / 'early.tiff'), ctime=1.0)
+
+    assert sorted([str(tmp_path / 'late.tiff'), str(tmp_path / 'early.tiff')], key=index.order_key) == [str(tmp_path / 'early.tiff'), str(tmp_path / 'late.tiff')]
+
+def test_move_keeps_position(tmp_path):
+    index = ImageIndex(str(tmp_path))
+    index.add(str(tmp_path / 'first.tiff'), ctime=1.0)
+    index.add(str(tmp_path / 'second.tiff'), ctime=2.0)
+    index.move(str(tmp_path / 'first.tiff'), str(tmp_path / 'renamed.tiff'))
+
+    assert str(tmp_path / 'first.tiff') not in index
+    assert sorted([str(tmp_path / 'second.tiff'), str(tmp_path / 'renamed.tiff')], key=index.order_key) == [str(tmp_path / 'renamed.tiff'), str(tmp_path / 'second.tiff')]
@@ -0,0 +1,27 @@
+import os
+import sys
+import subprocess
+
+from import_benchmark import run_benchmark, regressions
+
+# the repository on the path of the interpreters started in another working directory
+ENV = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+
+def test_entry_points_import_without_heavy_dependencies():
+    results = run_benchmark(['optimizer_core', 'optimization_engine', 'multivariable_gradient_descent_optimization'], repeats=1)
+    assert regressions(results) == []
+    assert regressions(results, {'optimizer_core': {'import_ms': results['optimizer_core']['import_ms'] / 10}}) != []
+
+def test_importing_the_app_reads_no_parameter_files(tmp_path):
+    # no parameter files in the working directory, an empty one would not be read either
+    code = "import multivariable_gradient_descent_optimization as app; print(callable(app.main))"
+    output = subprocess.check_output([sys.executable, '-c', code], text=True, cwd=tmp_path, env=ENV)
+    assert output.strip() == 'True'
+
+def test_app_reports_an_empty_mirror_file(tmp_path):
+    (tmp_path / 'dm_parameters.txt').write_text('')
+    (tmp_path / 'dazzler_parameters.txt').write_text('order2 = 0\norder3 = 0\n')
+    code = "import sys, multivariable_gradient_descent_optimization as app; code = app.main([]); print(code, 'pyqtgraph' in sys.modules)"
+    output = subprocess.check_output([sys.executable, '-c', code], text=True, cwd=tmp_path, env=ENV)
+    assert 'dm_parameters.txt: no actuator values' in output
+    assert output.strip().endswith('1 False')
@@ -0,0 +1,59 @@
+import numpy as np
+
+from local_fit import LocalLinearFit
+
+def test_linear_fit_recovers_gradient_and_noise():
+    rng = np.random.default_rng(0)
+    true_gradient = np.array([3.0, -0.2, 0.05])
+    fit = LocalLinearFit([0, 36000, -27000], [20, 500, 2000], window=200)
+
+    for _ in range(200):
+        setpoint = np.array([0, 36000, -27000]) + rng.integers(-20, 21, size=3) * [1, 25, 100]
+        count = 2000 + true_gradient @ (setpoint - [0, 36000, -27000]) + rng.normal(0, 4)
+        fit.add(setpoint, count)
+
+    assert np.allclose(fit.gradient([0, 36000, -27000]), true_gradient, rtol=0.05)
+    assert 3 < fit.residual_std() < 5
+
+def test_window_downdate_matches_fresh_fit():
+    rng = np.random.default_rng(1)
+    rolling_fit = LocalLinearFit([0, 0], [1, 1], window=5, quadratic=True)
+    samples = [(rng.normal(size=2), rng.normal()) for _ in range(40)]
+
+    for setpoint, count in samples:
+        rolling_fit.add(setpoint, count)
+
+    # a two parameter quadratic model has 6 coefficients, the window grows to 8
+    assert rolling_fit.window == 8
+    fresh_fit = LocalLinearFit([0, 0], [1, 1], window=5, quadratic=True)
+    for setpoint, count in samples[-8:]:
+        fresh_fit.add(setpoint, count)
+
+    assert np.allclose(rolling_fit.xtwx, fresh_fit.xtwx)
+    assert np.allclose(rolling_fit.xtwy, fresh_fit.xtwy)
+
+def test_quadratic_fit_gradient_vanishes_at_peak():
+    fit = LocalLinearFit([0, 0], [10, 10], window=50, quadratic=True)
+    rng = np.random.default_rng(2)
+    for _ in range(50):
+        setpoint = rng.integers(-10, 11, size=2)
+        fit.add(setpoint, 100 - (setpoint[0] - 3) ** 2 - (setpoint[1] + 2) ** 2)
+
+    assert np.allclose(fit.gradient([3, -2]), 0, atol=1e-6)
+    assert np.allclose(fit.gradient([0, 0]), [6, -4])
+
+def test_window_holds_more_setpoints_than_the_model_has_coefficients():
+    fit = LocalLinearFit([0, 0, 0], [1, 1, 1], window=10, quadratic=True)
+    assert fit.feature_count == 10
+    assert fit.window == 12
+
+    for step in range(12):
+        fit.add([step % 3, step % 4, step % 5], float(step))
+    assert fit.is_ready()
+
+def test_parameters_without_spread_are_unexplored():
+    fit = LocalLinearFit([0, 0], [1, 1], window=5)
+    assert list(fit.unexplored()) == [True, True]
+    for step in range(5):
+        fit.add([step, 3], float(step))
+    assert list(fit.unexplored()) == [False, True]
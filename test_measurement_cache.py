@@ -0,0 +1,68 @@
+import numpy as np
+
+from measurement_cache import MeasurementCache
+from optimization_engine import OptimizationEngine, read_parameter_files
+
+def test_merged_statistics_match_all_shots():
+    rng = np.random.default_rng(0)
+    shots = rng.normal(1000, 30, 12)
+    cache = MeasurementCache(max_age=60)
+    for group in np.split(shots, [2, 5, 9]):
+        cache.add((-150, 36100, -27000), len(group), group.mean(), ((group - group.mean()) ** 2).sum(), now=0.0)
+
+    count, mean, m2 = cache.get((-150, 36100, -27000), now=1.0)
+    assert count == 12
+    assert np.isclose(mean, shots.mean())
+    assert np.isclose(m2 / (count - 1), shots.var(ddof=1))
+
+def test_entries_expire_after_max_age_of_their_first_shot():
+    cache = MeasurementCache(max_age=10)
+    cache.add((0, 0, 0), 2, 100.0, now=0.0)
+    cache.add((0, 0, 0), 2, 200.0, now=8.0)
+    cache.add((1, 0, 0), 2, 300.0, now=8.0)
+
+    assert cache.get((0, 0, 0), now=9.0)[1] == 150.0
+    assert cache.get((0, 0, 0), now=11.0) is None
+    assert len(cache) == 1
+
+def test_response_map_export(tmp_path):
+    cache = MeasurementCache(max_age=60, clock=lambda: 5.0)
+    cache.add((-150, 36100, -27000), 3, 1000.0, 8.0, now=0.0)
+    cache.add((-149, 36101, -26999), 1, 1100.0, now=1.0)
+
+    response_map = cache.response_map()
+    assert response_map['setpoints'].tolist() == [[-150, 36100, -27000], [-149, 36101, -26999]]
+    assert response_map['shots'].tolist() == [3, 1]
+    assert np.isclose(response_map['standard_error'][0], np.sqrt(8.0 / 2 / 3))
+    assert np.isnan(response_map['standard_error'][1])
+    assert response_map['age'].tolist() == [5.0, 4.0]
+
+    cache.export(str(tmp_path / 'response_map.csv'))
+    assert (tmp_path / 'response_map.csv').read_text().splitlines()[1] == '-150,36100,-27000,1000.000,1.155,3,5.0'
+    cache.export(str(tmp_path / 'response_map.npz'))
+    assert np.load(tmp_path / 'response_map.npz')['mean'].tolist() == [1000.0, 1100.0]
+
+def test_revisited_setpoints_are_not_measured_again(tmp_path):
+    (tmp_path / 'dm_parameters.txt').write_text('-150 0 0')
+    (tmp_path / 'dazzler_parameters.txt').write_text('order2 = 36100\norder3 = -27000\n')
+    engine = OptimizationEngine(*read_parameter_files(str(tmp_path / 'dm_parameters.txt'), str(tmp_path / 'dazzler_parameters.txt')))
+    engine.MIRROR_FILE_PATH = str(tmp_path / 'dm_parameters.txt')
+    engine.DISPERSION_FILE_PATH = str(tmp_path / 'dazzler_parameters.txt')
+    engine.PARAMETER_LOG_PATH = str(tmp_path / 'parameter_log.csv')
+    engine.ACTUATION_LOG_PATH = str(tmp_path / 'actuation_log.csv')
+    engine.optimizer.cache_reuse = True
+    states = []
+    engine.subscribe(states.append)
+
+    # the cache already knows the setpoint the first step moves to
+    engine.optimizer.random_direction = [1, 1, 1, 1]
+    engine.optimizer.measurement_cache.add((-149, 36101, -26999), 2, 900.0)
+    for count in (1000.0, 1000.0):
+        engine.process_image_count('frame.tiff', count)
+
+    # two image groups from two frames, the second one came from the cache
+    assert [state['shots'] for state in states] == [2, 0]
+    assert list(engine.optimizer.count_history) == [1000.0, 900.0]
+    assert engine.optimizer.images_processed == 2
+    assert engine.setpoint_generation == 1
+    assert len((tmp_path / 'parameter_log.csv').read_text().splitlines()) == 2
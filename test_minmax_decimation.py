@@ -0,0 +1,39 @@
+import numpy as np
+
+from minmax_decimation import MinMaxDecimator
+
+def test_short_series_is_kept_as_is():
+    decimator = MinMaxDecimator(max_points=100)
+    decimator.extend(range(10), np.arange(10) ** 2)
+
+    x, y = decimator.data()
+    assert list(x) == list(range(10))
+    assert list(y) == [value ** 2 for value in range(10)]
+
+def test_long_series_is_bounded_and_keeps_the_extremes():
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=100000)
+    y[12345] = 50.0
+    y[67890] = -50.0
+
+    decimator = MinMaxDecimator(max_points=1000)
+    decimator.extend(range(len(y)), y)
+    x_plot, y_plot = decimator.data()
+
+    assert len(decimator) == len(y)
+    assert len(x_plot) <= 1002
+    assert np.all(np.diff(x_plot) >= 0)
+
+    # single shot spikes survive the decimation
+    assert y_plot.max() == 50.0 and x_plot[np.argmax(y_plot)] == 12345
+    assert y_plot.min() == -50.0 and x_plot[np.argmin(y_plot)] == 67890
+
+def test_every_bucket_holds_its_own_extremes():
+    y = np.sin(np.arange(4096) / 50.0)
+    decimator = MinMaxDecimator(max_points=64)
+    decimator.extend(range(len(y)), y)
+    x_plot, y_plot = decimator.data()
+
+    # the drawn points are measured points and span the range of the series
+    assert np.all(y_plot == y[x_plot.astype(int)])
+    assert y_plot.max() == y.max() and y_plot.min() == y.min()
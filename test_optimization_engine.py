@@ -0,0 +1,263 @@
+import os
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from optimization_engine import OptimizationEngine, read_parameter_files, engine_from_parameter_files
+from setpoint_association import ActuationLog
+from state_stream import StatePublisher, StateSubscriber
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def make_engine(tmp_path):
+    (tmp_path / 'dm_parameters.txt').write_text('-150 0 0')
+    (tmp_path / 'dazzler_parameters.txt').write_text('order2 = 36100\norder3 = -27000\n')
+    engine = OptimizationEngine(*read_parameter_files(str(tmp_path / 'dm_parameters.txt'), str(tmp_path / 'dazzler_parameters.txt')))
+
+    (tmp_path / 'images').mkdir()
+    engine.IMG_PATH = str(tmp_path / 'images')
+    engine.MIRROR_FILE_PATH = str(tmp_path / 'dm_parameters.txt')
+    engine.DISPERSION_FILE_PATH = str(tmp_path / 'dazzler_parameters.txt')
+    engine.PARAMETER_LOG_PATH = str(tmp_path / 'parameter_log.csv')
+    engine.ACTUATION_LOG_PATH = str(tmp_path / 'actuation_log.csv')
+    engine.JOURNAL_PATH = str(tmp_path / 'run_journal.bin')
+    return engine
+
+def test_engine_runs_without_gui(tmp_path):
+    engine = make_engine(tmp_path)
+    states = []
+    engine.subscribe(states.append)
+    engine.start()
+
+    # write the frames next to the directory and move them in, so they are complete when the engine sees them
+    rng = np.random.default_rng(0)
+    for i in range(6):
+        cv2.imwrite(str(tmp_path / f'frame{i}.tiff'), rng.integers(0, 4000, (32, 32), dtype=np.uint16))
+        os.rename(tmp_path / f'frame{i}.tiff', tmp_path / 'images' / f'frame{i:04d}.tiff')
+        time.sleep(0.05)
+
+    assert wait_for(lambda: len(states) == 3)
+    engine.stop()
+
+    assert [state['image_group'] for state in states] == [1, 2, 3]
+    assert (tmp_path / 'dm_parameters.txt').read_text() == f"{states[-1]['focus']} 0 0"
+    assert len((tmp_path / 'parameter_log.csv').read_text().splitlines()) == 3
+
+    # the initial setpoint and every new one applied after it, image groups that left the setpoint unchanged send nothing
+    assert engine.actuator_commands.commands + engine.unchanged_setpoints == 3
+    assert len((tmp_path / 'actuation_log.csv').read_text().splitlines()) == 1 + engine.actuator_commands.commands
+
+    # every stage of the hot path was timed
+    assert {'detection_queue', 'imread', 'median_blur', 'mean', 'optimizer', 'file_write', 'parameter_log', 'frame_total'} <= set(engine.timer.percentiles())
+
+    # derivatives are published with the image groups that computed them
+    assert 'derivative' not in states[0]
+    assert 'derivative' in states[1]
+
+def test_frames_written_in_place_are_read_once_and_complete(tmp_path):
+    engine = make_engine(tmp_path)
+    counts = []
+    engine.process_image_count = lambda image_path, count, quality=None: counts.append((image_path, count))
+    engine.start()
+
+    # the camera writes every frame in a few chunks straight into the watched directory
+    rng = np.random.default_rng(0)
+    expected = {}
+    for i in range(8):
+        image = rng.integers(0, 4000, (32, 32), dtype=np.uint16)
+        cv2.imwrite(str(tmp_path / 'encoded.tiff'), image)
+        data = (tmp_path / 'encoded.tiff').read_bytes()
+        path = str(tmp_path / 'images' / f'frame{i:04d}.tiff')
+        with open(path, 'wb') as file:
+            for start in range(0, len(data), 700):
+                file.write(data[start:start + 700])
+                file.flush()
+                time.sleep(0.005)
+        expected[path] = cv2.medianBlur(image, 5).mean()
+
+    assert wait_for(lambda: len(counts) == 8)
+    time.sleep(0.1)
+    engine.stop()
+
+    assert len(counts) == 8
+    assert dict(counts) == expected
+
+def test_failing_subscriber_does_not_stop_the_engine(tmp_path):
+    engine = make_engine(tmp_path)
+    states = []
+
+    def broken(state):
+        raise RuntimeError('plot closed')
+
+    engine.subscribe(broken)
+    engine.subscribe(states.append)
+    for count in (100.0, 110.0):
+        engine.process_image_count('frame.tiff', count)
+
+    assert len(states) == 1
+
+def test_frames_taken_before_the_setpoint_settled_are_not_counted(tmp_path):
+    engine = make_engine(tmp_path)
+    engine.settle_delay = 0.5
+    engine.actuation_log = ActuationLog(engine.settle_delay)
+    engine.actuation_log.record(0, engine.optimizer.current_setpoint(), applied_time=0.0)
+
+    def frame(acquired):
+        return {'path': f'{acquired}.tiff', 'detected': time.monotonic(), 'tag': engine.setpoint_generation, 'acquired': acquired}
+
+    # the first group moves the setpoint and applies it (on this thread, the engine is not started)
+    engine.process_frame(frame(10.0), 100.0)
+    engine.process_frame(frame(11.0), 100.0)
+    assert engine.setpoint_generation == 1
+    applied = engine.actuation_log.applied_times[-1]
+
+    # taken at the old setpoint, while the actuators moved and after they settled
+    engine.process_frame(frame(applied - 1.0), 500.0)
+    engine.process_frame(frame(applied + 0.2), 500.0)
+    engine.process_frame(frame(applied + 0.6), 110.0)
+    engine.process_frame(frame(applied + 0.7), 110.0)
+
+    assert engine.unsettled_frames == 2
+    assert engine.optimizer.image_groups_processed == 2
+    assert list(engine.optimizer.count_history) == [100.0, 110.0]
+
+def test_a_setpoint_that_could_not_be_written_is_sent_again(tmp_path):
+    engine = make_engine(tmp_path)
+    engine.actuation_log = ActuationLog(0.0)
+    engine.actuation_log.record(0, engine.optimizer.current_setpoint(), applied_time=0.0)
+
+    def frame():
+        return {'path': 'frame.tiff', 'detected': time.monotonic(), 'tag': engine.setpoint_generation, 'acquired': time.time()}
+
+    # the new setpoint of the first group can not be written, it never reaches the actuation log
+    mirror_file = engine.MIRROR_FILE_PATH
+    engine.MIRROR_FILE_PATH = str(tmp_path / 'missing' / 'dm_parameters.txt')
+    engine.process_frame(frame(), 100.0)
+    engine.process_frame(frame(), 100.0)
+    assert engine.setpoint_generation == 1
+    assert engine.actuator_commands.needs_retry()
+    engine.MIRROR_FILE_PATH = mirror_file
+
+    # the first frame that is not taken at it sends it again, the next ones count
+    for _ in range(5):
+        engine.process_frame(frame(), 110.0)
+    assert engine.setpoint_resends == 1
+    assert engine.unsettled_frames == 1
+    assert engine.optimizer.image_groups_processed == 3
+    assert (tmp_path / 'dm_parameters.txt').read_text().split()[0] != '-150'
+
+    # without any failure, the setpoint is sent again after max_unsettled_frames frames that were not taken at it
+    engine.max_unsettled_frames = 3
+    generation = engine.setpoint_generation
+    engine.actuation_log.record(generation - 1, engine.optimizer.current_setpoint())
+    for _ in range(3):
+        engine.process_frame(frame(), 120.0)
+    assert engine.setpoint_resends == 2
+    assert engine.actuation_log.last_generation() == generation
+
+def test_states_reach_a_client_in_another_thread():
+    received = []
+    with StatePublisher() as publisher:
+        subscriber = StateSubscriber(publisher.host, publisher.port, received.append, reconnect_interval=0.05)
+        subscriber.start()
+        assert wait_for(lambda: publisher.client_count() == 1)
+
+        for group in range(5):
+            publisher.publish({'image_group': group, 'count': float(group)})
+
+        assert wait_for(lambda: len(received) == 5)
+        subscriber.stop()
+
+    assert [state['image_group'] for state in received] == list(range(5))
+
+def test_publish_never_blocks_and_drops_the_oldest_states():
+    publisher = StatePublisher(max_pending=3)
+
+    # not started, nothing sends the queued states
+    for group in range(5):
+        publisher.publish({'image_group': group})
+
+    assert publisher.dropped == 2
+    assert publisher.pending.qsize() == 3
+
+def test_parameter_files_are_validated_when_the_engine_is_built(tmp_path):
+    mirror_file, dispersion_file = str(tmp_path / 'dm_parameters.txt'), str(tmp_path / 'dazzler_parameters.txt')
+    (tmp_path / 'dm_parameters.txt').write_text('')
+    (tmp_path / 'dazzler_parameters.txt').write_text('order3 = -27000\n\norder2 = 36100')
+    with pytest.raises(ValueError, match='dm_parameters.txt: no actuator values'):
+        engine_from_parameter_files(mirror_file, dispersion_file)
+
+    (tmp_path / 'dm_parameters.txt').write_text('-150 0 0\n')
+    engine = engine_from_parameter_files(mirror_file, dispersion_file, all_actuators=True)
+    assert engine.optimizer.setpoint.tolist() == [-150, 0, 0, 36100, -27000]
+    assert engine.MIRROR_FILE_PATH == mirror_file
+
+    # every actuator is limited to +-200 without a ranges file, with one its lines go with the actuators
+    (tmp_path / 'dm_parameters.txt').write_text('-150 0 250\n')
+    with pytest.raises(ValueError, match='actuator 2 is 250, outside its limits -200..200'):
+        engine_from_parameter_files(mirror_file, dispersion_file, all_actuators=True, mirror_ranges_path=str(tmp_path / 'dm_ranges.txt'))
+    (tmp_path / 'dm_ranges.txt').write_text('20 -200 200\n5 -50 50\n')
+    with pytest.raises(ValueError, match='2 actuator ranges for 3 actuators'):
+        engine_from_parameter_files(mirror_file, dispersion_file, all_actuators=True, mirror_ranges_path=str(tmp_path / 'dm_ranges.txt'))
+    (tmp_path / 'dm_ranges.txt').write_text('20 -200 200\n5 -50 50\n100 0 400\n')
+    engine = engine_from_parameter_files(mirror_file, dispersion_file, all_actuators=True, mirror_ranges_path=str(tmp_path / 'dm_ranges.txt'))
+    assert engine.optimizer.lower_bounds.tolist() == [-170, -5, 150, 35600, -29000]
+    assert engine.optimizer.upper_bounds.tolist() == [-130, 5, 350, 36600, -25000]
+    assert engine.optimizer.parameter_ranges.tolist() == [20, 5, 100, 500, 2000]
+
+    (tmp_path / 'dazzler_parameters.txt').write_text('order2 = 36100\n')
+    with pytest.raises(ValueError, match='no order3 value'):
+        read_parameter_files(mirror_file, dispersion_file)
+    with pytest.raises(ValueError, match='missing.txt'):
+        read_parameter_files(str(tmp_path / 'missing.txt'), dispersion_file)
+
+def test_an_unchanged_setpoint_is_not_sent_again(tmp_path):
+    engine = make_engine(tmp_path)
+    for count in (100.0, 100.0):
+        engine.process_image_count('frame.tiff', count)
+    assert engine.setpoint_generation == 1
+
+    # steps under one unit leave the setpoint where it is, nothing is written and the frames taken at it stay valid
+    (tmp_path / 'dm_parameters.txt').unlink()
+    engine.optimizer.learning_rates[:] = 0
+    for count in (110.0, 110.0):
+        engine.process_image_count('frame.tiff', count)
+    assert engine.optimizer.image_groups_processed == 2
+    assert engine.setpoint_generation == 1
+    assert engine.unchanged_setpoints == 1
+    assert not (tmp_path / 'dm_parameters.txt').exists()
+
+def test_a_setpoint_that_failed_to_upload_is_sent_again(tmp_path):
+    engine = make_engine(tmp_path)
+    engine.upload_enabled = True
+    engine.actuator_uploader = SimpleNamespace(ack_times={'mirror': 1.0, 'dazzler': 1.0})
+    uploads = []
+
+    # the first upload fails on both computers
+    def upload_files(parameters, devices):
+        uploads.append((parameters['generation'], devices))
+        return dict.fromkeys(devices, len(uploads) > 1)
+
+    engine.upload_files = upload_files
+    for count in (100.0, 100.0):
+        engine.process_image_count('frame.tiff', count)
+    assert uploads == [(1, ['mirror', 'dazzler'])]
+
+    # the setpoint does not move, it is sent again since it was not acknowledged
+    engine.optimizer.learning_rates[:] = 0
+    for count in (110.0, 110.0):
+        engine.process_image_count('frame.tiff', count)
+    assert uploads == [(1, ['mirror', 'dazzler']), (2, ['mirror', 'dazzler'])]
+    assert engine.unchanged_setpoints == 0
+
+    for count in (110.0, 110.0):
+        engine.process_image_count('frame.tiff', count)
+    assert len(uploads) == 2
+    assert engine.unchanged_setpoints == 1
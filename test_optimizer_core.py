@@ -0,0 +1,109 @@
+import time
+
+import numpy as np
+
+from optimizer_core import BetatronOptimizer, HISTORY_NAMES
+
+def make_optimizer(actuators=40):
+    mirror_values = [0] * actuators
+    dispersion_values = [36100, -27000]
+    optimizer = BetatronOptimizer(mirror_values, dispersion_values, mirror_actuators=range(actuators))
+    optimizer.random_direction = [1] * optimizer.dimension
+    return optimizer, mirror_values, dispersion_values
+
+def quadratic_count(optimizer, peak):
+    scales = optimizer.parameter_ranges
+    return 10000.0 - 100 * np.sum(((optimizer.setpoint - peak) / scales) ** 2)
+
+def test_every_actuator_is_a_parameter():
+    optimizer, mirror_values, dispersion_values = make_optimizer(5)
+    assert optimizer.parameter_names == ['focus', 'actuator_1', 'actuator_2', 'actuator_3', 'actuator_4', 'second_dispersion', 'third_dispersion']
+    assert list(optimizer.lower_bounds) == [-20] * 5 + [35600, -29000]
+    assert optimizer.FOCUS_UPPER_BOUND == 20
+
+    optimizer.apply_setpoint([1, 2, 3, 4, 5, 36000, -27100])
+    assert mirror_values == [1, 2, 3, 4, 5]
+    assert dispersion_values == [36000, -27100]
+
+def test_spsa_climbs_with_every_actuator():
+    optimizer, mirror_values, _ = make_optimizer(40)
+    optimizer.optimizer_mode = 'spsa'
+    optimizer.random_seed = 0
+    # the count changes by 100 over a parameter range here, far less than on the machine, so the gain is larger
+    optimizer.spsa_gain = 3e-4
+    peak = np.concatenate((np.linspace(-15, 15, 40), [36300, -26500]))
+
+    for _ in range(400):
+        optimizer.add_image_count(quadratic_count(optimizer, peak))
+
+    assert optimizer.count_history[-1] > 9800 > optimizer.count_history[0]
+    assert np.count_nonzero(mirror_values) > 30
+    assert optimizer.derivative_history.values().shape == (99, 42)
+
+def test_gradient_histories_follow_the_moved_parameters():
+    optimizer, _, _ = make_optimizer(40)
+    for _ in range(20):
+        optimizer.add_image_count(quadratic_count(optimizer, np.zeros(42)))
+
+    assert optimizer.setpoint_history.values().shape == (10, 42)
+    assert len(optimizer.focus_history) == np.count_nonzero(optimizer.moved_history.values()[:, 0]) + 1
+    np.testing.assert_array_equal(optimizer.focus_der_history, optimizer.derivative_history.values()[:, 0])
+
+def test_step_takes_microseconds_with_dozens_of_parameters():
+    optimizer, _, _ = make_optimizer(40)
+    peak = np.zeros(42)
+    peak[-2:] = [36300, -26500]
+    for _ in range(4):
+        optimizer.add_image_count(quadratic_count(optimizer, peak))
+
+    step_times = []
+    for _ in range(200):
+        count = quadratic_count(optimizer, peak)
+        optimizer.add_image_count(count)
+        start = time.perf_counter()
+        optimizer.add_image_count(count)
+        step_times.append(time.perf_counter() - start)
+    assert np.median(step_times) < 200e-6
+
+def test_quadratic_local_fit_is_used_when_set_after_construction():
+    optimizer, _, _ = make_optimizer(1)
+    optimizer.gradient_estimator = 'least_squares'
+    optimizer.fit_quadratic = True
+    assert optimizer.local_fit.quadratic
+    assert optimizer.local_fit.window == optimizer.local_fit.feature_count + 2
+
+    peak = np.array([5, 36300, -26500])
+    for _ in range(2 * (optimizer.local_fit.window + 2)):
+        optimizer.add_image_count(quadratic_count(optimizer, peak))
+    assert optimizer.use_local_fit()
+
+    optimizer.fit_window = 30
+    assert optimizer.local_fit.window == 30
+    assert not optimizer.use_local_fit()
+
+def test_local_fit_window_grows_with_every_actuator():
+    optimizer, _, _ = make_optimizer(40)
+    optimizer.gradient_estimator = 'least_squares'
+    assert optimizer.fit_window == 10
+    assert optimizer.local_fit.window == 45
+
+    peak = np.zeros(42)
+    peak[-2:] = [36300, -26500]
+    for _ in range(2 * 46):
+        optimizer.add_image_count(quadratic_count(optimizer, peak))
+    assert optimizer.use_local_fit()
+
+def test_history_maxlen_bounds_every_history():
+    optimizer = BetatronOptimizer([-150], [36100, -27000], history_maxlen=5)
+    assert optimizer.count_history.maxlen == optimizer.setpoint_history.maxlen == 5
+
+    # set after construction, the histories keep their latest values
+    optimizer = BetatronOptimizer([-150], [36100, -27000])
+    for count in range(20):
+        optimizer.add_image_count(float(count))
+    optimizer.history_maxlen = 4
+    assert optimizer.count_history.values().tolist() == [12.5, 14.5, 16.5, 18.5]
+    assert all(len(getattr(optimizer, name)) <= 4 and getattr(optimizer, name).maxlen == 4 for name in HISTORY_NAMES)
+    for count in range(20, 24):
+        optimizer.add_image_count(float(count))
+    assert optimizer.count_history.values().tolist() == [16.5, 18.5, 20.5, 22.5]
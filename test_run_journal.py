@@ -0,0 +1,250 @@
+import numpy as np
+import pytest
+
+from optimization_engine import OptimizationEngine, read_parameter_files
+from optimizer_core import BetatronOptimizer
+from run_journal import RunJournal, read_journal, journal_header, restore_optimizer, changed_settings, JOURNAL_DTYPE, JOURNAL_VERSION, FRAME_RECORD, GROUP_RECORD
+
+def write_parameter_files(tmp_path):
+    (tmp_path / 'dm_parameters.txt').write_text('-150 0 0')
+    (tmp_path / 'dazzler_parameters.txt').write_text('order2 = 36100\norder3 = -27000\n')
+    return read_parameter_files(str(tmp_path / 'dm_parameters.txt'), str(tmp_path / 'dazzler_parameters.txt'))
+
+def make_engine(tmp_path, optimizer_mode='gradient', gradient_estimator='finite_difference'):
+    engine = OptimizationEngine(*write_parameter_files(tmp_path))
+    engine.MIRROR_FILE_PATH = str(tmp_path / 'dm_parameters.txt')
+    engine.DISPERSION_FILE_PATH = str(tmp_path / 'dazzler_parameters.txt')
+    engine.PARAMETER_LOG_PATH = str(tmp_path / 'parameter_log.csv')
+    engine.ACTUATION_LOG_PATH = str(tmp_path / 'actuation_log.csv')
+    engine.JOURNAL_PATH = str(tmp_path / 'run_journal.bin')
+    engine.optimizer.optimizer_mode = optimizer_mode
+    engine.optimizer.gradient_estimator = gradient_estimator
+    engine.optimizer.random_seed = 3
+    engine.optimizer.random_direction = [1, -1, 1, 1]
+    return engine
+
+def simulated_count(setpoint):
+    focus, second_dispersion, third_dispersion = setpoint
+    return 1000.0 - 2 * (focus + 140) ** 2 - 0.1 * (second_dispersion - 36000) ** 2 - 0.01 * (third_dispersion + 27500) ** 2
+
+def run(engine, frames):
+    for _ in range(frames):
+        engine.process_image_count('frame.tiff', simulated_count(engine.optimizer.current_setpoint()))
+
+def test_records_are_memory_mapped_and_a_cut_record_is_dropped(tmp_path):
+    path = str(tmp_path / 'run_journal.bin')
+    journal = RunJournal(path, {'optimizer_mode': 'gradient'})
+    journal.append_frame(1, 0, 100.0, [1, 2, 3])
+    journal.append_frame(2, 0, 110.0, [1, 2, 3])
+    journal.append_group(2, 1, 110.0, [1, 2, 3], [2, 3, 4], [True, True, True])
+    journal.close()
+
+    header, records = read_journal(path)
+    assert header == {'optimizer_mode': 'gradient'}
+    assert isinstance(records, np.memmap)
+    assert records.dtype == JOURNAL_DTYPE
+    assert list(records['kind']) == [FRAME_RECORD, FRAME_RECORD, GROUP_RECORD]
+    assert list(records['count']) == [100.0, 110.0, 110.0]
+    assert list(records['next_setpoint'][2]) == [2, 3, 4]
+    assert np.isnan(records['derivatives'][2]).all()
+    del records
+
+    # a crash in the middle of a record leaves a partial one at the end
+    with open(path, 'ab') as file:
+        file.write(b'\0' * (JOURNAL_DTYPE.itemsize // 2))
+    assert len(read_journal(path)[1]) == 3
+
+    journal = RunJournal(path)
+    journal.append_frame(3, 1, 120.0, [2, 3, 4])
+    journal.close()
+    _, records = read_journal(path)
+    assert list(records['count']) == [100.0, 110.0, 110.0, 120.0]
+
+@pytest.mark.parametrize('gradient_estimator', ['finite_difference', 'least_squares'])
+def test_resumed_gradient_run_continues_like_the_original(tmp_path, gradient_estimator):
+    (tmp_path / 'original').mkdir()
+    original = make_engine(tmp_path / 'original', gradient_estimator=gradient_estimator)
+    original.journal = RunJournal(original.JOURNAL_PATH, journal_header(original.optimizer))
+
+    # eleven frames, the last one is part of the image group still being collected
+    run(original, 11)
+    original.journal.close()
+    original.journal = None
+
+    (tmp_path / 'resumed').mkdir()
+    resumed = make_engine(tmp_path / 'resumed', gradient_estimator=gradient_estimator)
+    resumed.optimizer.random_direction = [-1, -1, -1, -1]
+    header, records = read_journal(original.JOURNAL_PATH)
+    restore_optimizer(resumed.optimizer, header, records)
+
+    for name in ['count_history', 'focus_history', 'second_dispersion_history', 'third_dispersion_history', 'focus_der_history', 'total_gradient_history', 'iteration_data', 'der_iteration_data']:
+        np.testing.assert_array_equal(getattr(resumed.optimizer, name), getattr(original.optimizer, name))
+    assert resumed.optimizer.random_direction == original.optimizer.random_direction
+    assert resumed.optimizer.current_setpoint() == original.optimizer.current_setpoint()
+    assert resumed.optimizer.images_processed == 11
+    assert resumed.optimizer.image_group_count_sum == original.optimizer.image_group_count_sum
+
+    run(original, 9)
+    run(resumed, 9)
+    np.testing.assert_allclose(resumed.optimizer.count_history, original.optimizer.count_history)
+    assert resumed.optimizer.current_setpoint() == original.optimizer.current_setpoint()
+
+@pytest.mark.parametrize('optimizer_mode', ['spsa', 'bayesian'])
+def test_resume_rebuilds_the_model_of_the_optimizer_mode(tmp_path, optimizer_mode):
+    original = make_engine(tmp_path, optimizer_mode=optimizer_mode)
+    original.journal = RunJournal(original.JOURNAL_PATH, journal_header(original.optimizer))
+    run(original, 12)
+    original.journal.close()
+    original.journal = None
+
+    resumed = make_engine(tmp_path)
+    header, records = read_journal(original.JOURNAL_PATH)
+    restore_optimizer(resumed.optimizer, header, records)
+
+    assert resumed.optimizer.optimizer_mode == optimizer_mode
+    np.testing.assert_array_equal(resumed.optimizer.count_history, original.optimizer.count_history)
+    if optimizer_mode == 'spsa':
+        np.testing.assert_array_equal(resumed.optimizer.spsa.theta, original.optimizer.spsa.theta)
+        assert resumed.optimizer.spsa.k == original.optimizer.spsa.k
+        np.testing.assert_array_equal(resumed.optimizer.spsa.recent_gradients, original.optimizer.spsa.recent_gradients)
+        assert resumed.optimizer.spsa.recent_counts == original.optimizer.spsa.recent_counts
+    else:
+        assert resumed.optimizer.gaussian_process.best_count() == original.optimizer.gaussian_process.best_count()
+        n = original.optimizer.gaussian_process.n
+        np.testing.assert_allclose(resumed.optimizer.gaussian_process.L_inv[:n, :n], original.optimizer.gaussian_process.L_inv[:n, :n], atol=1e-9)
+
+    # the resumed run goes on from the journal
+    run(resumed, 4)
+    assert resumed.optimizer.image_groups_processed == 8
+
+def test_engine_resumes_from_its_journal(tmp_path):
+    engine = make_engine(tmp_path)
+    engine.journal = RunJournal(engine.JOURNAL_PATH, journal_header(engine.optimizer))
+    run(engine, 6)
+    engine.journal.close()
+    engine.journal = None
+    setpoint = engine.optimizer.current_setpoint()
+
+    # the parameter files are back at the initial values
+    resumed = make_engine(tmp_path)
+    resumed.resume_run = True
+    resumed.IMG_PATH = str(tmp_path)
+    resumed.start()
+    resumed.stop()
+
+    assert resumed.optimizer.image_groups_processed == 3
+    assert (tmp_path / 'dm_parameters.txt').read_text() == f'{setpoint[0]} 0 0'
+    assert 'resume' in resumed.timer.percentiles()
+
+def test_journal_of_every_actuator(tmp_path):
+    engine = make_engine(tmp_path)
+    engine.optimizer = BetatronOptimizer(engine.mirror_values, engine.dispersion_values, mirror_actuators=range(3))
+    engine.optimizer.optimizer_mode = 'spsa'
+    engine.optimizer.random_seed = 3
+    engine.journal = RunJournal(engine.JOURNAL_PATH, journal_header(engine.optimizer))
+    for _ in range(12):
+        setpoint = engine.optimizer.current_setpoint()
+        engine.process_image_count('frame.tiff', simulated_count([setpoint[0], *setpoint[-2:]]))
+    engine.journal.close()
+    engine.journal = None
+
+    header, records = read_journal(engine.JOURNAL_PATH)
+    assert header['parameter_names'] == ['focus', 'actuator_1', 'actuator_2', 'second_dispersion', 'third_dispersion']
+    assert records['setpoint'].shape == (18, 5)
+
+    resumed = BetatronOptimizer(*write_parameter_files(tmp_path), mirror_actuators=range(3))
+    restore_optimizer(resumed, header, records)
+    np.testing.assert_array_equal(resumed.setpoint_history.values(), engine.optimizer.setpoint_history.values())
+    np.testing.assert_array_equal(resumed.spsa.theta, engine.optimizer.spsa.theta)
+
+    # a journal of other parameters can not be resumed
+    with pytest.raises(ValueError):
+        restore_optimizer(BetatronOptimizer(*write_parameter_files(tmp_path)), header, records)
+
+def test_local_fit_of_every_actuator_is_restored_over_its_window(tmp_path):
+    mirror_values, dispersion_values = [-150] + [0] * 11, [36100, -27000]
+    optimizer = BetatronOptimizer(mirror_values, dispersion_values, mirror_actuators=range(12))
+    optimizer.gradient_estimator = 'least_squares'
+    journal = RunJournal(str(tmp_path / 'run_journal.bin'), journal_header(optimizer))
+    for shot in range(1, 49):
+        setpoint = optimizer.current_setpoint()
+        count = simulated_count([setpoint[0], *setpoint[-2:]])
+        journal.append_frame(shot, optimizer.image_groups_processed, count, setpoint)
+        if optimizer.add_image_count(count):
+            journal.append_group(shot, optimizer.image_groups_processed, count, setpoint, optimizer.current_setpoint(), optimizer.moved)
+    journal.close()
+
+    # 14 parameters, the linear fit has 15 coefficients and a window of 17 image groups
+    assert optimizer.local_fit.window == 17
+    resumed = BetatronOptimizer([-150] + [0] * 11, [36100, -27000], mirror_actuators=range(12))
+    restore_optimizer(resumed, *read_journal(str(tmp_path / 'run_journal.bin')))
+    assert len(resumed.local_fit.rows) == 17
+    np.testing.assert_allclose(resumed.local_fit.gradient(resumed.setpoint), optimizer.local_fit.gradient(optimizer.setpoint))
+
+def test_restored_cache_only_holds_the_frames_that_were_counted(tmp_path):
+    engine = make_engine(tmp_path)
+    engine.optimizer.image_group = 4
+    engine.optimizer.learning_rates[:] = 0
+    engine.journal = RunJournal(engine.JOURNAL_PATH, journal_header(engine.optimizer))
+
+    # the second frame of the first group misfired and is left out of its count
+    for count in (1500.0, 1000.0, 1510.0, 1490.0, 1300.0, 1310.0, 1290.0, 1305.0):
+        engine.process_image_count('frame.tiff', count)
+    engine.journal.close()
+    engine.journal = None
+    assert engine.optimizer.rejected_shots == 1
+
+    header, records = read_journal(engine.JOURNAL_PATH)
+    assert records['kept_frames'][records['kind'] == GROUP_RECORD].tolist() == [0b1101, 0b1111]
+
+    resumed = make_engine(tmp_path)
+    restore_optimizer(resumed.optimizer, header, records)
+    initial = resumed.optimizer.initial_setpoint
+    shots, mean, _ = resumed.optimizer.measurement_cache.get(initial)
+    assert (shots, mean) == engine.optimizer.measurement_cache.get(initial)[:2] == (3, 1500.0)
+
+def test_settings_and_reference_frames_are_restored(tmp_path, capsys):
+    engine = make_engine(tmp_path, optimizer_mode='spsa')
+    engine.optimizer.group_estimator = 'trimmed_mean'
+    engine.optimizer.fit_window = 14
+    engine.optimizer.count_change_tolerance = 25
+    engine.optimizer.spsa_gain = 2e-4
+    engine.optimizer.spsa_c = np.array([3, 30, 60])
+    engine.optimizer.gp_acquisition = 'ucb'
+    engine.journal = RunJournal(engine.JOURNAL_PATH, journal_header(engine.optimizer))
+    for frame in range(11):
+        setpoint = engine.optimizer.current_setpoint()
+        engine.process_image_count('frame.tiff', simulated_count(setpoint), (100.0 + frame, 5.0))
+    engine.journal.close()
+    engine.journal = None
+
+    header, records = read_journal(engine.JOURNAL_PATH)
+    assert header['version'] == JOURNAL_VERSION == 3
+    assert records['quality'][records['kind'] == FRAME_RECORD][-1].tolist() == [110.0, 5.0]
+
+    resumed = make_engine(tmp_path)
+    assert [name for name, _, _ in changed_settings(header, resumed.optimizer)] == ['optimizer_mode', 'group_estimator', 'count_change_tolerance', 'fit_window', 'spsa_gain', 'spsa_c', 'gp_acquisition']
+    restore_optimizer(resumed.optimizer, header, records)
+    assert changed_settings(header, resumed.optimizer) == []
+    assert resumed.optimizer.group_estimator == 'trimmed_mean'
+    assert resumed.optimizer.local_fit.window == 14
+    np.testing.assert_array_equal(resumed.optimizer.spsa.c, [3, 30, 60])
+
+    # the reference frames of the small image groups and the frame of the group being collected keep their quality
+    assert len(resumed.optimizer.recent_frames) == 10 and resumed.optimizer.recent_frames == engine.optimizer.recent_frames
+    assert resumed.optimizer.group_quality == [[110.0, 5.0]]
+
+    # the engine says which settings of the command line the resumed run does not use
+    resumed = make_engine(tmp_path)
+    resumed.resume_run = True
+    resumed.IMG_PATH = str(tmp_path)
+    resumed.start()
+    resumed.stop()
+    assert 'Warning: the journal was written with optimizer_mode spsa, the resumed run keeps it in place of gradient' in capsys.readouterr().out
+
+def test_a_journal_of_a_newer_version_is_not_resumed(tmp_path):
+    path = str(tmp_path / 'run_journal.bin')
+    optimizer = make_engine(tmp_path).optimizer
+    RunJournal(path, {**journal_header(optimizer), 'version': JOURNAL_VERSION + 1}).close()
+    with pytest.raises(ValueError):
+        restore_optimizer(optimizer, *read_journal(path))
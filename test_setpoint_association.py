@@ -0,0 +1,67 @@
+import os
+import time
+import struct
+
+from setpoint_association import ActuationLog, acquisition_time, tiff_datetime
+
+def write_tiff_with_datetime(path, datetime_text, subseconds=None):
+    # 1x1 16 bit little endian tiff with DateTime (and SubSecTime) in the first image directory
+    entries = [(256, 3, 1, 1), (257, 3, 1, 1), (258, 3, 1, 16)]
+    values = [(306, datetime_text.encode() + b'\0')]
+    if subseconds is not None:
+        values.append((37520, subseconds.encode() + b'\0'))
+
+    entry_count = len(entries) + len(values) + 1
+    data_offset = 8 + 2 + 12 * entry_count + 4
+    blobs = b''
+    ascii_entries = []
+    for tag, value in values:
+        if len(value) <= 4:
+            ascii_entries.append(struct.pack('<HHI', tag, 2, len(value)) + value.ljust(4, b'\0'))
+        else:
+            ascii_entries.append(struct.pack('<HHII', tag, 2, len(value), data_offset + len(blobs)))
+            blobs += value
+    strip_offset = data_offset + len(blobs)
+
+    with open(path, 'wb') as file:
+        file.write(b'II' + struct.pack('<HI', 42, 8))
+        file.write(struct.pack('<H', entry_count))
+        for tag, field_type, count, value in entries:
+            file.write(struct.pack('<HHIHH', tag, field_type, count, value, 0))
+        for entry in ascii_entries:
+            file.write(entry)
+        file.write(struct.pack('<HHII', 273, 4, 1, strip_offset))
+        file.write(struct.pack('<I', 0))
+        file.write(blobs)
+        file.write(b'\0\0')
+
+def test_tiff_datetime_with_subseconds(tmp_path):
+    path = str(tmp_path / 'frame.tiff')
+    write_tiff_with_datetime(path, '2024:03:05 14:07:09', '25')
+
+    expected = time.mktime(time.strptime('2024:03:05 14:07:09', '%Y:%m:%d %H:%M:%S')) + 0.25
+    assert tiff_datetime(path) == expected
+    assert acquisition_time(path, 'tiff') == expected
+
+def test_acquisition_time_falls_back_to_the_file_time(tmp_path):
+    path = str(tmp_path / 'frame.tiff')
+    with open(path, 'wb') as file:
+        file.write(b'not a tiff')
+    os.utime(path, (1000.0, 1234.5))
+
+    assert acquisition_time(path, 'tiff') == 1234.5
+    assert acquisition_time(path) == 1234.5
+
+def test_frames_match_the_settled_setpoint(tmp_path):
+    log = ActuationLog(settle_delay=0.5, log_path=str(tmp_path / 'actuation_log.csv'))
+    log.record(0, (-150, 36100, -27000), applied_time=0.0)
+    log.record(1, (-149, 36101, -26999), applied_time=10.0)
+    log.record(3, (-148, 36102, -26998), applied_time=20.0)
+
+    assert log.generation_at(9.9) == 0
+    assert log.generation_at(10.2) is None
+    assert log.generation_at(10.5) == 1
+    assert log.generation_at(25.0) == 3
+    assert log.last_generation() == 3
+
+    assert (tmp_path / 'actuation_log.csv').read_text().splitlines()[1] == '10.000000,1,-149,36101,-26999'
@@ -0,0 +1,54 @@
+import numpy as np
+
+from spsa_optimizer import SPSAOptimizer
+
+def count_function(setpoint):
+    focus, second_dispersion, third_dispersion = setpoint
+    return 3e6 - ((focus + 10) ** 2 + (second_dispersion - 42) ** 2 + (third_dispersion - 70) ** 2)
+
+def test_spsa_finds_the_peak_with_integer_setpoints():
+    rng = np.random.default_rng(1)
+    spsa = SPSAOptimizer([0, 0, 0], [-100, -200, -200], [100, 200, 200], a=0.5, c=2, seed=1)
+
+    for _ in range(200):
+        setpoint = spsa.ask()
+        assert setpoint.dtype.kind == 'i'
+        spsa.tell(count_function(setpoint) + rng.normal(0, 5))
+
+    assert np.all(np.abs(spsa.setpoint() - [-10, 42, 70]) <= 2)
+
+def test_two_measurements_per_gradient_and_bounds():
+    spsa = SPSAOptimizer([0, 0], [-1, -1], [1, 1], a=100, c=5, seed=0)
+
+    plus = spsa.ask()
+    assert spsa.tell(1.0) is None
+    minus = spsa.ask()
+    gradient = spsa.tell(0.0)
+
+    assert gradient is not None and gradient.shape == (2,)
+    assert np.all(np.abs(plus) <= 1) and np.all(np.abs(minus) <= 1)
+    assert np.all(np.abs(spsa.setpoint()) <= 1)
+
+def tell_pair(spsa, count_function, rng):
+    spsa.tell(count_function(spsa.ask()) + rng.normal(0, 20))
+    return spsa.tell(count_function(spsa.ask()) + rng.normal(0, 20))
+
+def test_convergence_waits_for_the_gradient_to_sink_into_the_noise():
+    rng = np.random.default_rng(0)
+
+    # far from the peak every estimate points the same way, a gain too small to move the setpoint does not converge
+    spsa = SPSAOptimizer([-80, 150, 150], [-100, -200, -200], [100, 200, 200], a=1e-6, c=2, seed=0)
+    for _ in range(20):
+        tell_pair(spsa, count_function, rng)
+    assert np.all(spsa.setpoint() == [-80, 150, 150])
+    assert spsa.count_stopped_improving(8)
+    assert not spsa.gradient_is_within_noise(8)
+    assert not spsa.has_converged(8)
+
+    # at the peak the estimates scatter around zero
+    spsa = SPSAOptimizer([-10, 42, 70], [-100, -200, -200], [100, 200, 200], a=1e-6, c=2, seed=0)
+    for _ in range(7):
+        tell_pair(spsa, count_function, rng)
+    assert not spsa.has_converged(8)
+    tell_pair(spsa, count_function, rng)
+    assert spsa.has_converged(8)
@@ -0,0 +1,60 @@
+import csv
+import json
+import time
+import threading
+
+import numpy as np
+
+from stage_timing import StageTimer, SamplingProfiler
+
+def test_rolling_percentiles_use_the_last_window():
+    timer = StageTimer(window=100)
+    for duration in np.linspace(0.001, 0.1, 100):
+        timer.record('old', duration)
+        timer.record('imread', 1.0)
+    for duration in np.linspace(0.001, 0.1, 100):
+        timer.record('imread', duration)
+
+    summary = timer.percentiles()
+    assert summary['imread']['count'] == 200
+    assert abs(summary['imread']['p50_ms'] - 50.5) < 0.1
+    assert summary['imread']['max_ms'] == 100.0
+    assert abs(summary['imread']['p99_ms'] - summary['old']['p99_ms']) < 1e-9
+
+def test_trace_export(tmp_path):
+    timer = StageTimer(trace_maxlen=10)
+    for _ in range(3):
+        with timer.time('median_blur'):
+            time.sleep(0.001)
+
+    timer.export(str(tmp_path / 'trace.csv'))
+    rows = list(csv.DictReader(open(tmp_path / 'trace.csv')))
+    assert [row['stage'] for row in rows] == ['median_blur'] * 3
+    assert all(float(row['duration_ms']) >= 1.0 for row in rows)
+
+    timer.export(str(tmp_path / 'trace.json'))
+    trace = json.load(open(tmp_path / 'trace.json'))
+    assert len(trace['traceEvents']) == 3
+    assert trace['traceEvents'][0]['ph'] == 'X'
+    assert trace['summary']['median_blur']['count'] == 3
+
+def test_sampling_profiler_sees_the_busy_thread(tmp_path):
+    stop = threading.Event()
+
+    def busy_reduction():
+        while not stop.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=busy_reduction, name='frame_pool_0')
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    thread.start()
+    time.sleep(0.1)
+    stop.set()
+    thread.join()
+    profiler.stop()
+    profiler.write(str(tmp_path / 'stacks.txt'))
+
+    lines = (tmp_path / 'stacks.txt').read_text().splitlines()
+    assert profiler.samples > 0
+    assert any(line.startswith('frame_pool_0;') and 'busy_reduction' in line for line in lines)
@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+from frame_processing import calc_count_per_image
+from tiff_reader import apply_to_mapped_tiff, scratch_buffer
+
+def write_frame(path, frame, compression=1):
+    cv2.imwrite(str(path), frame, [cv2.IMWRITE_TIFF_COMPRESSION, compression])
+    return str(path)
+
+def test_uncompressed_frame_is_mapped_without_a_copy(tmp_path):
+    frame = np.random.default_rng(0).integers(0, 4096, (120, 160), dtype=np.uint16)
+    path = write_frame(tmp_path / 'frame.tiff', frame)
+
+    def check(pixels):
+        assert not pixels.flags.writeable
+        assert not pixels.flags.owndata
+        return pixels.copy()
+
+    assert np.array_equal(apply_to_mapped_tiff(path, check), frame)
+
+def test_same_count_as_cv2_for_mapped_and_compressed_frames(tmp_path):
+    frame = np.random.default_rng(1).integers(0, 4096, (120, 160), dtype=np.uint16)
+    expected = cv2.medianBlur(frame, 5).mean()
+
+    uncompressed = write_frame(tmp_path / 'uncompressed.tiff', frame)
+    compressed = write_frame(tmp_path / 'compressed.tiff', frame, compression=5)
+
+    # lzw frames are left to cv2
+    assert apply_to_mapped_tiff(compressed, lambda pixels: 1) is None
+    assert calc_count_per_image(uncompressed) == expected
+    assert calc_count_per_image(compressed) == expected
+
+def test_big_endian_frame(tmp_path):
+    frame = np.random.default_rng(2).integers(0, 4096, (8, 10), dtype=np.uint16)
+    path = str(tmp_path / 'big_endian.tiff')
+
+    # minimal big endian tiff: header, one directory with the tags the reader needs, then the pixels
+    entries = [(256, 3, 10), (257, 3, 8), (258, 3, 16), (259, 3, 1), (273, 4, 8 + 2 + 7 * 12 + 4), (277, 3, 1), (279, 4, frame.nbytes)]
+    with open(path, 'wb') as file:
+        file.write(b'MM\x00\x2a\x00\x00\x00\x08')
+        file.write(len(entries).to_bytes(2, 'big'))
+        for tag, field_type, value in entries[:6]:
+            file.write(tag.to_bytes(2, 'big') + field_type.to_bytes(2, 'big') + (1).to_bytes(4, 'big'))
+            file.write(value.to_bytes(2, 'big') + b'\x00\x00' if field_type == 3 else value.to_bytes(4, 'big'))
+        tag, field_type, value = entries[6]
+        file.write(tag.to_bytes(2, 'big') + field_type.to_bytes(2, 'big') + (1).to_bytes(4, 'big') + value.to_bytes(4, 'big'))
+        file.write(b'\x00\x00\x00\x00')
+        file.write(frame.astype('>u2').tobytes())
+
+    assert np.array_equal(apply_to_mapped_tiff(path, lambda pixels: pixels.copy()), frame)
+
+def test_scratch_buffers_are_reused(tmp_path):
+    frame = np.random.default_rng(3).integers(0, 4096, (64, 64), dtype=np.uint16)
+    path = write_frame(tmp_path / 'frame.tiff', frame)
+
+    calc_count_per_image(path)
+    buffer = scratch_buffer('blur', frame.shape, frame.dtype)
+    calc_count_per_image(path)
+    assert scratch_buffer('blur', frame.shape, frame.dtype) is buffer
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+
+from write_completion import WriteCompletionTracker, tiff_is_complete
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def tiff_bytes(tmp_path, seed=0):
+    path = str(tmp_path / 'encoded.tiff')
+    cv2.imwrite(path, np.random.default_rng(seed).integers(0, 4000, (32, 40), dtype=np.uint16))
+    with open(path, 'rb') as file:
+        return file.read()
+
+def test_tiff_is_complete(tmp_path):
+    data = tiff_bytes(tmp_path)
+    path = tmp_path / 'frame.tiff'
+
+    path.write_bytes(data[:len(data) // 2])
+    assert tiff_is_complete(str(path)) is False
+    path.write_bytes(data)
+    assert tiff_is_complete(str(path)) is True
+
+    (tmp_path / 'frame.raw').write_bytes(b'\0' * 100)
+    assert tiff_is_complete(str(tmp_path / 'frame.raw')) is None
+
+def test_events_are_coalesced_and_each_frame_is_dispatched_once(tmp_path):
+    clock = FakeClock()
+    tracker = WriteCompletionTracker(None, clock=clock)
+    data = tiff_bytes(tmp_path)
+
+    # a burst of events for two frames, one still being written
+    first, second = str(tmp_path / 'a.tiff'), str(tmp_path / 'b.tiff')
+    with open(first, 'wb') as file:
+        file.write(data)
+    with open(second, 'wb') as file:
+        file.write(data[:100])
+    for path in [first, second, first, second, first]:
+        tracker.touch(path)
+    assert tracker.poll() == [first]
+
+    with open(second, 'ab') as file:
+        file.write(data[100:])
+    tracker.touch(second)
+    tracker.touch(first)
+    assert tracker.poll() == [second]
+    assert tracker.poll() == []
+    assert tracker.duplicate_events == 1
+
+def test_files_without_a_trailer_wait_for_a_stable_size_or_their_close(tmp_path):
+    clock = FakeClock()
+    tracker = WriteCompletionTracker(None, settle_time=0.05, clock=clock)
+    raw, closed = str(tmp_path / 'frame.raw'), str(tmp_path / 'closed.raw')
+    (tmp_path / 'frame.raw').write_bytes(b'\0' * 100)
+    (tmp_path / 'closed.raw').write_bytes(b'\0' * 100)
+
+    tracker.touch(raw)
+    tracker.touch(closed, closed=True)
+    assert tracker.poll() == [closed]
+
+    clock.now = 0.03
+    (tmp_path / 'frame.raw').write_bytes(b'\0' * 200)
+    assert tracker.poll() == []
+    clock.now = 0.06
+    assert tracker.poll() == []
+    clock.now = 0.09
+    assert tracker.poll() == [raw]
+
+    # a deleted frame and a new one with the same name
+    tracker.forget(raw)
+    tracker.touch(raw, closed=True)
+    assert tracker.poll() == [raw]
@@ -0,0 +1,142 @@
+import sys
+import mmap
+import time
+import struct
+import argparse
+import threading
+import tracemalloc
+
+import numpy as np
+
+# tiff field types we need to read (SHORT and LONG) as struct codes and sizes
+TIFF_FIELD_TYPES = {3: ('H', 2), 4: ('I', 4)}
+
+TIFF_IMAGE_WIDTH = 256
+TIFF_IMAGE_LENGTH = 257
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_COMPRESSION = 259
+TIFF_STRIP_OFFSETS = 273
+TIFF_SAMPLES_PER_PIXEL = 277
+TIFF_STRIP_BYTE_COUNTS = 279
+TIFF_SAMPLE_FORMAT = 339
+
+# filtering buffers reused from frame to frame, one set per worker thread (frames of a run all have the same size)
+scratch = threading.local()
+
+def scratch_buffer(name, shape, dtype):
+    buffers = scratch.__dict__.setdefault('buffers', {})
+    key = (name, shape, np.dtype(dtype))
+    buffer = buffers.get(key)
+    if buffer is None:
+        buffer = buffers[key] = np.empty(shape, dtype=dtype)
+    return buffer
+
+def tiff_tags(buffer):
+    # byte order and the numeric tags of the first image directory, None for anything but a classic tiff (bigtiff, other formats)
+    byte_order = {b'II': '<', b'MM': '>'}.get(bytes(buffer[:2]))
+    if byte_order is None or len(buffer) < 8:
+        return None
+    magic, ifd_offset = struct.unpack_from(byte_order + 'HI', buffer, 2)
+    if magic != 42:
+        return None
+
+    (entry_count,) = struct.unpack_from(byte_order + 'H', buffer, ifd_offset)
+    tags = {}
+    for index in range(entry_count):
+        entry_offset = ifd_offset + 2 + 12 * index
+        tag, field_type, value_count = struct.unpack_from(byte_order + 'HHI', buffer, entry_offset)
+        if field_type not in TIFF_FIELD_TYPES:
+            continue
+
+        # values that fit in 4 bytes are stored in the entry itself
+        code, size = TIFF_FIELD_TYPES[field_type]
+        if value_count * size <= 4:
+            value_offset = entry_offset + 8
+        else:
+            (value_offset,) = struct.unpack_from(byte_order + 'I', buffer, entry_offset + 8)
+        tags[tag] = struct.unpack_from(byte_order + code * value_count, buffer, value_offset)
+    return byte_order, tags
+
+def map_tiff_pixels(buffer):
+    # the pixels of an uncompressed single channel 8/16 bit tiff as a read-only view into the buffer (no copy),
+    # None for anything else (compressed, multi channel, strips that are not back to back), which is left to cv2
+    layout = tiff_tags(buffer)
+    if layout is None:
+        return None
+    byte_order, tags = layout
+    if tags.get(TIFF_COMPRESSION, (1,))[0] != 1 or tags.get(TIFF_SAMPLES_PER_PIXEL, (1,))[0] != 1 or tags.get(TIFF_SAMPLE_FORMAT, (1,))[0] != 1:
+        return None
+
+    bits = tags.get(TIFF_BITS_PER_SAMPLE, (1,))[0]
+    if bits not in (8, 16):
+        return None
+
+    width = tags[TIFF_IMAGE_WIDTH][0]
+    height = tags[TIFF_IMAGE_LENGTH][0]
+    offsets = tags[TIFF_STRIP_OFFSETS]
+    byte_counts = tags[TIFF_STRIP_BYTE_COUNTS]
+    if any(offset + byte_count != next_offset for offset, byte_count, next_offset in zip(offsets, byte_counts, offsets[1:])):
+        return None
+
+    dtype = np.dtype(np.uint8) if bits == 8 else np.dtype(byte_order + 'u2')
+    size = width * height * dtype.itemsize
+    if sum(byte_counts) < size or offsets[0] + size > len(buffer):
+        raise ValueError('truncated tiff')
+
+    return np.frombuffer(buffer, dtype=dtype, count=width * height, offset=offsets[0]).reshape(height, width)
+
+def apply_to_mapped_tiff(image_path, function):
+    # function(pixels) on the memory mapped frame, None when the file has to be decoded by cv2 instead.
+    # the mapping is released with the last view on it, right after function returns
+    with open(image_path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    pixels = map_tiff_pixels(buffer)
+    if pixels is None:
+        return None
+
+    # cv2 only works on native byte order, big endian frames are swapped into a scratch buffer
+    if not pixels.dtype.isnative:
+        native = scratch_buffer('native', pixels.shape, pixels.dtype.newbyteorder('='))
+        native[...] = pixels
+        pixels = native
+
+    return function(pixels)
+
+# decode time and allocations of the cv2 reduction against the memory mapped one
+def main(argv=None):
+    import cv2
+    from frame_processing import calc_count_per_image
+
+    parser = argparse.ArgumentParser(description='Compare cv2.imread with the memory mapped tiff reader')
+    parser.add_argument('images', nargs='*', help='tiff frames (a synthetic 16 bit frame when empty)')
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    images = args.images
+    if not images:
+        images = ['benchmark_frame.tiff']
+        frame = np.random.default_rng(0).integers(0, 4096, (1024, 1280), dtype=np.uint16)
+        cv2.imwrite(images[0], frame, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+
+    def imread_reduction(image_path):
+        return cv2.medianBlur(cv2.imread(image_path, cv2.IMREAD_UNCHANGED | cv2.IMREAD_ANYDEPTH), 5).mean()
+
+    for name, reduce in (('cv2.imread', imread_reduction), ('memory mapped', calc_count_per_image)):
+        reduce(images[0])
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            for image_path in images:
+                reduce(image_path)
+        elapsed = (time.perf_counter() - start) / (args.repeats * len(images))
+
+        # numpy allocations per frame (cv2 allocates its output arrays through numpy)
+        tracemalloc.start()
+        reduce(images[0])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"{name:<14} {elapsed * 1e3:8.3f} ms per frame, {peak / 1e6:8.3f} MB allocated")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import os
+import mmap
+import time
+import struct
+import threading
+
+from tiff_reader import tiff_tags, TIFF_STRIP_OFFSETS, TIFF_STRIP_BYTE_COUNTS
+
+# True when the whole tiff is on disk (header, image directory and every strip), False while it is still being written,
+# None when the file is not a classic tiff and only its size can tell
+def tiff_is_complete(image_path):
+    try:
+        with open(image_path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < 8:
+                return False
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return False
+
+    with buffer:
+        if bytes(buffer[:2]) not in (b'II', b'MM'):
+            return None
+        try:
+            layout = tiff_tags(buffer)
+        except struct.error:
+            # the image directory (written after the pixels by most writers) is not there yet
+            return False
+        if layout is None:
+            return None
+
+        _, tags = layout
+        offsets = tags.get(TIFF_STRIP_OFFSETS)
+        byte_counts = tags.get(TIFF_STRIP_BYTE_COUNTS)
+        if not offsets or not byte_counts:
+            return False
+        return max(offset + byte_count for offset, byte_count in zip(offsets, byte_counts)) <= size
+
+# collects the file events of the image directory and hands every new image on exactly once, and only once it is completely
+# written: after its close-write event, once it is a complete tiff, or (for other files) once its size stopped changing for
+# settle_time. the events of a burst of frames are coalesced and dispatched together every interval seconds
+class WriteCompletionTracker:
+    def __init__(self, callback, interval=0.01, settle_time=0.05, max_wait=10.0, clock=time.monotonic):
+        # called with a list of complete image paths
+        self.callback = callback
+        self.interval = interval
+        self.settle_time = settle_time
+
+        # a file that is still not complete after max_wait seconds is dropped
+        self.max_wait = max_wait
+        self.clock = clock
+
+        # path -> [first event time, last size change time, last size, closed]
+        self.pending = {}
+        self.dispatched = set()
+        self.lock = threading.Lock()
+
+        self.dropped = 0
+        self.duplicate_events = 0
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def touch(self, path, closed=False):
+        # one event (created, modified, closed or moved in) for the path, from the file watcher thread
+        with self.lock:
+            if path in self.dispatched:
+                self.duplicate_events += 1
+                return
+            entry = self.pending.get(path)
+            if entry is None:
+                now = self.clock()
+                self.pending[path] = [now, now, -1, closed]
+            elif closed:
+                entry[3] = True
+
+    def forget(self, path):
+        # a deleted file, a new file with the same name is a new frame
+        with self.lock:
+            self.pending.pop(path, None)
+            self.dispatched.discard(path)
+
+    def poll(self):
+        # the pending files that are complete now, each one is returned once
+        now = self.clock()
+        with self.lock:
+            candidates = list(self.pending.items())
+
+        complete = []
+        dropped = []
+        for path, (first_seen, size_changed, last_size, closed) in candidates:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                # vanished before it was complete
+                dropped.append(path)
+                continue
+
+            if size != last_size:
+                size_changed = now
+                with self.lock:
+                    if path in self.pending:
+                        self.pending[path][1:3] = [now, size]
+
+            if closed:
+                done = size > 0
+            else:
+                done = tiff_is_complete(path)
+                if done is None:
+                    done = size > 0 and now - size_changed >= self.settle_time
+
+            if done:
+                complete.append(path)
+            elif now - first_seen > self.max_wait:
+                print(f"Error processing image {path}: not completely written after {self.max_wait:.0f} s")
+                dropped.append(path)
+
+        with self.lock:
+            for path in dropped:
+                if self.pending.pop(path, None) is not None:
+                    self.dropped += 1
+            complete = [path for path in complete if self.pending.pop(path, None) is not None]
+            self.dispatched.update(complete)
+        return complete
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            complete = self.poll()
+            if complete:
+                try:
+                    self.callback(complete)
+                except Exception as e:
+                    print(f"Error dispatching images: {e}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='write_completion', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def pending_count(self):
+        with self.lock:
+            return len(self.pending)